@@ -0,0 +1,515 @@
+"""
+Agent Caches
+
+Avoids recomputing work for repeated questions inside a warm container:
+1. QueryEmbeddingCache - LRU + TTL cache of query embeddings keyed on a normalized query
+2. SQLiteEmbeddingStore / DynamoDBEmbeddingStore - Optional persistent tier that survives cold starts
+3. SemanticAnswerCache - Replays answers for questions close to one already answered
+4. InMemoryAnswerStore / DynamoDBAnswerStore - Backing stores for the answer cache
+"""
+
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize a user query so trivially different spellings share a cache entry.
+
+    - Unicode NFKC + lowercase
+    - Collapse whitespace
+    - Drop trailing punctuation ("What is PMF?" == "what is pmf")
+    """
+    text = unicodedata.normalize("NFKC", query or "").lower()
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.rstrip("?!. ")
+
+
+class SQLiteEmbeddingStore:
+    """
+    Persistent tier backed by a local SQLite file.
+
+    Point the path at durable storage (e.g. an EFS mount) for the cache to
+    survive cold starts -- /tmp only lives as long as the container.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS query_embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str, now: float) -> Optional[np.ndarray]:
+        row = self._conn.execute(
+            "SELECT vector, expires_at FROM query_embeddings WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or row[1] <= now:
+            return None
+        return np.frombuffer(row[0], dtype=np.float32)
+
+    def put(self, key: str, vector: np.ndarray, expires_at: float) -> None:
+        self._conn.execute(
+            "INSERT OR REPLACE INTO query_embeddings (key, vector, expires_at) VALUES (?, ?, ?)",
+            (key, vector.astype(np.float32).tobytes(), expires_at)
+        )
+        self._conn.commit()
+
+
+class DynamoDBEmbeddingStore:
+    """
+    Persistent tier backed by a DynamoDB table (partition key "key").
+
+    Set endpoint_url to use DynamoDB Local. Items carry an "expires_at" epoch
+    attribute so the table's TTL setting can clean them up.
+    """
+
+    def __init__(self, table_name: str, endpoint_url: Optional[str] = None):
+        import boto3
+
+        self.table = boto3.resource("dynamodb", endpoint_url=endpoint_url).Table(table_name)
+
+    def get(self, key: str, now: float) -> Optional[np.ndarray]:
+        item = self.table.get_item(Key={"key": key}).get("Item")
+        if not item or int(item["expires_at"]) <= now:
+            return None
+        return np.frombuffer(bytes(item["vector"]), dtype=np.float32)
+
+    def put(self, key: str, vector: np.ndarray, expires_at: float) -> None:
+        self.table.put_item(Item={
+            "key": key,
+            "vector": vector.astype(np.float32).tobytes(),
+            "expires_at": int(expires_at)
+        })
+
+
+class QueryEmbeddingCache:
+    """
+    LRU cache with TTL in front of model.encode().
+
+    Lookup order: in-memory LRU -> persistent store (optional) -> encode.
+    Keys are namespaced (e.g. by model name) so switching models never
+    returns vectors from a different embedding space.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl_seconds: float = 3600,
+        namespace: str = "",
+        store=None,
+        clock: Callable[[], float] = time.time
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.namespace = namespace
+        self.store = store
+        self.clock = clock
+
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.store_hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls, namespace: str = "") -> "QueryEmbeddingCache":
+        """
+        Configure from the Lambda environment:
+        EMBED_CACHE_SIZE, EMBED_CACHE_TTL, EMBED_CACHE_BACKEND ("sqlite" | "dynamodb"),
+        EMBED_CACHE_SQLITE_PATH, EMBED_CACHE_TABLE, DYNAMODB_ENDPOINT_URL
+        """
+        backend = os.environ.get("EMBED_CACHE_BACKEND", "").lower()
+        store = None
+
+        try:
+            if backend == "sqlite":
+                store = SQLiteEmbeddingStore(
+                    os.environ.get("EMBED_CACHE_SQLITE_PATH", "/tmp/query_embeddings.db")
+                )
+            elif backend == "dynamodb":
+                store = DynamoDBEmbeddingStore(
+                    os.environ["EMBED_CACHE_TABLE"],
+                    endpoint_url=os.environ.get("DYNAMODB_ENDPOINT_URL")
+                )
+        except Exception as e:
+            # The persistent tier is an optimisation, never a reason to fail a request
+            print(f"Embedding cache store disabled: {e}")
+            store = None
+
+        return cls(
+            max_entries=int(os.environ.get("EMBED_CACHE_SIZE", 1024)),
+            ttl_seconds=float(os.environ.get("EMBED_CACHE_TTL", 3600)),
+            namespace=namespace,
+            store=store
+        )
+
+    def _key(self, query: str) -> str:
+        return f"{self.namespace}:{normalize_query(query)}"
+
+    def get_or_compute(self, query: str, encode: Callable[[str], np.ndarray]) -> np.ndarray:
+        """Return the cached embedding for query, encoding it on a miss"""
+        key = self._key(query)
+        now = self.clock()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                vector, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return vector
+                del self._entries[key]
+
+        vector = None
+        if self.store is not None:
+            try:
+                vector = self.store.get(key, now)
+            except Exception as e:
+                print(f"Embedding cache store read failed: {e}")
+
+        if vector is not None:
+            self.store_hits += 1
+        else:
+            self.misses += 1
+            vector = np.asarray(encode(query), dtype=np.float32)
+            if self.store is not None:
+                try:
+                    self.store.put(key, vector, now + self.ttl_seconds)
+                except Exception as e:
+                    print(f"Embedding cache store write failed: {e}")
+
+        self._remember(key, vector, now + self.ttl_seconds)
+        return vector
+
+    def _remember(self, key: str, vector: np.ndarray, expires_at: float) -> None:
+        with self._lock:
+            self._entries[key] = (vector, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.store_hits + self.misses
+        return {
+            "hits": self.hits,
+            "store_hits": self.store_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.store_hits) / lookups, 3) if lookups else 0.0,
+            "size": len(self._entries)
+        }
+
+
+class InMemoryAnswerStore:
+    """Default answer store: entries live only as long as the container"""
+
+    def __init__(self):
+        self._entries: Dict[str, Dict[str, Any]] = {}
+
+    def load(self) -> List[Dict[str, Any]]:
+        return list(self._entries.values())
+
+    def put(self, entry: Dict[str, Any]) -> None:
+        self._entries[entry["answer_id"]] = entry
+
+    def delete(self, answer_id: str) -> None:
+        self._entries.pop(answer_id, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+class DynamoDBAnswerStore:
+    """
+    Answer store backed by a DynamoDB table (partition key "answer_id").
+
+    The whole table is loaded once per container, so keep it small
+    (it is bounded by the cache's max_entries).
+    """
+
+    def __init__(self, table_name: str, endpoint_url: Optional[str] = None):
+        import boto3
+
+        self.table = boto3.resource("dynamodb", endpoint_url=endpoint_url).Table(table_name)
+
+    def load(self) -> List[Dict[str, Any]]:
+        entries = []
+        kwargs = {}
+        while True:
+            page = self.table.scan(**kwargs)
+            for item in page.get("Items", []):
+                entries.append(json.loads(item["entry"]))
+            if "LastEvaluatedKey" not in page:
+                return entries
+            kwargs["ExclusiveStartKey"] = page["LastEvaluatedKey"]
+
+    def put(self, entry: Dict[str, Any]) -> None:
+        self.table.put_item(Item={
+            "answer_id": entry["answer_id"],
+            "entry": json.dumps(entry),
+            "expires_at": int(entry["expires_at"])
+        })
+
+    def delete(self, answer_id: str) -> None:
+        self.table.delete_item(Key={"answer_id": answer_id})
+
+    def clear(self) -> None:
+        with self.table.batch_writer() as batch:
+            for entry in self.load():
+                batch.delete_item(Key={"answer_id": entry["answer_id"]})
+
+
+class SemanticAnswerCache:
+    """
+    Vector-keyed cache of full answers.
+
+    A question whose embedding is within max_distance (cosine distance) of a
+    previously answered question gets the stored answer replayed, skipping
+    Qdrant retrieval and Bedrock generation.
+
+    - Index: pre-normalized float32 matrix, one row per entry, searched with a single matmul
+    - Eviction: least recently used row once max_entries is reached, plus TTL
+    - Invalidation: set_version() clears everything when the Qdrant collection changes
+    - Metrics: hits/misses and the Bedrock latency and cost the hits avoided
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 256,
+        max_distance: float = 0.05,
+        ttl_seconds: float = 86400,
+        store=None,
+        input_price_per_1k: float = 0.00006,
+        output_price_per_1k: float = 0.00024,
+        clock: Callable[[], float] = time.time
+    ):
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.ttl_seconds = ttl_seconds
+        self.store = store or InMemoryAnswerStore()
+        self.input_price_per_1k = input_price_per_1k
+        self.output_price_per_1k = output_price_per_1k
+        self.clock = clock
+
+        self.version: Optional[str] = None
+        self._lock = threading.Lock()
+        self._matrix: Optional[np.ndarray] = None
+        self._entries: List[Optional[Dict[str, Any]]] = []
+        self._last_used = np.zeros(max_entries, dtype=np.float64)
+
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self.saved_cost_usd = 0.0
+
+        try:
+            for entry in self.store.load():
+                self._insert(entry, persist=False)
+        except Exception as e:
+            print(f"Answer cache store load failed: {e}")
+
+    @classmethod
+    def from_env(cls) -> "SemanticAnswerCache":
+        """
+        Configure from the Lambda environment:
+        ANSWER_CACHE_SIZE, ANSWER_CACHE_MAX_DISTANCE, ANSWER_CACHE_TTL,
+        ANSWER_CACHE_BACKEND ("memory" | "dynamodb"), ANSWER_CACHE_TABLE,
+        BEDROCK_INPUT_PRICE_PER_1K, BEDROCK_OUTPUT_PRICE_PER_1K
+        """
+        store = None
+        if os.environ.get("ANSWER_CACHE_BACKEND", "memory").lower() == "dynamodb":
+            try:
+                store = DynamoDBAnswerStore(
+                    os.environ["ANSWER_CACHE_TABLE"],
+                    endpoint_url=os.environ.get("DYNAMODB_ENDPOINT_URL")
+                )
+            except Exception as e:
+                print(f"Answer cache store disabled: {e}")
+
+        return cls(
+            max_entries=int(os.environ.get("ANSWER_CACHE_SIZE", 256)),
+            max_distance=float(os.environ.get("ANSWER_CACHE_MAX_DISTANCE", 0.05)),
+            ttl_seconds=float(os.environ.get("ANSWER_CACHE_TTL", 86400)),
+            store=store,
+            input_price_per_1k=float(os.environ.get("BEDROCK_INPUT_PRICE_PER_1K", 0.00006)),
+            output_price_per_1k=float(os.environ.get("BEDROCK_OUTPUT_PRICE_PER_1K", 0.00024))
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def set_version(self, version: Optional[str]) -> None:
+        """
+        Invalidation hook: call with the current Qdrant collection version.
+        Answers built from an older collection are dropped.
+        """
+        if version is None or version == self.version:
+            return
+
+        if self.version is not None:
+            print(f"Answer cache invalidated: collection version {self.version} -> {version}")
+            self.invalidate()
+        else:
+            # First version seen by this container: drop persisted answers from an older collection
+            with self._lock:
+                for slot, entry in enumerate(self._entries):
+                    if entry is not None and entry.get("version") != version:
+                        self._remove(slot)
+
+        self.version = version
+
+    def invalidate(self) -> None:
+        """Drop every cached answer"""
+        with self._lock:
+            self._matrix = None
+            self._entries = []
+            self._last_used[:] = 0
+        try:
+            self.store.clear()
+        except Exception as e:
+            print(f"Answer cache store clear failed: {e}")
+
+    def lookup(self, vector: np.ndarray) -> Optional[Dict[str, Any]]:
+        """Return the closest cached answer within max_distance, or None"""
+        if not self.enabled:
+            return None
+
+        now = self.clock()
+        with self._lock:
+            if self._matrix is None or not self._entries:
+                self.misses += 1
+                return None
+
+            query = _normalize(vector)
+            sims = self._matrix[:len(self._entries)] @ query
+            # Empty, expired and other-version slots are masked before the argmax,
+            # so a valid runner-up still matches when the closest entry is unusable
+            usable = np.array([self._usable(entry, now) for entry in self._entries])
+            close = sims >= 1.0 - self.max_distance
+            for slot in np.flatnonzero(close & ~usable):
+                if self._entries[slot] is not None:
+                    self._remove(int(slot))
+
+            sims = np.where(usable, sims, -np.inf)
+            slot = int(np.argmax(sims))
+            entry = self._entries[slot]
+
+            if not usable[slot] or 1.0 - float(sims[slot]) > self.max_distance:
+                self.misses += 1
+                return None
+
+            self._last_used[slot] = now
+            self.hits += 1
+            self.saved_seconds += entry["generation_seconds"]
+            self.saved_cost_usd += self._cost(entry)
+            return entry
+
+    def add(
+        self,
+        query: str,
+        vector: np.ndarray,
+        answer: str,
+        evaluation: Optional[Dict[str, Any]],
+        generation_seconds: float = 0.0,
+        input_tokens: int = 0,
+        output_tokens: int = 0
+    ) -> None:
+        """Store a freshly generated answer (evaluation is None when the queue worker scores it)"""
+        if not self.enabled or not answer:
+            return
+
+        entry = {
+            "answer_id": str(uuid.uuid4()),
+            "query": query,
+            "vector": _normalize(vector).tolist(),
+            "answer": answer,
+            "evaluation": evaluation,
+            "version": self.version,
+            "generation_seconds": round(generation_seconds, 3),
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "expires_at": self.clock() + self.ttl_seconds
+        }
+        self._insert(entry, persist=True)
+
+    def _insert(self, entry: Dict[str, Any], persist: bool) -> None:
+        evicted = None
+        with self._lock:
+            vector = np.asarray(entry["vector"], dtype=np.float32)
+            if self._matrix is None:
+                self._matrix = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+
+            if None in self._entries:
+                slot = self._entries.index(None)
+            elif len(self._entries) < self.max_entries:
+                slot = len(self._entries)
+                self._entries.append(None)
+            else:
+                slot = int(np.argmin(self._last_used[:len(self._entries)]))
+                evicted = self._entries[slot]
+
+            self._matrix[slot] = vector
+            self._entries[slot] = entry
+            self._last_used[slot] = self.clock()
+
+        try:
+            if evicted is not None:
+                self.store.delete(evicted["answer_id"])
+            if persist:
+                self.store.put(entry)
+        except Exception as e:
+            print(f"Answer cache store write failed: {e}")
+
+    def _usable(self, entry: Optional[Dict[str, Any]], now: float) -> bool:
+        """Not expired and built from the current collection version"""
+        if entry is None or entry["expires_at"] <= now:
+            return False
+        return self.version is None or entry.get("version") == self.version
+
+    def _remove(self, slot: int) -> None:
+        entry = self._entries[slot]
+        self._entries[slot] = None
+        self._matrix[slot] = 0.0
+        self._last_used[slot] = 0
+        try:
+            self.store.delete(entry["answer_id"])
+        except Exception as e:
+            print(f"Answer cache store delete failed: {e}")
+
+    def _cost(self, entry: Dict[str, Any]) -> float:
+        return (
+            entry["input_tokens"] / 1000 * self.input_price_per_1k +
+            entry["output_tokens"] / 1000 * self.output_price_per_1k
+        )
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "size": sum(1 for e in self._entries if e is not None),
+            "saved_bedrock_seconds": round(self.saved_seconds, 2),
+            "saved_bedrock_cost_usd": round(self.saved_cost_usd, 6)
+        }
+
+
+def _normalize(vector: np.ndarray) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32).ravel()
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
@@ -0,0 +1,128 @@
+"""
+Pooled Network Clients
+
+Clients are built once per container and reused by every invocation:
+1. client_config - One botocore Config (connection pool, TCP keep-alive,
+   retries, timeouts) shared by the Bedrock, API Gateway and SQS clients
+2. get_apigw - apigatewaymanagementapi clients cached by (domain, stage), warm
+   invocations skip client creation, endpoint resolution and the TLS handshake
+3. qdrant_args - The same pool / keep-alive / retry settings for QdrantClient's
+   httpx connection
+4. timings - Setup vs use time per client, take() once per invocation
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Tuple
+
+_config = None
+_apigw_clients: Dict[Tuple[str, str], Any] = {}
+_lock = threading.Lock()
+
+
+def client_config():
+    """
+    botocore Config built from the Lambda environment:
+    CLIENT_MAX_POOL, CLIENT_RETRIES, CLIENT_RETRY_MODE, CLIENT_CONNECT_TIMEOUT, CLIENT_READ_TIMEOUT
+    """
+    global _config
+    if _config is None:
+        from botocore.config import Config
+
+        _config = Config(
+            # Frame sender and scorer threads post while the main thread reads Bedrock
+            max_pool_connections=int(os.environ.get("CLIENT_MAX_POOL", 10)),
+            tcp_keepalive=True,
+            retries={
+                "max_attempts": int(os.environ.get("CLIENT_RETRIES", 3)),
+                "mode": os.environ.get("CLIENT_RETRY_MODE", "standard")
+            },
+            connect_timeout=float(os.environ.get("CLIENT_CONNECT_TIMEOUT", 2)),
+            # Bedrock streams can pause between tokens, keep botocore's default
+            read_timeout=float(os.environ.get("CLIENT_READ_TIMEOUT", 60))
+        )
+    return _config
+
+
+class ClientTimings:
+    """
+    Thread-safe totals of client setup and call time (ms), per "name.phase".
+    take() returns what was recorded since the previous take(): on a warm
+    invocation no ".setup" entries show up.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals: Dict[str, Dict[str, float]] = {}
+
+    def record(self, name: str, ms: float) -> None:
+        with self._lock:
+            entry = self._totals.setdefault(name, {"count": 0, "ms": 0.0})
+            entry["count"] += 1
+            entry["ms"] += ms
+
+    @contextmanager
+    def track(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, (time.perf_counter() - start) * 1000)
+
+    def take(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            totals, self._totals = self._totals, {}
+        return {name: {"count": e["count"], "ms": round(e["ms"], 1)} for name, e in totals.items()}
+
+
+timings = ClientTimings()
+
+
+def boto3_client(service: str, **kwargs):
+    """boto3 client with the shared config, creation time recorded as "<service>.setup" """
+    import boto3
+
+    with timings.track(f"{service}.setup"):
+        return boto3.client(service, config=client_config(), **kwargs)
+
+
+def get_apigw(domain: str, stage: str):
+    """API Gateway Management API client for one WebSocket stage, created once per container"""
+    key = (domain, stage)
+    client = _apigw_clients.get(key)
+    if client is None:
+        with _lock:
+            client = _apigw_clients.get(key)
+            if client is None:
+                client = _apigw_clients[key] = boto3_client(
+                    "apigatewaymanagementapi",
+                    endpoint_url=f"https://{domain}/{stage}",
+                    region_name=os.environ["AWS_REGION"]
+                )
+    return client
+
+
+def qdrant_args() -> Dict[str, Any]:
+    """
+    Extra QdrantClient arguments with the same pool size, keep-alive and
+    (connect) retries as client_config(), plus QDRANT_TIMEOUT. The version
+    check request at construction is skipped unless QDRANT_CHECK_COMPATIBILITY=true.
+    """
+    import httpx
+
+    pool = int(os.environ.get("CLIENT_MAX_POOL", 10))
+    return {
+        "timeout": int(os.environ.get("QDRANT_TIMEOUT", 10)),
+        "check_compatibility": os.environ.get("QDRANT_CHECK_COMPATIBILITY", "false").lower() == "true",
+        # Passed through to httpx.Client
+        "transport": httpx.HTTPTransport(
+            retries=int(os.environ.get("CLIENT_RETRIES", 3)),
+            limits=httpx.Limits(
+                max_connections=pool,
+                max_keepalive_connections=pool,
+                keepalive_expiry=float(os.environ.get("CLIENT_KEEPALIVE_SECONDS", 60))
+            )
+        )
+    }
@@ -5,16 +5,143 @@ Calculates quality scores without hardcoded keywords:
 1. Retrieval Quality - Based on actual similarity scores from Qdrant
 2. Groundedness - Token overlap with retrieved context
 3. Coherence - Response completeness and structure
+
+Texts are tokenized once into integer ids (TokenIndex) and the result is
+shared by every metric: n-grams are packed ints, overlap and attribution
+are set intersections. RAGEvaluator.stream() scores the same way while the
+answer is generated (IncrementalEvaluation.feed / finalize).
 """
 
 import re
-from typing import List, Dict, Any
+from collections import OrderedDict
+from typing import List, Dict, Any, Set
+
+TOKEN_PATTERN = re.compile(r'\b\w+\b')
+SENTENCE_END = re.compile(r'([.!?]+)')
+
+# Token ids are packed ID_BITS apart, so an n-gram (n <= 3) is one exact int
+ID_BITS = 21
+ID_MASK = (1 << ID_BITS) - 1
+
+
+class TokenIndex:
+    """
+    Shared vocabulary (word -> int id) plus an LRU of tokenized texts, so the
+    response and each retrieved chunk go through the regex once per container,
+    not once per metric.
+    """
+
+    def __init__(self, max_cached_texts: int = 256):
+        self.vocab: Dict[str, int] = {}
+        self.lengths: List[int] = []  # chars per token id
+        self.max_cached_texts = max_cached_texts
+        self._texts: "OrderedDict[str, List[int]]" = OrderedDict()
+
+    def reserve(self) -> None:
+        """Start over before the packed ids could overflow, call between evaluations"""
+        if len(self.lengths) > ID_MASK // 2:
+            self.vocab.clear()
+            self.lengths.clear()
+            self._texts.clear()
+
+    def tokenize(self, text: str) -> List[int]:
+        """Ids of the lowercased TOKEN_PATTERN words of text, in order"""
+        ids = self._texts.get(text)
+        if ids is not None:
+            self._texts.move_to_end(text)
+            return ids
+
+        vocab, lengths = self.vocab, self.lengths
+        ids = []
+        for word in TOKEN_PATTERN.findall(text.lower()):
+            token_id = vocab.get(word)
+            if token_id is None:
+                token_id = vocab[word] = len(lengths)
+                lengths.append(len(word))
+            ids.append(token_id)
+
+        self._texts[text] = ids
+        if len(self._texts) > self.max_cached_texts:
+            self._texts.popitem(last=False)
+        return ids
+
+    def token_id(self, word: str) -> int:
+        """Id of one already lowercased word, added to the vocabulary if new"""
+        token_id = self.vocab.get(word)
+        if token_id is None:
+            token_id = self.vocab[word] = len(self.lengths)
+            self.lengths.append(len(word))
+        return token_id
+
+    def words(self, ids: List[int], min_chars: int = 4) -> Set[int]:
+        """Distinct ids of words with at least min_chars characters"""
+        lengths = self.lengths
+        return {i for i in set(ids) if lengths[i] >= min_chars}
+
+    def ngrams(self, ids: List[int], n: int) -> Set[int]:
+        """
+        Packed n-grams (n <= 3) whose words add up to at least n * 3 characters,
+        the integer form of the old space-joined string n-grams.
+        """
+        if len(ids) < n:
+            return set()
+
+        lengths = self.lengths
+        min_chars = n * 3
+        if n == 1:
+            return self.words(ids, min_chars)
+        if n == 2:
+            return {
+                (a << ID_BITS) | b
+                for a, b in zip(ids, ids[1:])
+                if lengths[a] + lengths[b] >= min_chars
+            }
+        if n == 3:
+            return {
+                (((a << ID_BITS) | b) << ID_BITS) | c
+                for a, b, c in zip(ids, ids[1:], ids[2:])
+                if lengths[a] + lengths[b] + lengths[c] >= min_chars
+            }
+        raise ValueError(f"n-grams are packed for n <= 3, got {n}")
+
+
+def weighted_groundedness(unigram_overlap: float, bigram_overlap: float) -> float:
+    """Weighted combination (unigrams 60%, bigrams 40%)"""
+    groundedness = (0.6 * unigram_overlap) + (0.4 * bigram_overlap)
+    return round(groundedness, 3)
+
+
+def coherence_from_counts(length: int, num_sentences: int, complete: bool) -> float:
+    """
+    Coherence from the response length (chars), its number of non-empty
+    sentences and whether it ends with . ! or ?
+    """
+    score = 0.0
+    
+    # Length check (150-800 chars is ideal)
+    if 150 <= length <= 800:
+        score += 0.4
+    elif 100 <= length < 150 or 800 < length <= 1000:
+        score += 0.2
+    
+    # Sentence structure (multiple sentences is good)
+    if num_sentences >= 3:
+        score += 0.3
+    elif num_sentences >= 2:
+        score += 0.2
+    
+    # Completeness (ends with punctuation)
+    if complete:
+        score += 0.3
+    
+    return round(min(score, 1.0), 3)
+
 
 class RAGEvaluator:
     """Evaluate RAG response quality"""
     
-    def __init__(self):
-        pass
+    def __init__(self, tokens: TokenIndex = None):
+        self.tokens = tokens or TokenIndex()
     
     def calculate_retrieval_score(self, search_results: List[Any]) -> Dict[str, float]:
         """
@@ -76,52 +203,30 @@ class RAGEvaluator:
         if not response or not context_chunks:
             return 0.0
         
-        response_lower = response.lower()
-        context_lower = " ".join(context_chunks).lower()
+        self.tokens.reserve()
+        response_ids = self.tokens.tokenize(response)
+        # Same token stream as tokenizing " ".join(context_chunks)
+        context_ids = [i for chunk in context_chunks for i in self.tokens.tokenize(chunk)]
         
-        # Extract words (4+ chars for meaningful overlap)
-        response_words = set(
-            word for word in re.findall(r'\b\w+\b', response_lower)
-            if len(word) >= 4
-        )
-        context_words = set(
-            word for word in re.findall(r'\b\w+\b', context_lower)
-            if len(word) >= 4
-        )
+        # Words (4+ chars for meaningful overlap)
+        response_words = self.tokens.words(response_ids)
         
         if not response_words:
             return 0.0
         
         # 1-gram overlap
-        unigram_overlap = len(response_words & context_words) / len(response_words)
+        unigram_overlap = len(response_words & self.tokens.words(context_ids)) / len(response_words)
         
         # 2-gram overlap (more stringent)
-        response_bigrams = self._get_ngrams(response_lower, n=2)
-        context_bigrams = self._get_ngrams(context_lower, n=2)
+        response_bigrams = self.tokens.ngrams(response_ids, n=2)
         
         if response_bigrams:
+            context_bigrams = self.tokens.ngrams(context_ids, n=2)
             bigram_overlap = len(response_bigrams & context_bigrams) / len(response_bigrams)
         else:
             bigram_overlap = 0.0
         
-        # Weighted combination (unigrams 60%, bigrams 40%)
-        groundedness = (0.6 * unigram_overlap) + (0.4 * bigram_overlap)
-        
-        return round(groundedness, 3)
-    
-    def _get_ngrams(self, text: str, n: int) -> set:
-        """Extract n-grams from text"""
-        words = re.findall(r'\b\w+\b', text)
-        if len(words) < n:
-            return set()
-        
-        ngrams = set()
-        for i in range(len(words) - n + 1):
-            ngram = " ".join(words[i:i+n])
-            if len(ngram.replace(" ", "")) >= n * 3:  # Filter short ngrams
-                ngrams.add(ngram)
-        
-        return ngrams
+        return weighted_groundedness(unigram_overlap, bigram_overlap)
     
     def calculate_coherence_score(self, response: str) -> float:
         """
@@ -135,29 +240,14 @@ class RAGEvaluator:
         if not response:
             return 0.0
         
-        score = 0.0
-        
-        # Length check (150-800 chars is ideal)
-        length = len(response)
-        if 150 <= length <= 800:
-            score += 0.4
-        elif 100 <= length < 150 or 800 < length <= 1000:
-            score += 0.2
-        
         # Sentence structure (multiple sentences is good)
         sentences = re.split(r'[.!?]+', response)
         sentences = [s.strip() for s in sentences if s.strip()]
         
-        if len(sentences) >= 3:
-            score += 0.3
-        elif len(sentences) >= 2:
-            score += 0.2
-        
         # Completeness (ends with punctuation)
-        if response.rstrip().endswith(('.', '!', '?')):
-            score += 0.3
+        complete = response.rstrip().endswith(('.', '!', '?'))
         
-        return round(min(score, 1.0), 3)
+        return coherence_from_counts(len(response), len(sentences), complete)
     
     def calculate_source_attribution_score(
         self,
@@ -172,22 +262,24 @@ class RAGEvaluator:
         if not response or not search_results:
             return 0.0
         
-        response_lower = response.lower()
+        self.tokens.reserve()
+        # Every trigram of the response, chunk phrases are looked up in it
+        response_trigrams = self.tokens.ngrams(self.tokens.tokenize(response), n=3)
         
         # Count how many sources contributed content
         sources_used = 0
         
         for result in search_results[:3]:  # Check top 3 chunks
-            chunk_content = result.payload.get('content', '').lower()
-            
-            # Extract key phrases (3+ word sequences)
-            chunk_phrases = self._get_ngrams(chunk_content, n=3)
+            chunk_ids = self.tokens.tokenize(result.payload.get('content', ''))
             
-            # Check if any phrases appear in response
-            for phrase in chunk_phrases:
-                if phrase in response_lower:
-                    sources_used += 1
-                    break  # Count this source once
+            # Key phrases (3 word sequences), stops at the first one the response shares;
+            # the length filter is already applied to response_trigrams
+            chunk_trigrams = (
+                (((a << ID_BITS) | b) << ID_BITS) | c
+                for a, b, c in zip(chunk_ids, chunk_ids[1:], chunk_ids[2:])
+            )
+            if not response_trigrams.isdisjoint(chunk_trigrams):
+                sources_used += 1
         
         # Normalize by number of results checked
         attribution_score = sources_used / min(3, len(search_results))
@@ -262,4 +354,180 @@ class RAGEvaluator:
                 "top_similarity": retrieval_metrics["top_score"],
                 "source_diversity": retrieval_metrics["source_diversity"]
             }
-        }
\ No newline at end of file
+        }
+    
+    def score_answer(
+        self,
+        response: str,
+        context_chunks: List[str],
+        search_results: List[Any],
+        retrieval_metrics: Dict[str, float]
+    ) -> Dict[str, Any]:
+        """
+        Groundedness, coherence and attribution of a finished answer combined
+        into calculate_rag_score(), the payload of the evaluation frame.
+        """
+        groundedness = self.calculate_groundedness_score(response, context_chunks)
+        coherence = self.calculate_coherence_score(response)
+        source_attribution = self.calculate_source_attribution_score(response, search_results)
+        
+        print(f"Groundedness: {groundedness}, Coherence: {coherence}, Attribution: {source_attribution}")
+        
+        return self.calculate_rag_score(
+            retrieval_metrics,
+            groundedness,
+            coherence,
+            source_attribution
+        )
+    
+    def stream(
+        self,
+        context_chunks: List[str],
+        search_results: List[Any],
+        retrieval_metrics: Dict[str, float]
+    ) -> "IncrementalEvaluation":
+        """Score an answer token by token as it streams (see IncrementalEvaluation)"""
+        return IncrementalEvaluation(self, context_chunks, search_results, retrieval_metrics)
+
+
+class IncrementalEvaluation:
+    """
+    Running RAG score of one streamed answer, same result as score_answer()
+    on the full text.
+
+    Context word / bigram / trigram sets are built up front (before the first
+    token), feed() updates the overlap counts, sentence count and attribution
+    state, so finalize() only combines counters.
+
+    NOTE : a word split across tokens is held back until a non-word character
+    (or finalize) completes it, score() doesn't include it yet.
+    """
+
+    def __init__(
+        self,
+        evaluator: RAGEvaluator,
+        context_chunks: List[str],
+        search_results: List[Any],
+        retrieval_metrics: Dict[str, float]
+    ):
+        self.evaluator = evaluator
+        self.tokens = evaluator.tokens
+        self.retrieval_metrics = retrieval_metrics
+        self.has_context = bool(context_chunks)
+        self.num_results = len(search_results)
+
+        self.tokens.reserve()
+        context_ids = [i for chunk in context_chunks for i in self.tokens.tokenize(chunk)]
+        self.context_words = self.tokens.words(context_ids)
+        self.context_bigrams = self.tokens.ngrams(context_ids, n=2)
+        # Top 3 chunks, each attributed once
+        self.chunk_trigrams = [
+            self.tokens.ngrams(self.tokens.tokenize(r.payload.get('content', '')), n=3)
+            for r in search_results[:3]
+        ]
+        self.attributed = [False] * len(self.chunk_trigrams)
+
+        self.words: Set[int] = set()
+        self.word_hits = 0
+        self.bigrams: Set[int] = set()
+        self.bigram_hits = 0
+        self.trigrams: Set[int] = set()
+
+        self.length = 0
+        self.sentences = 0
+        self.in_sentence = False
+        self.last_char = ""
+
+        self._pending = ""  # word still open at the end of the last token
+        self._prev: List[int] = []  # last two word ids
+
+    def feed(self, token: str) -> None:
+        """Account for the next streamed piece of the answer"""
+        if not token:
+            return
+        self.length += len(token)
+
+        stripped = token.rstrip()
+        if stripped:
+            self.last_char = stripped[-1]
+
+        # Sentences are the non-empty pieces between runs of . ! ?
+        for i, piece in enumerate(SENTENCE_END.split(token)):
+            if i % 2:
+                if self.in_sentence:
+                    self.sentences += 1
+                    self.in_sentence = False
+            elif not self.in_sentence and piece.strip():
+                self.in_sentence = True
+
+        text = self._pending + token.lower()
+        words = TOKEN_PATTERN.findall(text)
+        self._pending = ""
+        if words and TOKEN_PATTERN.match(text[-1]):
+            self._pending = words.pop()
+        for word in words:
+            self._add_word(word)
+
+    def _add_word(self, word: str) -> None:
+        tokens = self.tokens
+        token_id = tokens.token_id(word)
+        lengths = tokens.lengths
+
+        if lengths[token_id] >= 4 and token_id not in self.words:
+            self.words.add(token_id)
+            self.word_hits += token_id in self.context_words
+
+        prev = self._prev
+        if prev:
+            b = prev[-1]
+            if lengths[b] + lengths[token_id] >= 6:
+                bigram = (b << ID_BITS) | token_id
+                if bigram not in self.bigrams:
+                    self.bigrams.add(bigram)
+                    self.bigram_hits += bigram in self.context_bigrams
+            if len(prev) == 2:
+                a = prev[0]
+                if lengths[a] + lengths[b] + lengths[token_id] >= 9:
+                    trigram = (((a << ID_BITS) | b) << ID_BITS) | token_id
+                    if trigram not in self.trigrams:
+                        self.trigrams.add(trigram)
+                        for i, chunk_trigrams in enumerate(self.chunk_trigrams):
+                            if not self.attributed[i] and trigram in chunk_trigrams:
+                                self.attributed[i] = True
+        self._prev = [b, token_id] if prev else [token_id]
+
+    def score(self) -> Dict[str, Any]:
+        """calculate_rag_score() of the answer so far, O(1)"""
+        if not self.length or not self.has_context or not self.words:
+            groundedness = 0.0
+        else:
+            groundedness = weighted_groundedness(
+                self.word_hits / len(self.words),
+                self.bigram_hits / len(self.bigrams) if self.bigrams else 0.0
+            )
+
+        coherence = 0.0
+        if self.length:
+            coherence = coherence_from_counts(
+                self.length,
+                self.sentences + self.in_sentence,
+                self.last_char in ('.', '!', '?')
+            )
+
+        source_attribution = 0.0
+        if self.length and self.num_results:
+            source_attribution = round(sum(self.attributed) / min(3, self.num_results), 3)
+
+        return self.evaluator.calculate_rag_score(
+            self.retrieval_metrics,
+            groundedness,
+            coherence,
+            source_attribution
+        )
+
+    def finalize(self) -> Dict[str, Any]:
+        """Close the last word and return the final score"""
+        if self._pending:
+            self._add_word(self._pending)
+            self._pending = ""
+        return self.score()
@@ -1,9 +1,16 @@
 import json
-import boto3
 import os
-import numpy as np
-from sentence_transformers import SentenceTransformer
-from qdrant_client import QdrantClient
+import re
+import time
+import uuid
+from startup import init_report, timed, timed_import
+
+# Heavy imports are timed and deferred (see startup.py); numpy is needed by the caches
+timed_import("numpy")
+from streaming import FlushPolicy, FrameSender, ResponseBuilder, TokenCoalescer
+from cache import QueryEmbeddingCache, SemanticAnswerCache
+import scoring
+import clients
 
 # Warm-start: Loaded once when the container starts
 # MODEL_PATH = "/var/task/mxbai_model"
@@ -19,60 +26,225 @@ and not once for every request
 # )
 evaluator = None
 model = None
+bedrock = None
+qdrant = None
+
+# Group token deltas into fewer post_to_connection calls (see streaming.py)
+flush_policy = FlushPolicy.from_env()
+
+# Repeated questions skip model.encode (see cache.py)
+embedding_cache = QueryEmbeddingCache.from_env(
+    namespace=f"mxbai-embed-large-v1:{os.environ.get('EMBEDDING_BACKEND', 'torch')}"
+)
 
-bedrock = boto3.client("bedrock-runtime", region_name="us-east-1")
+# Near-duplicate questions replay a stored answer, skipping Qdrant and Bedrock
+answer_cache = SemanticAnswerCache.from_env()
+collection_version = None
+collection_version_checked_at = 0.0
 
-qdrant = QdrantClient(url=os.environ['QDRANT_URL'], api_key=os.environ['QDRANT_API_KEY'] , port=None) # because : https://github.com/qdrant/qdrant-client/issues/394#issuecomment-2075283788
+# sync | thread | queue | stream: when the RAG score is computed relative to "done" (see scoring.py)
+evaluation_mode = scoring.evaluation_mode()
+evaluation_queue = None
 
 def send_message(apigw_client, connection_id, payload):
     """
     Sends a JSON payload to a specific WebSocket connection.
     """
     try:
-        apigw_client.post_to_connection(
-            ConnectionId=connection_id,
-            Data=json.dumps(payload)
-        )
+        with clients.timings.track("apigatewaymanagementapi.post"):
+            apigw_client.post_to_connection(
+                ConnectionId=connection_id,
+                Data=json.dumps(payload)
+            )
     except apigw_client.exceptions.GoneException:
         print(f"Connection {connection_id} is gone.")
     except Exception as e:
         print(f"Error sending message: {e}")
 
 
-def lambda_handler(event, context):
+def get_bedrock():
+    global bedrock
+    if bedrock is None:
+        timed_import("boto3")
+        with timed("bedrock client"):
+            # Pool, keep-alive and retries shared with the other clients (see clients.py)
+            bedrock = clients.boto3_client("bedrock-runtime", region_name="us-east-1")
+    return bedrock
 
-    global model, evaluator
-    connection_id = event['requestContext']['connectionId']
 
-    domain = event['requestContext']['domainName']
-    stage = event['requestContext']['stage']
-    apigw = boto3.client('apigatewaymanagementapi', endpoint_url=f"https://{domain}/{stage}" , region_name=os.environ['AWS_REGION'])
+def get_qdrant():
+    global qdrant
+    if qdrant is None and os.environ.get("LOCAL_INDEX_PATH"):
+        # Qdrant-less local mode: exact search over an embeddings artifact dir,
+        # same query_points / get_collection calls (see retriever.py)
+        retriever = timed_import("retriever")
+        with timed("local index"):
+            qdrant = retriever.Retriever.from_artifact(
+                os.environ["LOCAL_INDEX_PATH"],
+                dtype=os.environ.get("LOCAL_INDEX_DTYPE"),
+                # hnsw.bin built with `python retriever.py build-ann <dir>`
+                use_ann=os.environ.get("LOCAL_INDEX_ANN", "false").lower() == "true"
+            )
+    if qdrant is None:
+        qdrant_client = timed_import("qdrant_client")
+        with timed("qdrant client"), clients.timings.track("qdrant.setup"):
+            qdrant = qdrant_client.QdrantClient(url=os.environ['QDRANT_URL'], api_key=os.environ['QDRANT_API_KEY'] , port=None, **clients.qdrant_args()) # because : https://github.com/qdrant/qdrant-client/issues/394#issuecomment-2075283788
+    return qdrant
 
-    if evaluator is None:
-            # This will now work if evaluator.py is in the same folder
-            from evaluator import RAGEvaluator 
-            evaluator = RAGEvaluator()
 
+def get_model():
+    global model
     if model is None:
-        from sentence_transformers import SentenceTransformer
-        model = SentenceTransformer("/var/task/mxbai_model", device="cpu")
+        # torch | onnx | onnx-int8, picked by EMBEDDING_BACKEND (see embedding_backend.py)
+        embedding_backend = timed_import("embedding_backend")
+        with timed("load encoder"):
+            model = embedding_backend.load_encoder()
+    return model
+
+
+def get_evaluator():
+    global evaluator
+    if evaluator is None:
+        # This will now work if evaluator.py is in the same folder
+        evaluator_module = timed_import("evaluator")
+        evaluator = evaluator_module.RAGEvaluator()
+    return evaluator
+
+
+def warm_up():
+    """
+    Prime tokenizer, model and Qdrant connection without a user query.
+    Returns the recorded init timings (ms).
+    """
+    encoder = get_model()
+    with timed("first encode"):
+        encoder.encode("warm up")
+
+    get_evaluator()
+    get_bedrock()
+
+    with timed("qdrant connect"):
+        try:
+            get_qdrant().get_collection(collection_name="virtual-lenny")
+        except Exception as e:
+            print(f"Qdrant warm-up failed: {e}")
+
+    return init_report()
+
+
+def get_collection_version():
+    """
+    Version token of the Qdrant collection, used to invalidate the answer cache.
+    Re-checked at most every ANSWER_CACHE_VERSION_CHECK seconds.
+    """
+    global collection_version, collection_version_checked_at
+
+    now = time.time()
+    if now - collection_version_checked_at >= float(os.environ.get("ANSWER_CACHE_VERSION_CHECK", 60)):
+        try:
+            # "virtual-lenny" is an alias, store_qdrant tags every version with corpus_version
+            info = get_qdrant().get_collection(collection_name="virtual-lenny")
+            metadata = getattr(info.config, "metadata", None) or {}
+            collection_version = f"{metadata.get('corpus_version')}:{info.points_count}"
+        except Exception as e:
+            print(f"Could not read collection version: {e}")
+        collection_version_checked_at = now
+
+    return collection_version
+
+
+def get_evaluation_queue():
+    global evaluation_queue
+    if evaluation_queue is None:
+        evaluation_queue = scoring.SqsQueue.from_env()
+    return evaluation_queue
+
+
+def replay_cached_answer(post, entry):
+    """
+    Send a cached answer with the same chunk -> evaluation -> done sequence
+    as a freshly generated one.
+    """
+    with FrameSender.from_env(post) as sender:
+        coalescer = TokenCoalescer(sender.put, flush_policy)
+        for token in re.findall(r"\S+\s*|\s+", entry["answer"]):
+            coalescer.add(token)
+        coalescer.flush()
+
+        # Answers scored by the queue worker are cached without a score
+        if entry["evaluation"] is not None:
+            sender.put({
+                "type": "evaluation",
+                "score": entry["evaluation"]
+            })
+
+    post({"type": "done"})
+
+
+def lambda_handler(event, context):
+
+    request_context = event.get('requestContext', {})
+
+    # Warm-up ping: scheduled rule ({"warmup": true}) or the "warmup" WebSocket route
+    if event.get('warmup') or request_context.get('routeKey') == 'warmup':
+        # The warmup route also knows the stage the user's messages will come from
+        if 'domainName' in request_context:
+            timed_import("boto3")
+            clients.get_apigw(request_context['domainName'], request_context['stage'])
+        timings = warm_up()
+        print(f"Warm-up done, init timings (ms): {timings}")
+        return {'statusCode': 200, 'body': json.dumps({'warm': True, 'timings_ms': timings})}
+
+    connection_id = request_context['connectionId']
+
+    domain = request_context['domainName']
+    stage = request_context['stage']
+    # Cached per (domain, stage): warm invocations reuse the client and its open connections
+    timed_import("boto3")
+    apigw = clients.get_apigw(domain, stage)
+
+    get_evaluator()
+    get_model()
+
+    sender = None
+    scorer = None
+    message_id = None
+
+    def post(payload):
+        # Every frame names its answer: a late evaluation frame (thread / queue
+        # modes) must not be attached to the next answer by the client
+        send_message(apigw, connection_id, dict(payload, message_id=message_id))
 
     try:
         # 1. Parse User Query
         body = json.loads(event.get('body', '{}'))
         user_query = body.get('message', '')
+        message_id = body.get('message_id') or request_context.get('requestId') or uuid.uuid4().hex
 
         # 2. RAG: Embedding
-        query_vector = model.encode(user_query).tolist()
-
-        search_result = qdrant.query_points(
-            collection_name="virtual-lenny",
-            query=query_vector,
-            limit=3,
-            timeout=10 , 
-            with_payload=True,
-            score_threshold=0.3
-        )
+        query_embedding = embedding_cache.get_or_compute(user_query, model.encode)
+        query_vector = query_embedding.tolist()
+        print(f"Embedding cache: {embedding_cache.stats()}")
+
+        if answer_cache.enabled:
+            answer_cache.set_version(get_collection_version())
+            cached = answer_cache.lookup(query_embedding)
+            print(f"Answer cache: {answer_cache.stats()}")
+
+            if cached is not None:
+                print(f"Replaying cached answer for: {cached['query']}")
+                replay_cached_answer(post, cached)
+                return {'statusCode': 200}
+
+        with clients.timings.track("qdrant.query"):
+            search_result = get_qdrant().query_points(
+                collection_name="virtual-lenny",
+                query=query_vector,
+                limit=3,
+                timeout=10 , 
+                with_payload=True,
+                score_threshold=0.3
+            )
         # results = search_result.points # https://github.com/qdrant/qdrant-client
         # context_text = "\n\n".join([r.payload['content'] for r in results])
         search_result = search_result.points
@@ -117,24 +289,26 @@ def lambda_handler(event, context):
         Answer:
         """
 
-        full_response = ""
+        usage = {}
+        generation_started = time.perf_counter()
         
-        response = bedrock.converse_stream(
-            modelId="amazon.nova-lite-v1:0",
-            messages=[{
-                "role": "user",
-                "content": [{"text": prompt}]
-            }],
-            inferenceConfig={
-                "maxTokens": 512,
-                "temperature": 0.7
-            }
-        )
+        with clients.timings.track("bedrock-runtime.converse_stream"):
+            response = get_bedrock().converse_stream(
+                modelId="amazon.nova-lite-v1:0",
+                messages=[{
+                    "role": "user",
+                    "content": [{"text": prompt}]
+                }],
+                inferenceConfig={
+                    "maxTokens": 512,
+                    "temperature": 0.7
+                }
+            )
         
 
         # https://docs.aws.amazon.com/code-library/latest/ug/python_3_bedrock-runtime_code_examples.html 
         # 4. Bedrock Streaming 
-        # response = bedrock.converse_stream(
+        # response = get_bedrock().converse_stream(
         #             modelId="amazon.nova-lite-v1:0",
         #             messages=[{
         #                 "role": "user",
@@ -160,55 +334,107 @@ def lambda_handler(event, context):
         #         except:
         #             pass
 
+        # Posts happen on a background thread so slow API Gateway calls
+        # don't hold back reads from the Bedrock stream
+        sender = FrameSender.from_env(post).start()
+        coalescer = TokenCoalescer(sender.put, flush_policy)
+
+        # Context sets are built while Bedrock works on the first token
+        evaluation_stream = None
+        if evaluation_mode == "stream":
+            evaluation_stream = evaluator.stream(context_chunks, search_result, retrieval_metrics)
+
+        # One add() per delta: answer buffer, chunk frames and streaming evaluation
+        builder = ResponseBuilder(
+            coalescer,
+            evaluation=evaluation_stream,
+            flush_on_sentence=os.environ.get("STREAM_FLUSH_SENTENCE", "false").lower() == "true"
+        )
+
         for event_chunk in response.get("stream", []):
             if "contentBlockDelta" in event_chunk:
-                token = event_chunk["contentBlockDelta"]["delta"]["text"]
-                full_response += token
-                
-                send_message(apigw, connection_id, {
-                    "type": "chunk",
-                    "content": token
-                })
+                builder.add(event_chunk["contentBlockDelta"]["delta"]["text"])
+            elif "metadata" in event_chunk:
+                usage = event_chunk["metadata"].get("usage", {})
+
+        builder.flush()
+        full_response = builder.text()
+        generation_seconds = time.perf_counter() - generation_started
         
-        print("Response generated")
+        print(f"Response generated ({builder.tokens_seen} tokens, {builder.sentences} sentences "
+              f"in {builder.frames_sent} frames)")
         
-        # Calculate evaluation scores
-        groundedness = evaluator.calculate_groundedness_score(
-            full_response, 
-            context_chunks
+        job = scoring.make_job(
+            connection_id, domain, stage, full_response, search_result, retrieval_metrics, message_id=message_id
         )
+        rag_score = None
+
+        if evaluation_mode in ("sync", "stream"):
+            rag_score = evaluation_stream.finalize() if evaluation_stream else scoring.score_job(evaluator, job)
+            sender.put({
+                "type": "evaluation",
+                "score": rag_score
+            })
+        elif evaluation_mode == "thread":
+            # Scores while the queued frames drain, posts only after done
+            scorer = scoring.BackgroundScorer(
+                evaluator,
+                job,
+                lambda score: post({"type": "evaluation", "score": score})
+            ).start()
+
+        # Drain every queued frame before signalling the end of the answer
+        sender.close()
         
-        coherence = evaluator.calculate_coherence_score(full_response)
-        
-        source_attribution = evaluator.calculate_source_attribution_score(
+        post({"type": "done"})
+        print(f"Done sent {(time.perf_counter() - generation_started - generation_seconds) * 1000:.1f} ms "
+              f"after the last token ({evaluation_mode} evaluation)")
+
+        if scorer is not None:
+            rag_score = scorer.join()
+        elif evaluation_mode == "queue":
+            get_evaluation_queue().send(job)
+
+        if rag_score is not None:
+            print(f" RAG Score: {rag_score['overall']}% ({rag_score['grade']})")
+
+        answer_cache.add(
+            user_query,
+            query_embedding,
             full_response,
-            search_result
+            rag_score,
+            generation_seconds=generation_seconds,
+            input_tokens=usage.get("inputTokens", 0),
+            output_tokens=usage.get("outputTokens", 0)
         )
         
-        print(f"Groundedness: {groundedness}, Coherence: {coherence}, Attribution: {source_attribution}")
-        
-        # Calculate RAG score
-        rag_score = evaluator.calculate_rag_score(
-            retrieval_metrics,
-            groundedness,
-            coherence,
-            source_attribution
-        )
-        
-        print(f" RAG Score: {rag_score['overall']}% ({rag_score['grade']})")
-        
-        # Send evaluation scores
-        send_message(apigw, connection_id, {
-            "type": "evaluation",
-            "score": rag_score
-        })
-        
-        send_message(apigw, connection_id, {"type": "done"})
-        
         return {'statusCode': 200}
 
     except Exception as e:
         print(f"Error: {str(e)}")
-        apigw.post_to_connection(ConnectionId=connection_id, Data=json.dumps({"type": "error", "message": str(e)}))
+        if sender is not None:
+            sender.close()
+        if scorer is not None:
+            scorer.release()
+        apigw.post_to_connection(
+            ConnectionId=connection_id,
+            Data=json.dumps({"type": "error", "message_id": message_id, "message": str(e)})
+        )
+
+    finally:
+        # No ".setup" entries on a warm invocation
+        print(f"Client timings (ms): {clients.timings.take()}")
+
+    return {'statusCode': 200}
+
+
+# Lambda's init phase runs with boosted CPU and before any user is waiting:
+# build the encoder, tokenizer and Qdrant connection here, not on the first question
+if os.environ.get("PRELOAD_MODEL", "true").lower() == "true":
+    try:
+        warm_up()
+    except Exception as e:
+        # Don't fail the init phase, the request path retries the lazy loads
+        print(f"Preload failed: {e}")
 
-    return {'statusCode': 200}
\ No newline at end of file
+print(f"Init timings (ms): {init_report()}")
@@ -0,0 +1,204 @@
+"""
+Off-Path Answer Scoring
+
+Moves the RAG score out of the time between the last token and {"type": "done"}.
+EVALUATION_MODE picks where it runs:
+1. sync - Scored before done is sent (the original order)
+2. thread - BackgroundScorer scores on a worker thread of the same invocation
+   while the last frames and done go out, the evaluation frame follows done
+3. queue - done first, the answer is handed to the evaluation worker through
+   SQS (EVALUATION_QUEUE_URL); lambda_handler below scores it and posts the frame
+4. stream - Opt-in: scored token by token during generation
+   (RAGEvaluator.stream), finalize() before done costs O(1) but every delta
+   pays the evaluator's feed() on the answer's critical path
+
+In the thread / queue modes the evaluation frame arrives after done, possibly
+once the next question is already streaming. Every frame of an answer carries
+its message_id ({"type": "evaluation", "message_id": ..., "score": ...}), the
+client attaches the score to the message with that id rather than to whatever
+message is last.
+"""
+
+import json
+import os
+import queue
+import threading
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional
+
+EVALUATION_MODES = ("sync", "thread", "queue", "stream")
+
+
+def evaluation_mode() -> str:
+    """EVALUATION_MODE from the environment, defaults to thread (done first)"""
+    mode = os.environ.get("EVALUATION_MODE", "thread").lower()
+    if mode not in EVALUATION_MODES:
+        raise ValueError(f"Unknown EVALUATION_MODE '{mode}', expected one of {EVALUATION_MODES}")
+    return mode
+
+
+def make_job(
+    connection_id: str,
+    domain: str,
+    stage: str,
+    response: str,
+    search_results: List[Any],
+    retrieval_metrics: Dict[str, float],
+    message_id: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Everything needed to score an answer and reach its WebSocket, as plain JSON
+    (search results keep only the score and payload the evaluator reads).
+    message_id is echoed in the evaluation frame.
+    """
+    return {
+        "connection_id": connection_id,
+        "domain": domain,
+        "stage": stage,
+        "message_id": message_id,
+        "response": response,
+        "search_results": [{"score": r.score, "payload": r.payload} for r in search_results],
+        "retrieval_metrics": retrieval_metrics
+    }
+
+
+def score_job(evaluator, job: Dict[str, Any]) -> Dict[str, Any]:
+    """RAG score of a job built by make_job()"""
+    search_results = [SimpleNamespace(**r) for r in job["search_results"]]
+    return evaluator.score_answer(
+        job["response"],
+        [r.payload["content"] for r in search_results],
+        search_results,
+        job["retrieval_metrics"]
+    )
+
+
+def evaluation_frame(job: Dict[str, Any], score: Dict[str, Any]) -> Dict[str, Any]:
+    """Evaluation frame for a job's answer, tagged with its message_id"""
+    return {"type": "evaluation", "message_id": job.get("message_id"), "score": score}
+
+
+class BackgroundScorer:
+    """
+    Score an answer on a worker thread while the caller drains the stream and
+    sends done, then hand the result to on_score.
+
+    - Ordering: on_score waits for release(), so the evaluation frame can't
+      overtake chunk frames or done
+    - Lambda freezes the container once the handler returns, so the handler
+      must join() before returning: done is already out, only the invocation waits
+    """
+
+    def __init__(self, evaluator, job: Dict[str, Any], on_score: Callable[[Dict[str, Any]], None]):
+        self.evaluator = evaluator
+        self.job = job
+        self.on_score = on_score
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[Exception] = None
+        self._released = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="answer-scorer", daemon=True)
+
+    def start(self) -> "BackgroundScorer":
+        self._thread.start()
+        return self
+
+    def release(self) -> None:
+        """Allow on_score to run (call once done has been sent)"""
+        self._released.set()
+
+    def join(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Release and wait for the score, None if scoring failed"""
+        self.release()
+        self._thread.join(timeout)
+        return self.result
+
+    def _run(self) -> None:
+        try:
+            self.result = score_job(self.evaluator, self.job)
+            self._released.wait()
+            self.on_score(self.result)
+        except Exception as e:
+            self.error = e
+            print(f"Error in answer scorer: {e}")
+
+
+class SqsQueue:
+    """Evaluation jobs out to the SQS queue the worker Lambda consumes"""
+
+    def __init__(self, queue_url: str, client=None):
+        self.queue_url = queue_url
+        self.client = client
+
+    @classmethod
+    def from_env(cls) -> "SqsQueue":
+        return cls(os.environ["EVALUATION_QUEUE_URL"])
+
+    def send(self, job: Dict[str, Any]) -> None:
+        if self.client is None:
+            from clients import boto3_client
+            self.client = boto3_client("sqs")
+        self.client.send_message(QueueUrl=self.queue_url, MessageBody=json.dumps(job))
+
+
+class LocalQueue:
+    """
+    In-process stand-in for SqsQueue (tests, local runs): send() keeps the
+    serialized job, records() hands them out as an SQS event's Records.
+    """
+
+    def __init__(self):
+        self._messages: "queue.Queue" = queue.Queue()
+
+    def send(self, job: Dict[str, Any]) -> None:
+        self._messages.put(json.dumps(job))
+
+    def records(self, max_messages: int = 10) -> List[Dict[str, Any]]:
+        records = []
+        while len(records) < max_messages and not self._messages.empty():
+            records.append({"messageId": str(len(records)), "body": self._messages.get()})
+        return records
+
+
+def process_records(
+    records: List[Dict[str, Any]],
+    evaluator,
+    post: Callable[[Dict[str, Any], Dict[str, Any]], None]
+) -> List[str]:
+    """
+    Score every SQS record and post(job, frame) its evaluation frame.
+    Returns the messageIds that failed, SQS retries only those.
+    """
+    failed = []
+    for record in records:
+        try:
+            job = json.loads(record["body"])
+            post(job, evaluation_frame(job, score_job(evaluator, job)))
+        except Exception as e:
+            print(f"Error scoring message {record.get('messageId')}: {e}")
+            failed.append(record.get("messageId"))
+    return failed
+
+
+_evaluator = None
+
+
+def post_to_connection(job: Dict[str, Any], payload: Dict[str, Any]) -> None:
+    """Send a frame to the job's WebSocket connection, a closed connection is not an error"""
+    from clients import get_apigw
+
+    apigw = get_apigw(job["domain"], job["stage"])
+    try:
+        apigw.post_to_connection(ConnectionId=job["connection_id"], Data=json.dumps(payload))
+    except apigw.exceptions.GoneException:
+        print(f"Connection {job['connection_id']} is gone.")
+
+
+def lambda_handler(event, context):
+    """Evaluation worker: SQS batch in, evaluation frames out (ReportBatchItemFailures)"""
+    global _evaluator
+    if _evaluator is None:
+        from evaluator import RAGEvaluator
+        _evaluator = RAGEvaluator()
+
+    failed = process_records(event.get("Records", []), _evaluator, post_to_connection)
+    return {"batchItemFailures": [{"itemIdentifier": message_id} for message_id in failed]}
@@ -0,0 +1,45 @@
+"""
+Cold-Start Helpers
+
+Makes the container init phase measurable:
+1. timed_import - Import a module and record how long it took
+2. timed - Context manager recording the duration of any init step
+3. init_report - One log line with every recorded timing
+"""
+
+import importlib
+import sys
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+_timings: Dict[str, float] = {}
+
+
+def timed_import(name: str):
+    """
+    Import a module by name, recording the import time the first time it
+    is actually loaded (already-imported modules cost nothing).
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    _timings[f"import {name}"] = round((time.perf_counter() - start) * 1000, 1)
+    return module
+
+
+@contextmanager
+def timed(step: str):
+    """Record how long the wrapped block takes"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _timings[step] = round((time.perf_counter() - start) * 1000, 1)
+
+
+def init_report() -> Dict[str, float]:
+    """Recorded timings in milliseconds, slowest first"""
+    return dict(sorted(_timings.items(), key=lambda kv: kv[1], reverse=True))
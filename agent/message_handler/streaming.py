@@ -0,0 +1,283 @@
+"""
+WebSocket Streaming Helpers
+
+Groups Bedrock token deltas into fewer API Gateway frames:
+1. FlushPolicy - When a buffered frame should go out (bytes, tokens or time window)
+2. TokenCoalescer - Buffers tokens and emits {"type": "chunk"} frames
+3. FrameSender - Posts frames from a bounded queue on a background thread
+4. ResponseBuilder - Accumulates the answer, feeds the coalescer and evaluator
+"""
+
+import io
+import os
+import queue
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+
+class FlushPolicy:
+    """
+    Thresholds that trigger a flush of the token buffer.
+
+    A limit set to 0 is disabled. The buffer is flushed as soon as ANY
+    enabled limit is reached.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 512,
+        max_tokens: int = 16,
+        max_interval_ms: float = 50.0,
+        flush_first_token: bool = True
+    ):
+        self.max_bytes = max_bytes
+        self.max_tokens = max_tokens
+        self.max_interval_ms = max_interval_ms
+        # Send the very first token on its own so time-to-first-token is unchanged
+        self.flush_first_token = flush_first_token
+
+    @classmethod
+    def from_env(cls) -> "FlushPolicy":
+        """
+        Build a policy from the Lambda environment:
+        STREAM_FLUSH_BYTES, STREAM_FLUSH_TOKENS, STREAM_FLUSH_MS, STREAM_FLUSH_FIRST
+        """
+        return cls(
+            max_bytes=int(os.environ.get("STREAM_FLUSH_BYTES", 512)),
+            max_tokens=int(os.environ.get("STREAM_FLUSH_TOKENS", 16)),
+            max_interval_ms=float(os.environ.get("STREAM_FLUSH_MS", 50)),
+            flush_first_token=os.environ.get("STREAM_FLUSH_FIRST", "true").lower() == "true"
+        )
+
+    def should_flush(self, buffered_bytes: int, buffered_tokens: int, elapsed_ms: float) -> bool:
+        if self.max_bytes and buffered_bytes >= self.max_bytes:
+            return True
+        if self.max_tokens and buffered_tokens >= self.max_tokens:
+            return True
+        if self.max_interval_ms and elapsed_ms >= self.max_interval_ms:
+            return True
+        return False
+
+
+class TokenCoalescer:
+    """
+    Buffer streamed tokens and send them as a single chunk frame.
+
+    The wire protocol is unchanged: every frame is {"type": "chunk", "content": str},
+    the content is just several tokens long instead of one.
+
+    NOTE : the time window is only checked when a token arrives, so call
+    flush() once the stream ends to send whatever is left in the buffer.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[Dict[str, Any]], None],
+        policy: Optional[FlushPolicy] = None,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.send = send
+        self.policy = policy or FlushPolicy()
+        self.clock = clock
+
+        self._parts: List[str] = []
+        self._bytes = 0
+        self._started_at: Optional[float] = None
+
+        self.tokens_seen = 0
+        self.frames_sent = 0
+
+    def add(self, token: str) -> None:
+        """Buffer one token and flush if the policy says so"""
+        if not token:
+            return
+
+        if self._started_at is None:
+            self._started_at = self.clock()
+
+        self._parts.append(token)
+        self._bytes += len(token.encode("utf-8"))
+        self.tokens_seen += 1
+
+        if self.policy.flush_first_token and self.frames_sent == 0:
+            self.flush()
+            return
+
+        elapsed_ms = (self.clock() - self._started_at) * 1000
+        if self.policy.should_flush(self._bytes, len(self._parts), elapsed_ms):
+            self.flush()
+
+    def flush(self) -> None:
+        """Send the buffered tokens as one chunk frame"""
+        if not self._parts:
+            return
+
+        content = "".join(self._parts)
+        self._parts = []
+        self._bytes = 0
+        self._started_at = None
+
+        self.send({"type": "chunk", "content": content})
+        self.frames_sent += 1
+
+
+class FrameSender:
+    """
+    Post frames to the WebSocket from a background worker thread.
+
+    The caller keeps reading the Bedrock stream while API Gateway calls happen
+    on the worker, so the two network latencies overlap instead of adding up.
+
+    - Ordering: one worker draining a FIFO queue, frames go out in put() order
+    - Backpressure: the queue is bounded, put() blocks once max_pending frames wait
+    - Drain: close() blocks until every queued frame has been posted
+    """
+
+    _STOP = object()
+
+    def __init__(self, send: Callable[[Dict[str, Any]], None], max_pending: int = 64):
+        self.send = send
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._run, name="frame-sender", daemon=True)
+        self._started = False
+        self._closed = False
+
+        self.frames_sent = 0
+        self.send_errors = 0
+
+    @classmethod
+    def from_env(cls, send: Callable[[Dict[str, Any]], None]) -> "FrameSender":
+        """Queue size is read from STREAM_QUEUE_SIZE"""
+        return cls(send, max_pending=int(os.environ.get("STREAM_QUEUE_SIZE", 64)))
+
+    def start(self) -> "FrameSender":
+        if not self._started:
+            self._thread.start()
+            self._started = True
+        return self
+
+    def put(self, payload: Dict[str, Any]) -> None:
+        """Queue a frame, blocking while the queue is full"""
+        if self._closed:
+            raise RuntimeError("FrameSender is closed")
+        self._queue.put(payload)
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Drain all queued frames and stop the worker"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._started:
+            self._queue.put(self._STOP)
+            self._thread.join(timeout)
+
+    def __enter__(self) -> "FrameSender":
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def _run(self) -> None:
+        while True:
+            payload = self._queue.get()
+            if payload is self._STOP:
+                break
+            try:
+                self.send(payload)
+                self.frames_sent += 1
+            except Exception as e:
+                # Keep draining: one failed post must not block the rest of the answer
+                self.send_errors += 1
+                print(f"Error in frame sender: {e}")
+
+
+# Same sentence split as the evaluator's coherence check: runs of . ! ?
+SENTENCE_END = re.compile(r'([.!?]+)')
+
+
+class ResponseBuilder:
+    """
+    Accumulate a streamed answer in one io.StringIO instead of `text += token`.
+
+    Every token is passed on to the TokenCoalescer and, when given, the
+    streaming evaluation (RAGEvaluator.stream), so the Bedrock loop makes a
+    single add() call per delta.
+
+    - Memory: one growing buffer, no intermediate strings kept alive
+    - Sentences: counts completed sentences, flush_on_sentence sends the
+      buffered frame as soon as one ends
+    - text(): the full answer, built once at the end
+    """
+
+    def __init__(
+        self,
+        coalescer: Optional[TokenCoalescer] = None,
+        evaluation: Any = None,
+        flush_on_sentence: bool = False
+    ):
+        self.coalescer = coalescer
+        self.evaluation = evaluation
+        self.flush_on_sentence = flush_on_sentence
+
+        self._buffer = io.StringIO()
+        self._in_sentence = False
+
+        self.tokens_seen = 0
+        self.chars = 0
+        self.sentences = 0
+        self.last_sentence_end = 0  # char offset just past the last . ! ? run closing a sentence
+
+    @property
+    def frames_sent(self) -> int:
+        return self.coalescer.frames_sent if self.coalescer is not None else 0
+
+    def add(self, token: str) -> None:
+        """Append one streamed token"""
+        if not token:
+            return
+
+        self._buffer.write(token)
+        ended = self._count_sentences(token)
+        self.chars += len(token)
+        self.tokens_seen += 1
+
+        if self.coalescer is not None:
+            self.coalescer.add(token)
+            if ended and self.flush_on_sentence:
+                self.coalescer.flush()
+        if self.evaluation is not None:
+            self.evaluation.feed(token)
+
+    def _count_sentences(self, token: str) -> bool:
+        """Update the sentence state, True if at least one sentence ended in token"""
+        if "." not in token and "!" not in token and "?" not in token:
+            if not self._in_sentence and not token.isspace():
+                self._in_sentence = True
+            return False
+
+        ended = False
+        offset = self.chars
+        for i, piece in enumerate(SENTENCE_END.split(token)):
+            offset += len(piece)
+            if i % 2:
+                if self._in_sentence:
+                    self.sentences += 1
+                    self.last_sentence_end = offset
+                    self._in_sentence = False
+                    ended = True
+            elif not self._in_sentence and piece.strip():
+                self._in_sentence = True
+        return ended
+
+    def flush(self) -> None:
+        """Send whatever the coalescer still buffers (call once the stream ends)"""
+        if self.coalescer is not None:
+            self.coalescer.flush()
+
+    def text(self) -> str:
+        return self._buffer.getvalue()
+
+    def __len__(self) -> int:
+        return self.chars
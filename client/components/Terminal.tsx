@@ -4,6 +4,8 @@ import { useState, useRef, useEffect } from 'react';
 
 interface Message {
   type: 'user' | 'assistant' | 'system';
+  // message_id of the answer (assistant messages), frames are matched on it
+  id?: string;
   content: string;
   timestamp: Date;
   evaluation?: RAGScore;
@@ -40,6 +42,7 @@ export default function Terminal() {
   const messagesEndRef = useRef<HTMLDivElement>(null);
   const currentAssistantMessageRef = useRef('');
   const currentEvaluationRef = useRef<RAGScore | null>(null);
+  const currentMessageIdRef = useRef<string | null>(null);
 
   // Auto-scroll to bottom
   const scrollToBottom = () => {
@@ -74,6 +77,8 @@ export default function Terminal() {
       ws.onopen = () => {
         setIsConnected(true);
         addSystemMessage('✅ Connected to backend');
+        // Prime the model + Qdrant connection before the first question
+        ws.send(JSON.stringify({ action: 'warmup' }));
       };
 
       ws.onclose = () => {
@@ -90,22 +95,30 @@ export default function Terminal() {
         try {
           const data = JSON.parse(event.data);
 
+          // Frames name their answer, the backend may send an evaluation
+          // after done (once the next answer is streaming)
+          const messageId: string | undefined = data.message_id ?? currentMessageIdRef.current ?? undefined;
+
           if (data.type === 'chunk') {
+            // Late chunks of an earlier answer are dropped
+            if (data.message_id && data.message_id !== currentMessageIdRef.current) return;
+
             // Accumulate streaming chunks
             currentAssistantMessageRef.current += data.content;
             
-            // Update the last message (assistant's response)
+            // Update this answer's assistant message
             setMessages((prev) => {
               const newMessages = [...prev];
-              const lastMessage = newMessages[newMessages.length - 1];
+              const index = newMessages.findIndex((m) => m.type === 'assistant' && m.id === messageId);
               
-              if (lastMessage?.type === 'assistant') {
+              if (index !== -1) {
                 // Update existing assistant message
-                lastMessage.content = currentAssistantMessageRef.current;
+                newMessages[index] = { ...newMessages[index], content: currentAssistantMessageRef.current };
               } else {
                 // Create new assistant message
                 newMessages.push({
                   type: 'assistant',
+                  id: messageId,
                   content: currentAssistantMessageRef.current,
                   timestamp: new Date()
                 });
@@ -115,19 +128,16 @@ export default function Terminal() {
             });
           } else if (data.type === 'evaluation') {
             // Store evaluation data
-            currentEvaluationRef.current = data.score;
+            if (messageId === currentMessageIdRef.current) {
+              currentEvaluationRef.current = data.score;
+            }
             
-            // Update the last assistant message with evaluation
-            setMessages((prev) => {
-              const newMessages = [...prev];
-              const lastMessage = newMessages[newMessages.length - 1];
-              
-              if (lastMessage?.type === 'assistant') {
-                lastMessage.evaluation = data.score;
-              }
-              
-              return newMessages;
-            });
+            // Attach the evaluation to the answer it scores
+            setMessages((prev) =>
+              prev.map((m) =>
+                m.type === 'assistant' && m.id === messageId ? { ...m, evaluation: data.score } : m
+              )
+            );
           } else if (data.type === 'done') {
             // Streaming complete
             setIsStreaming(false);
@@ -169,7 +179,9 @@ export default function Terminal() {
 
     // Send to WebSocket
     if (wsRef.current && wsRef.current.readyState === WebSocket.OPEN) {
-      wsRef.current.send(JSON.stringify({ message: input }));
+      const messageId = crypto.randomUUID();
+      currentMessageIdRef.current = messageId;
+      wsRef.current.send(JSON.stringify({ message: input, message_id: messageId }));
       setIsStreaming(true);
       currentAssistantMessageRef.current = '';
       currentEvaluationRef.current = null;
@@ -1,6 +1,7 @@
 from aws_cdk import (
     Stack,
     Duration,
+    Size,
     aws_lambda as _lambda,
     aws_stepfunctions as sfn,
     aws_stepfunctions_tasks as tasks,
@@ -11,7 +12,7 @@ from aws_cdk import (
 from constructs import Construct
 from apify_client import ApifyClient
 from dotenv import load_dotenv
-from aws_cdk.aws_lambda_python_alpha import PythonFunction
+from aws_cdk.aws_lambda_python_alpha import PythonFunction, PythonLayerVersion
 from aws_cdk import aws_lambda as _lambda, Duration
 import os
 from pathlib import Path
@@ -47,6 +48,9 @@ class IngestionStack(Stack):
         APIFY_TOKEN = os.getenv("APIFY_TOKEN")
         QDRANT_URL = os.getenv("QDRANT_URL")
         QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
+        # Embedding fan-out: chunks per shard, shards encoded in parallel
+        EMBEDDING_SHARD_SIZE = os.getenv("EMBEDDING_SHARD_SIZE", "2000")
+        EMBEDDING_MAP_CONCURRENCY = int(os.getenv("EMBEDDING_MAP_CONCURRENCY", "10"))
         
         # -------------------------
         # Lambda Functions
@@ -57,6 +61,14 @@ class IngestionStack(Stack):
         the handlers 
         """
         
+        # Shared helpers (lambdas/common) -- importable as top-level modules, e.g. `from s3_io import ...`
+        common_layer = PythonLayerVersion(
+                self, "CommonLayer",
+                entry=str(lambdas_dir / "common"),
+                compatible_runtimes=[_lambda.Runtime.PYTHON_3_11],
+                description="Shared ingestion helpers (S3 reader, stage manifests, ...)"
+            )
+        
         # 1. Scrape LinkedIn
         scrape_linkedin = PythonFunction(
                 self, "ScrapeLinkedIn",
@@ -66,10 +78,13 @@ class IngestionStack(Stack):
                 runtime=_lambda.Runtime.PYTHON_3_11,
                 timeout=Duration.minutes(5),
                 memory_size=1024,
-                environment={"APIFY_TOKEN": APIFY_TOKEN}
+                environment={"APIFY_TOKEN": APIFY_TOKEN},
+                layers=[common_layer]
             )
             
-        data_bucket.grant_write(scrape_linkedin, "data/raw/linkedin/*")
+        # Read + list: the first run seeds its manifest from the posts already saved
+        data_bucket.grant_read_write(scrape_linkedin, "data/raw/linkedin/*")
+        data_bucket.grant_read_write(scrape_linkedin, "data/manifests/*")
         
         # 2. Scrape YouTube
         scrape_youtube = PythonFunction(
@@ -79,7 +94,8 @@ class IngestionStack(Stack):
             handler="lambda_handler",                  
             runtime=_lambda.Runtime.PYTHON_3_11,
             memory_size=512,                           
-            timeout=Duration.minutes(10)               
+            timeout=Duration.minutes(10),
+            layers=[common_layer]
         )
 
         data_bucket.grant_read_write(scrape_youtube)
@@ -92,7 +108,8 @@ class IngestionStack(Stack):
                 handler="lambda_handler",
                 runtime=_lambda.Runtime.PYTHON_3_11,
                 timeout=Duration.minutes(5),
-                memory_size=512
+                memory_size=512,
+                layers=[common_layer]
             )
             
         data_bucket.grant_read_write(clean_data)
@@ -105,20 +122,36 @@ class IngestionStack(Stack):
                     handler="lambda_handler",
                     runtime=_lambda.Runtime.PYTHON_3_11,
                     timeout=Duration.minutes(3),
-                    memory_size=1024
+                    memory_size=1024,
+                    layers=[common_layer]
                 )
         data_bucket.grant_read_write(chunk_data)
         
         # 5. Generate Embeddings (Docker image for large ML model)
+        # Built from lambdas/ so the image can include common/embedding_backend.py
         generate_embeddings = _lambda.DockerImageFunction(
                     self, "GenerateEmbeddings",
-                    code=_lambda.DockerImageCode.from_image_asset(str(lambdas_dir / "generate_embeddings")),
+                    code=_lambda.DockerImageCode.from_image_asset(
+                        str(lambdas_dir),
+                        file="generate_embeddings/Dockerfile"
+                    ),
                     timeout=Duration.minutes(15),
                     memory_size=3008,
+                    # merge step memory-maps the previous corpus + shard artifacts from /tmp
+                    ephemeral_storage_size=Size.gibibytes(4),
                     environment={
                             "MODEL_NAME": "mixedbread-ai/mxbai-embed-large-v1",
                             "TRANSFORMERS_CACHE": "/tmp",
-                            "HF_HOME": "/tmp"
+                            "HF_HOME": "/tmp",
+                            # torch | onnx | onnx-int8 -- fp32 ONNX keeps corpus vectors at parity
+                            "EMBEDDING_BACKEND": "onnx",
+                            # float32 | float16 vectors in the corpus artifact
+                            "ARTIFACT_DTYPE": "float32",
+                            "EMBEDDING_SHARD_SIZE": EMBEDDING_SHARD_SIZE,
+                            # length-bucketed batches: batch size x longest text <= this many tokens
+                            "EMBEDDING_TOKEN_BUDGET": "16384",
+                            # >1 -> process pool; 3008 MB gets ~2 vCPUs and every worker holds its own model
+                            "EMBEDDING_WORKERS": "1"
                         }
                 )
 
@@ -135,11 +168,17 @@ class IngestionStack(Stack):
                     memory_size=1024,
                     environment={
                         "QDRANT_URL": QDRANT_URL,
-                        "QDRANT_API_KEY": QDRANT_API_KEY
-                    }
+                        "QDRANT_API_KEY": QDRANT_API_KEY,
+                        # Pipelined uploader (see store_qdrant/uploader.py)
+                        "QDRANT_UPLOAD_CONCURRENCY": "4",
+                        "QDRANT_BATCH_SIZE": "128",
+                        "QDRANT_TRANSPORT": "grpc"
+                    },
+                    layers=[common_layer]
                 )
 
         data_bucket.grant_read(store_qdrant, "data/embedded/*")
+        data_bucket.grant_read_write(store_qdrant, "data/manifests/*")
         
         # -------------------------
         # Step Function Tasks
@@ -210,14 +249,56 @@ class IngestionStack(Stack):
             retry_on_service_exceptions=True
         )
         
-        # Task 5: Generate Embeddings
-        generate_embeddings_task = tasks.LambdaInvoke(
-            self, "GenerateEmbeddingsTask",
+        # Task 5: Generate Embeddings -- plan shards -> encode them in a distributed Map -> merge
+        embedding_event = {
+            "bucket": data_bucket.bucket_name,      
+            "input_key": "data/chunks/final_chunks.json", 
+            "output_key": "data/embedded/mxbai_corpus/",
+            "delta_key": "data/embedded/mxbai_corpus_delta/"
+        }
+        
+        plan_embeddings_task = tasks.LambdaInvoke(
+            self, "PlanEmbeddingShardsTask",
+            lambda_function=generate_embeddings,
+            payload=sfn.TaskInput.from_object({**embedding_event, "action": "plan"}),
+            payload_response_only=True,
+            result_path="$.embedding_plan",
+            retry_on_service_exceptions=True
+        )
+        
+        # Each item is {"action": "encode_shard", "bucket", "shard_key", "output_key"}
+        encode_shard_task = tasks.LambdaInvoke(
+            self, "EncodeEmbeddingShardTask",
+            lambda_function=generate_embeddings,
+            payload=sfn.TaskInput.from_json_path_at("$"),
+            payload_response_only=True,
+            retry_on_service_exceptions=True
+        )
+        # encode_shard is idempotent, a retried shard skips if its artifact exists
+        encode_shard_task.add_retry(
+            errors=["States.ALL"],
+            interval=Duration.seconds(10),
+            max_attempts=2,
+            backoff_rate=2
+        )
+        
+        encode_shards_map = sfn.DistributedMap(
+            self, "EncodeEmbeddingShards",
+            items_path="$.embedding_plan.shards",
+            max_concurrency=EMBEDDING_MAP_CONCURRENCY,
+            result_path=sfn.JsonPath.DISCARD,
+            comment="Encode the new/changed chunk shards in parallel"
+        )
+        encode_shards_map.item_processor(encode_shard_task)
+        
+        merge_embeddings_task = tasks.LambdaInvoke(
+            self, "MergeEmbeddingShardsTask",
             lambda_function=generate_embeddings,
             payload=sfn.TaskInput.from_object({
-                "bucket": data_bucket.bucket_name,      
-                "input_key": "data/chunks/final_chunks.json", 
-                "output_key": "data/embedded/mxbai_corpus.npz"
+                **embedding_event,
+                "action": "merge",
+                "shards": sfn.JsonPath.list_at("$.embedding_plan.shards"),
+                "input_etag": sfn.JsonPath.string_at("$.embedding_plan.input_etag")
             }),
             result_path="$.embedding_result",
             retry_on_service_exceptions=True
@@ -232,8 +313,10 @@ class IngestionStack(Stack):
             lambda_function=store_qdrant,
             payload=sfn.TaskInput.from_object({
                 "input_bucket": data_bucket.bucket_name,
-                "embeddings_key": "data/embedded/mxbai_corpus.npz",
+                "embeddings_key": "data/embedded/mxbai_corpus/",
+                "delta_key": "data/embedded/mxbai_corpus_delta/",
                 "collection_name": "virtual-lenny",
+                "mode": "delta",  # full corpus only when the collection is empty
                 "recreate_collection": False  # Set to True to force recreate
             }),
             result_path="$.qdrant_result",
@@ -295,17 +378,31 @@ class IngestionStack(Stack):
         parallel_scraping.add_catch(scraping_failed, errors=["States.ALL"])
         clean_data_task.add_catch(cleaning_failed, errors=["States.ALL"])
         chunk_data_task.add_catch(chunking_failed, errors=["States.ALL"])
-        generate_embeddings_task.add_catch(embedding_failed, errors=["States.ALL"])
+        plan_embeddings_task.add_catch(embedding_failed, errors=["States.ALL"])
+        encode_shards_map.add_catch(embedding_failed, errors=["States.ALL"])
+        merge_embeddings_task.add_catch(embedding_failed, errors=["States.ALL"])
+        
+        # Unchanged final_chunks.json -> straight to Qdrant (delta mode skips an applied delta)
+        generate_embeddings_steps = (
+            plan_embeddings_task
+            .next(
+                sfn.Choice(self, "EmbeddingsChanged?")
+                .when(
+                    sfn.Condition.string_equals("$.embedding_plan.status", "skipped"),
+                    store_qdrant_task
+                )
+                .otherwise(encode_shards_map.next(merge_embeddings_task).next(store_qdrant_task))
+            )
+        )
         store_qdrant_task.add_catch(qdrant_failed, errors=["States.ALL"])
 
         # 2. Now chain them together
+        store_qdrant_task.next(success_state)
         definition = (
             parallel_scraping
             .next(clean_data_task)
             .next(chunk_data_task)
-            .next(generate_embeddings_task)
-            .next(store_qdrant_task)
-            .next(success_state)
+            .next(generate_embeddings_steps)
         )
 
 
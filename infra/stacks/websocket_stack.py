@@ -6,6 +6,10 @@ from aws_cdk import (
     aws_apigatewayv2_integrations as integrations,
     aws_dynamodb as dynamodb,
     aws_iam as iam,
+    aws_events as events,
+    aws_events_targets as targets,
+    aws_sqs as sqs,
+    aws_lambda_event_sources as event_sources,
     RemovalPolicy,
     CfnOutput
 )
@@ -28,6 +32,13 @@ class WebSocketStack(Stack):
         QDRANT_URL = os.getenv("QDRANT_URL")
         QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
 
+        # Query encoder for the agent: torch | onnx | onnx-int8
+        EMBEDDING_BACKEND = "onnx-int8"
+
+        # When the RAG score is computed: sync (before "done") | thread | queue | stream (see scoring.py)
+        # stream is opt-in, it scores every token while the answer is generated
+        EVALUATION_MODE = "thread"
+
         # -------------------------
         # DynamoDB Table for Connection Tracking
         # -------------------------
@@ -42,6 +53,22 @@ class WebSocketStack(Stack):
             table_name="virtual-lenny-connections"
         )
 
+        # -------------------------
+        # DynamoDB Table for Query Embedding Cache
+        # -------------------------
+        # Persistent tier of the agent's embedding cache, survives cold starts
+        embedding_cache_table = dynamodb.Table(
+            self, "QueryEmbeddingCacheTable",
+            partition_key=dynamodb.Attribute(
+                name="key",
+                type=dynamodb.AttributeType.STRING
+            ),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            removal_policy=RemovalPolicy.DESTROY,
+            time_to_live_attribute="expires_at",
+            table_name="virtual-lenny-query-embeddings"
+        )
+
         # -------------------------
         # Lambda: Connect Handler
         # -------------------------
@@ -74,21 +101,88 @@ class WebSocketStack(Stack):
         connections_table.grant_write_data(disconnect_handler)
 
         
+        # -------------------------
+        # SQS: Answer Evaluation Queue
+        # -------------------------
+        # EVALUATION_MODE=queue: the agent sends "done" and leaves scoring to the worker
+        evaluation_queue = sqs.Queue(
+            self, "EvaluationQueue",
+            visibility_timeout=Duration.seconds(60),
+            retention_period=Duration.hours(1)
+        )
+
         # -------------------------
         # Lambda: Message Handler (RAG Agent) - Docker
         # -------------------------
+        # Built from the repo root so the image can include lambdas/common/embedding_backend.py
+        agent_image = dict(
+            directory=str(root_dir),
+            file="agent/message_handler/Dockerfile",
+            build_args={"EMBEDDING_BACKEND": EMBEDDING_BACKEND},
+            exclude=[
+                ".git", "client", "data-ingestion", "docs", "helpers",
+                "infra", "results", "src", "tests", "**/__pycache__"
+            ]
+        )
         message_handler = _lambda.DockerImageFunction(
             self, "MessageHandler",
-            code=_lambda.DockerImageCode.from_image_asset(
-                str(agent_dir / "message_handler")
-            ),
+            code=_lambda.DockerImageCode.from_image_asset(**agent_image),
             timeout=Duration.minutes(2),
             memory_size=3008,
             environment={
                 "QDRANT_URL": QDRANT_URL,
                 "QDRANT_API_KEY": QDRANT_API_KEY,
+                "EMBEDDING_BACKEND": EMBEDDING_BACKEND,
+                # Build encoder + Qdrant connection during the init phase
+                "PRELOAD_MODEL": "true",
+                # Token coalescing: flush a chunk frame every 16 tokens / 512 bytes / 50 ms
+                "STREAM_FLUSH_TOKENS": "16",
+                "STREAM_FLUSH_BYTES": "512",
+                "STREAM_FLUSH_MS": "50",
+                # Also flush a frame as soon as a sentence ends
+                "STREAM_FLUSH_SENTENCE": "false",
+                # Max frames waiting on the background sender before Bedrock reads block
+                "STREAM_QUEUE_SIZE": "64",
+                # Query embedding cache: in-memory LRU + DynamoDB tier
+                "EMBED_CACHE_SIZE": "1024",
+                "EMBED_CACHE_TTL": "86400",
+                "EMBED_CACHE_BACKEND": "dynamodb",
+                "EMBED_CACHE_TABLE": embedding_cache_table.table_name,
+                # Semantic answer cache: replay answers within this cosine distance
+                "ANSWER_CACHE_SIZE": "256",
+                "ANSWER_CACHE_MAX_DISTANCE": "0.05",
+                "ANSWER_CACHE_TTL": "86400",
+                # Score after "done" on a thread (default), through the evaluation queue, or while tokens stream
+                "EVALUATION_MODE": EVALUATION_MODE,
+                "EVALUATION_QUEUE_URL": evaluation_queue.queue_url,
+                # Shared pool / retries for the Bedrock, API Gateway, SQS and Qdrant clients (see clients.py)
+                "CLIENT_MAX_POOL": "10",
+                "CLIENT_RETRIES": "3",
+                "CLIENT_RETRY_MODE": "standard",
+                "CLIENT_CONNECT_TIMEOUT": "2",
+                "CLIENT_READ_TIMEOUT": "60",
+                "CLIENT_KEEPALIVE_SECONDS": "60",
             }
         )
+        embedding_cache_table.grant_read_write_data(message_handler)
+        evaluation_queue.grant_send_messages(message_handler)
+
+        # -------------------------
+        # Lambda: Evaluation Worker - same image, scoring.lambda_handler
+        # -------------------------
+        # Scores queued answers and posts the evaluation frame to the connection
+        evaluation_worker = _lambda.DockerImageFunction(
+            self, "EvaluationWorker",
+            code=_lambda.DockerImageCode.from_image_asset(**agent_image, cmd=["scoring.lambda_handler"]),
+            timeout=Duration.seconds(30),
+            memory_size=512
+        )
+        evaluation_worker.add_event_source(event_sources.SqsEventSource(
+            evaluation_queue,
+            batch_size=10,
+            max_batching_window=Duration.seconds(0),
+            report_batch_item_failures=True
+        ))
         
         # Grant Bedrock permissions
         message_handler.add_to_role_policy(iam.PolicyStatement(
@@ -142,6 +236,27 @@ class WebSocketStack(Stack):
             )
         )
         
+        # Browser opens the page
+        # → {"action": "warmup"}
+        # → MessageHandler primes encoder + Qdrant, no Bedrock call
+        web_socket_api.add_route(
+            "warmup",
+            integration=integrations.WebSocketLambdaIntegration(
+                "WarmupIntegration",
+                message_handler
+            )
+        )
+
+        # Keep one container warm between users
+        events.Rule(
+            self, "MessageHandlerWarmupRule",
+            schedule=events.Schedule.rate(Duration.minutes(5)),
+            targets=[targets.LambdaFunction(
+                message_handler,
+                event=events.RuleTargetInput.from_object({"warmup": True})
+            )]
+        )
+
         # Deploy stage
         stage = apigwv2.WebSocketStage(
             self, "ProductionStage",
@@ -154,6 +269,7 @@ class WebSocketStack(Stack):
 
         # message_handler Lambda permission to send messages back to connected WebSocket clients. 
         web_socket_api.grant_manage_connections(message_handler)
+        web_socket_api.grant_manage_connections(evaluation_worker)
         
         # -------------------------
         # Outputs
@@ -1,8 +1,12 @@
 import json
 import boto3
+from botocore.config import Config
 from langchain_text_splitters import RecursiveCharacterTextSplitter
+from manifest import StageManifest
+from s3_io import S3_MAX_WORKERS, iter_json_objects, list_objects
 
-s3 = boto3.client('s3')
+# Pool sized for the concurrent reader (see common/s3_io.py)
+s3 = boto3.client('s3', config=Config(max_pool_connections=S3_MAX_WORKERS))
 
 # Initialize splitter
 yt_splitter = RecursiveCharacterTextSplitter(
@@ -24,85 +28,69 @@ def lambda_handler(event, context):
     }
     """
     try:
-    
-        # Check if output already exists
-        try:
-            s3.head_object(Bucket=event['output_bucket'], Key=event['output_key'])
-            print(f"SKIPPING: {event['output_key']} already exists")
+        # Cleaned file key -> ETag + chunk_ids it produced on the last run
+        manifest = StageManifest.load(s3, event['output_bucket'], 'chunk_data')
+        
+        # List every input once (paginated), split into unchanged vs new/changed
+        listing = {}
+        for prefix in event['input_prefixes']:
+            listing[prefix] = sorted(
+                list_objects(s3, event['input_bucket'], prefix, suffix='.json'),
+                key=lambda obj: obj['Key']
+            )
+        
+        all_keys = {obj['Key'] for objects in listing.values() for obj in objects}
+        removed = [key for key in manifest.entries if key not in all_keys]
+        changed = {
+            prefix: [obj for obj in objects if not manifest.is_current(obj['Key'], obj['ETag'])]
+            for prefix, objects in listing.items()
+        }
+        changed_count = sum(len(objects) for objects in changed.values())
+        
+        if manifest.exists and not changed_count and not removed:
+            print(f"SKIPPING: no new or changed inputs for {event['output_key']}")
             return {
                 'statusCode': 200,
                 'body': json.dumps({
                     'total_chunks': 0,
-                    'message': "Output already exists"
+                    'message': "No new or changed inputs"
                 })
             }
-        except s3.exceptions.ClientError as e:
-            if e.response['Error']['Code'] != '404':
-                raise
-
+        
+        # Chunks of unchanged inputs are reused from the previous output
+        previous_chunks = load_previous_chunks(event['output_bucket'], event['output_key']) if manifest.exists else {}
+        
+        for key in removed:
+            manifest.remove(key)
+        
         all_chunks = []
         
         # Process each source
         for prefix in event['input_prefixes']:
             source = 'linkedin' if 'linkedin' in prefix else 'youtube'
             
-            # List files
-            response = s3.list_objects_v2(
-                Bucket=event['input_bucket'],
-                Prefix=prefix
-            )
+            chunks_by_key = {}
+            to_fetch = list(changed[prefix])
+            for obj in listing[prefix]:
+                if not manifest.is_current(obj['Key'], obj['ETag']):
+                    continue
+                chunk_ids = manifest.get(obj['Key'])['outputs']
+                if all(chunk_id in previous_chunks for chunk_id in chunk_ids):
+                    chunks_by_key[obj['Key']] = [previous_chunks[chunk_id] for chunk_id in chunk_ids]
+                else:
+                    # Previous output lost its chunks, redo the file
+                    to_fetch.append(obj)
             
-            if 'Contents' not in response:
-                continue
+            # Files arrive in completion order, keep the output stable by key
+            for obj, data in iter_json_objects(s3, event['input_bucket'], to_fetch):
+                chunks = chunk_document(data, source)
+                chunks_by_key[obj['Key']] = chunks
+                manifest.record(obj['Key'], obj['ETag'], [chunk['chunk_id'] for chunk in chunks])
             
-            print(f"Processing {len(response['Contents'])} {source} files")
+            print(f"Chunked {len(to_fetch)} {source} files, reused {len(chunks_by_key) - len(to_fetch)}")
             
-            for obj in response['Contents']:
-                key = obj['Key']
-                
-                if not key.endswith('.json'):
-                    continue
-                
-                # Read file
-                file_data = s3.get_object(
-                    Bucket=event['input_bucket'],
-                    Key=key
-                )
-                data = json.loads(file_data['Body'].read())
-                
-                text = data.get("text", "")
-                if not text:
-                    continue
-                
-                # Chunk based on source
-                if source == "linkedin":
-                    # Keep LinkedIn posts as single chunks
-                    chunk_data = {
-                        "chunk_id": f"li_{data.get('post_id')}",
-                        "source": "linkedin",
-                        "content": text,
-                        "metadata": {
-                            "url": data.get("url"),
-                            "author": data.get("author", "Lenny Rachitsky")
-                        }
-                    }
-                    all_chunks.append(chunk_data)
-                    
-                elif source == "youtube":
-                    # Split YouTube transcripts
-                    chunks = yt_splitter.split_text(text)
-                    for i, chunk_text in enumerate(chunks):
-                        chunk_data = {
-                            "chunk_id": f"yt_{data.get('video_id')}_{i}",
-                            "source": "youtube",
-                            "content": chunk_text,
-                            "metadata": {
-                                "url": data.get("url"),
-                                "author": "Lenny Rachitsky",
-                                "chunk_index": i
-                            }
-                        }
-                        all_chunks.append(chunk_data)
+            for key in sorted(chunks_by_key):
+                all_chunks.extend(chunks_by_key[key])
         
         # Save all chunks to S3
         s3.put_object(
@@ -112,6 +100,8 @@ def lambda_handler(event, context):
             ContentType='application/json'
         )
         
+        manifest.save()
+        
         print(f"Created {len(all_chunks)} total chunks")
         
         return {
@@ -126,4 +116,51 @@ def lambda_handler(event, context):
         return {
             'statusCode': 500,
             'body': json.dumps({'error': str(e)})
-        }
\ No newline at end of file
+        }
+
+
+def load_previous_chunks(bucket: str, key: str) -> dict:
+    """chunk_id -> chunk from the last final_chunks.json (empty if there is none)"""
+    try:
+        response = s3.get_object(Bucket=bucket, Key=key)
+    except s3.exceptions.ClientError as e:
+        if e.response['Error']['Code'] not in ('NoSuchKey', '404'):
+            raise
+        return {}
+    
+    return {chunk['chunk_id']: chunk for chunk in json.loads(response['Body'].read())}
+
+
+def chunk_document(data: dict, source: str) -> list:
+    """Turn one cleaned LinkedIn post / YouTube transcript into chunk dicts"""
+    text = data.get("text", "")
+    if not text:
+        return []
+    
+    # Chunk based on source
+    if source == "linkedin":
+        # Keep LinkedIn posts as single chunks
+        return [{
+            "chunk_id": f"li_{data.get('post_id')}",
+            "source": "linkedin",
+            "content": text,
+            "metadata": {
+                "url": data.get("url"),
+                "author": data.get("author", "Lenny Rachitsky")
+            }
+        }]
+    
+    # Split YouTube transcripts
+    chunks = []
+    for i, chunk_text in enumerate(yt_splitter.split_text(text)):
+        chunks.append({
+            "chunk_id": f"yt_{data.get('video_id')}_{i}",
+            "source": "youtube",
+            "content": chunk_text,
+            "metadata": {
+                "url": data.get("url"),
+                "author": "Lenny Rachitsky",
+                "chunk_index": i
+            }
+        })
+    return chunks
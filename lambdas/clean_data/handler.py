@@ -2,9 +2,13 @@ import json
 import boto3
 import re
 import unicodedata
+from botocore.config import Config
 from typing import Dict
+from manifest import StageManifest
+from s3_io import S3_MAX_WORKERS, iter_json_objects, list_objects
 
-s3 = boto3.client('s3')
+# Pool sized for the concurrent reader (see common/s3_io.py)
+s3 = boto3.client('s3', config=Config(max_pool_connections=S3_MAX_WORKERS))
 
 def lambda_handler(event, context):
     """
@@ -20,7 +24,10 @@ def lambda_handler(event, context):
     """
 
     print("Event Received:", event)
+    manifest = None
     try:
+        # Input key -> ETag of the version that was last cleaned
+        manifest = StageManifest.load(s3, event['output_bucket'], 'clean_data')
         cleaned_count = 0
         
         # Process each source type
@@ -30,30 +37,15 @@ def lambda_handler(event, context):
         ):
             source_type = 'linkedin' if 'linkedin' in input_prefix else 'youtube'
             
-            # List all files in input prefix
-            response = s3.list_objects_v2(
-                Bucket=event['input_bucket'],
-                Prefix=input_prefix
+            # List all files in input prefix (paginated), fetch only new or changed ones
+            objects = (
+                obj for obj in list_objects(s3, event['input_bucket'], input_prefix, suffix='.json')
+                if not manifest.is_current(obj['Key'], obj['ETag'])
             )
 
-            # print(response)
-            
-            if 'Contents' not in response:
-                continue
-            
-            for obj in response['Contents']:
+            for obj, data in iter_json_objects(s3, event['input_bucket'], objects):
                 key = obj['Key']
                 
-                if not key.endswith('.json'):
-                    continue
-                
-                # Read raw data
-                raw_data = s3.get_object(
-                    Bucket=event['input_bucket'],
-                    Key=key
-                )
-                data = json.loads(raw_data['Body'].read())
-                
                 # Clean based on source type
                 if source_type == 'linkedin':
                     cleaned_data = clean_linkedin_data(data)
@@ -62,23 +54,18 @@ def lambda_handler(event, context):
 
                 output_key = key.replace(input_prefix, output_prefix)
 
-                try:
-                    s3.head_object(Bucket=event['output_bucket'], Key=output_key)
-                    print(f"SKIPPING: {output_key} already exists")
-                    continue
-                except s3.exceptions.ClientError as e:
-
-                    if e.response['Error']['Code'] == '404':
-                        s3.put_object(
-                            Bucket=event['output_bucket'],
-                            Key=output_key,
-                            Body=json.dumps(cleaned_data, indent=2, ensure_ascii=False),
-                            ContentType='application/json'
-                        )
-                        cleaned_count += 1
-                        print(f"Saved: {output_key}")
-                    else:
-                        raise
+                s3.put_object(
+                    Bucket=event['output_bucket'],
+                    Key=output_key,
+                    Body=json.dumps(cleaned_data, indent=2, ensure_ascii=False),
+                    ContentType='application/json'
+                )
+                manifest.record(key, obj['ETag'], [output_key])
+                cleaned_count += 1
+                print(f"Saved: {output_key}")
+        
+        manifest.save()
+        print(f"Cleaned {cleaned_count} new or changed files")
         
         return {
             'statusCode': 200,
@@ -88,6 +75,9 @@ def lambda_handler(event, context):
         }
         
     except Exception as e:
+        # Keep the progress made so far, the next run resumes from there
+        if manifest:
+            manifest.save()
         return {
             'statusCode': 500,
             'body': json.dumps({'error': str(e)})
@@ -0,0 +1,277 @@
+"""
+Embedding Artifact Format (v1)
+
+Columnar replacement for the pickled NPZ, one S3 prefix per artifact:
+    <prefix>/embeddings.npy - raw float32 / float16 matrix, memory-mappable
+    <prefix>/chunks.jsonl   - one chunk payload per line, row-aligned with the
+                              matrix, each line carries its content_hash
+    <prefix>/header.json    - format version, model, dim, dtype, normalization,
+                              count, content_digest (+ deleted_ids and
+                              base_version / target_version, the corpus
+                              header ETags a delta goes from and to)
+
+header.json is uploaded last, so a fresh prefix has no header until its data
+files are in place. Overwriting a prefix is not atomic: a reader running during
+the upload can pair the new header with old files (or the reverse), so writers
+and readers of the same prefix must not overlap (the pipeline runs them in
+sequence).
+
+S3ArtifactReader streams an artifact straight from S3 (ranged GETs for the
+matrix, a streamed body for the payload lines) in constant memory.
+"""
+
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+FORMAT_NAME = "virtual-lenny-embeddings"
+FORMAT_VERSION = 1
+
+HEADER_FILE = "header.json"
+VECTORS_FILE = "embeddings.npy"
+PAYLOAD_FILE = "chunks.jsonl"
+
+DTYPES = ("float32", "float16")
+
+
+def write_artifact(
+    path: str,
+    embeddings: np.ndarray,
+    chunks: List[Dict],
+    content_hashes: List[str],
+    model: str,
+    normalized: bool = False,
+    dtype: str = "float32",
+    deleted_ids: Optional[List[str]] = None,
+    base_version: Optional[str] = None,
+    target_version: Optional[str] = None
+) -> Dict[str, Any]:
+    """Write the artifact into a local directory, returns the header"""
+    if dtype not in DTYPES:
+        raise ValueError(f"Unknown dtype '{dtype}', expected one of {DTYPES}")
+    if len(embeddings) != len(chunks) or len(chunks) != len(content_hashes):
+        raise ValueError("embeddings, chunks and content_hashes must have the same length")
+
+    os.makedirs(path, exist_ok=True)
+    dim = int(embeddings.shape[1]) if embeddings.ndim == 2 else 0
+
+    np.save(os.path.join(path, VECTORS_FILE), np.ascontiguousarray(embeddings, dtype=dtype))
+
+    with open(os.path.join(path, PAYLOAD_FILE), "w", encoding="utf-8") as f:
+        for chunk, digest in zip(chunks, content_hashes):
+            f.write(json.dumps(dict(chunk, content_hash=digest), ensure_ascii=False) + "\n")
+
+    header = {
+        "format": FORMAT_NAME,
+        "version": FORMAT_VERSION,
+        "model": model,
+        "dim": dim,
+        "dtype": dtype,
+        "normalized": normalized,
+        "count": len(chunks),
+        # Changes with any chunk, so the header's ETag identifies the content
+        "content_digest": hashlib.sha256("\n".join(content_hashes).encode("utf-8")).hexdigest(),
+        "created_at": int(time.time()),
+        "deleted_ids": list(deleted_ids or []),
+        "base_version": base_version,
+        "target_version": target_version
+    }
+    with open(os.path.join(path, HEADER_FILE), "w") as f:
+        json.dump(header, f, indent=2)
+
+    return header
+
+
+def read_header(path: str) -> Dict[str, Any]:
+    with open(os.path.join(path, HEADER_FILE)) as f:
+        header = json.load(f)
+
+    if header.get("format") != FORMAT_NAME or header.get("version", 0) > FORMAT_VERSION:
+        raise ValueError(f"Unsupported artifact at {path}: {header.get('format')} v{header.get('version')}")
+    return header
+
+
+def open_vectors(path: str, mmap: bool = True) -> np.ndarray:
+    """The embedding matrix, memory-mapped by default (pages load on access)"""
+    return np.load(os.path.join(path, VECTORS_FILE), mmap_mode="r" if mmap else None)
+
+
+def iter_payloads(path: str) -> Iterator[Tuple[Dict, str]]:
+    """Yield (chunk, content_hash) line by line"""
+    with open(os.path.join(path, PAYLOAD_FILE), encoding="utf-8") as f:
+        for line in f:
+            chunk = json.loads(line)
+            yield chunk, chunk.pop("content_hash")
+
+
+def load_artifact(path: str, mmap: bool = True) -> Tuple[Dict, np.ndarray, List[Dict], List[str]]:
+    """(header, vectors, chunks, content_hashes) from a local directory"""
+    header = read_header(path)
+    vectors = open_vectors(path, mmap=mmap)
+
+    chunks, content_hashes = [], []
+    for chunk, digest in iter_payloads(path):
+        chunks.append(chunk)
+        content_hashes.append(digest)
+
+    return header, vectors, chunks, content_hashes
+
+
+def iter_batches(path: str, batch_size: int = 256) -> Iterator[Tuple[List[Dict], np.ndarray, List[str]]]:
+    """Stream (chunks, float32 vectors, content_hashes) batches without loading everything"""
+    vectors = open_vectors(path)
+    chunks, content_hashes = [], []
+    start = 0
+
+    for chunk, digest in iter_payloads(path):
+        chunks.append(chunk)
+        content_hashes.append(digest)
+        if len(chunks) == batch_size:
+            yield chunks, np.asarray(vectors[start:start + batch_size], dtype=np.float32), content_hashes
+            start += batch_size
+            chunks, content_hashes = [], []
+
+    if chunks:
+        yield chunks, np.asarray(vectors[start:start + len(chunks)], dtype=np.float32), content_hashes
+
+
+def upload_artifact(s3, bucket: str, prefix: str, path: str) -> None:
+    """Upload a local artifact directory, header last (not atomic when overwriting, see module docstring)"""
+    prefix = prefix.rstrip("/") + "/"
+    for name in (VECTORS_FILE, PAYLOAD_FILE, HEADER_FILE):
+        s3.upload_file(os.path.join(path, name), bucket, prefix + name)
+
+
+def save_artifact(s3, bucket: str, prefix: str, embeddings: np.ndarray, chunks, content_hashes, **header_fields) -> Dict:
+    """write_artifact + upload_artifact through a scratch dir in /tmp"""
+    path = tempfile.mkdtemp()
+    try:
+        header = write_artifact(path, embeddings, chunks, content_hashes, **header_fields)
+        upload_artifact(s3, bucket, prefix, path)
+        return header
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def download_artifact(s3, bucket: str, prefix: str, path: Optional[str] = None) -> str:
+    """Download an artifact into a local directory (a new temp dir by default)"""
+    created = path is None
+    path = path or tempfile.mkdtemp()
+    prefix = prefix.rstrip("/") + "/"
+    try:
+        for name in (HEADER_FILE, VECTORS_FILE, PAYLOAD_FILE):
+            s3.download_file(bucket, prefix + name, os.path.join(path, name))
+    except Exception:
+        if created:
+            shutil.rmtree(path, ignore_errors=True)
+        raise
+    return path
+
+
+def header_key(prefix: str) -> str:
+    return prefix.rstrip("/") + "/" + HEADER_FILE
+
+
+class S3ArtifactReader:
+    """
+    Stream (chunk, vector, content_hash) rows from an artifact in S3 without
+    downloading it: the matrix is read with ranged GETs of ~range_bytes (the
+    next range is prefetched while the current one is consumed) and the
+    payload file is read line by line from the response stream.
+    """
+
+    def __init__(self, s3, bucket: str, prefix: str, range_bytes: int = 8 * 1024 * 1024):
+        self.s3 = s3
+        self.bucket = bucket
+        self.prefix = prefix.rstrip("/") + "/"
+        self.range_bytes = range_bytes
+
+        response = s3.get_object(Bucket=bucket, Key=self.prefix + HEADER_FILE)
+        self.header = json.loads(response["Body"].read())
+        self.etag = response.get("ETag")
+        if self.header.get("format") != FORMAT_NAME or self.header.get("version", 0) > FORMAT_VERSION:
+            raise ValueError(f"Unsupported artifact at s3://{bucket}/{self.prefix}")
+
+        self.count = self.header["count"]
+        self.dim = self.header["dim"]
+        self.dtype = np.dtype(self.header["dtype"])
+        self.rows_per_range = max(1, range_bytes // max(self.dim * self.dtype.itemsize, 1))
+        self._data_offset = self._read_npy_offset()
+
+    def _get_range(self, start: int, end: int) -> bytes:
+        """Inclusive byte range of embeddings.npy"""
+        response = self.s3.get_object(
+            Bucket=self.bucket,
+            Key=self.prefix + VECTORS_FILE,
+            Range=f"bytes={start}-{end}"
+        )
+        return response["Body"].read()
+
+    def _read_npy_offset(self) -> int:
+        """Parse the .npy header from its first bytes, return where the data starts"""
+        if self.count == 0:
+            return 0
+        head = io.BytesIO(self._get_range(0, 4095))
+        version = np.lib.format.read_magic(head)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(head)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(head)
+        if shape != (self.count, self.dim) or fortran_order or dtype != self.dtype:
+            raise ValueError(f"embeddings.npy {shape}/{dtype} does not match header.json")
+        return head.tell()
+
+    def iter_payloads(self) -> Iterator[Tuple[Dict, str]]:
+        """(chunk, content_hash) streamed line by line"""
+        response = self.s3.get_object(Bucket=self.bucket, Key=self.prefix + PAYLOAD_FILE)
+        for line in response["Body"].iter_lines():
+            if line:
+                chunk = json.loads(line)
+                yield chunk, chunk.pop("content_hash")
+
+    def iter_vector_blocks(self, needed=None) -> Iterator[Tuple[int, Optional[np.ndarray]]]:
+        """
+        (first row, float32 block) per ranged GET, the next range is prefetched.
+        needed(start, end) -> False skips the GET for that block (yields None).
+        """
+        row_bytes = self.dim * self.dtype.itemsize
+        starts = list(range(0, self.count, self.rows_per_range))
+
+        def fetch(row_start):
+            row_end = min(row_start + self.rows_per_range, self.count)
+            if needed is not None and not needed(row_start, row_end):
+                return None
+            data = self._get_range(
+                self._data_offset + row_start * row_bytes,
+                self._data_offset + row_end * row_bytes - 1
+            )
+            return np.frombuffer(data, dtype=self.dtype).reshape(row_end - row_start, self.dim).astype(np.float32)
+
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            pending = pool.submit(fetch, starts[0]) if starts else None
+            for i, row_start in enumerate(starts):
+                block = pending.result()
+                pending = pool.submit(fetch, starts[i + 1]) if i + 1 < len(starts) else None
+                yield row_start, block
+
+    def iter_rows(self, only: Optional[set] = None) -> Iterator[Tuple[Dict, np.ndarray, str]]:
+        """(chunk, vector, content_hash) in artifact order, optionally only for row indices in `only`"""
+        needed = None
+        if only is not None:
+            needed = lambda start, end: any(i in only for i in range(start, end))
+
+        payloads = self.iter_payloads()
+        for row_start, block in self.iter_vector_blocks(needed):
+            row_end = min(row_start + self.rows_per_range, self.count)
+            for index in range(row_start, row_end):
+                chunk, digest = next(payloads)
+                if block is not None and (only is None or index in only):
+                    yield chunk, block[index - row_start], digest
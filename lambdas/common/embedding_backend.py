@@ -0,0 +1,546 @@
+"""
+Embedding Backends
+
+One encode() interface over three ways of running mxbai-embed-large-v1 on CPU:
+1. torch     - SentenceTransformer with fp32 PyTorch (reference)
+2. onnx      - ONNX Runtime with an fp32 graph exported from the same weights
+3. onnx-int8 - ONNX Runtime with dynamically quantized int8 weights
+
+The ONNX graphs are exported at image build time:
+    python embedding_backend.py export /var/task/mxbai_model /var/task/mxbai_onnx
+
+encode_length_bucketed() schedules a corpus over any of them: texts are sorted
+by token length and batched under a token budget, so short LinkedIn posts are
+not padded to the length of 2000-char transcript chunks.
+
+encode_multiprocess() spreads a bulk encode over worker processes with pinned
+thread counts, writing vectors straight into one shared output matrix.
+"""
+
+import inspect
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List, Optional, Tuple, Union
+
+import numpy as np
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+MODEL_PATH = "/var/task/mxbai_model"
+ONNX_MODEL_PATH = "/var/task/mxbai_onnx"
+
+ONNX_FP32_FILE = "model.onnx"
+ONNX_INT8_FILE = "model_int8.onnx"
+
+# Padded tokens per batch (batch size x longest text), bounds activation memory
+TOKEN_BUDGET = 16384
+
+
+class TorchEncoder:
+    """Reference backend: SentenceTransformer on fp32 PyTorch"""
+
+    name = "torch"
+
+    def __init__(self, model_path: str = MODEL_PATH, device: str = "cpu"):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(model_path, device=device)
+        self.tokenizer = self.model.tokenizer
+        self.max_length = self.model.max_seq_length
+
+    def encode(
+        self,
+        texts: Union[str, List[str]],
+        batch_size: int = 32,
+        normalize: bool = False
+    ) -> np.ndarray:
+        return self.model.encode(
+            texts,
+            batch_size=batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=normalize
+        ).astype(np.float32)
+
+    def token_lengths(self, texts: List[str]) -> List[int]:
+        encoded = self.tokenizer(texts, truncation=True, max_length=self.max_length)
+        return [len(ids) for ids in encoded["input_ids"]]
+
+
+class OnnxEncoder:
+    """
+    ONNX Runtime backend.
+
+    Tokenizes with the fast tokenizer saved next to the graph and applies the
+    same pooling as the SentenceTransformer config (CLS for mxbai).
+    """
+
+    def __init__(
+        self,
+        onnx_path: str = ONNX_MODEL_PATH,
+        quantized: bool = False,
+        num_threads: Optional[int] = None
+    ):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self.name = "onnx-int8" if quantized else "onnx"
+
+        with open(os.path.join(onnx_path, "encoder_config.json")) as f:
+            config = json.load(f)
+        self.max_length = config["max_length"]
+        self.pooling = config["pooling"]
+
+        tokenizer_file = os.path.join(onnx_path, "tokenizer.json")
+        self.tokenizer = Tokenizer.from_file(tokenizer_file)
+        self.tokenizer.enable_truncation(max_length=self.max_length)
+        self.tokenizer.enable_padding(pad_id=config["pad_token_id"], pad_token=config["pad_token"])
+
+        # Unpadded copy, only used to measure token lengths
+        self._length_tokenizer = Tokenizer.from_file(tokenizer_file)
+        self._length_tokenizer.enable_truncation(max_length=self.max_length)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = num_threads or int(
+            os.environ.get("ORT_NUM_THREADS", os.cpu_count() or 1)
+        )
+
+        model_file = os.path.join(onnx_path, ONNX_INT8_FILE if quantized else ONNX_FP32_FILE)
+        if os.path.exists(optimized_path(model_file)):
+            # Graph was already optimized and serialized at build time, skip that work at init
+            model_file = optimized_path(model_file)
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+
+        self.session = ort.InferenceSession(
+            model_file,
+            sess_options=options,
+            providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def encode(
+        self,
+        texts: Union[str, List[str]],
+        batch_size: int = 32,
+        normalize: bool = False
+    ) -> np.ndarray:
+        single = isinstance(texts, str)
+        if single:
+            texts = [texts]
+
+        outputs = []
+        for start in range(0, len(texts), batch_size):
+            outputs.append(self._encode_batch(texts[start:start + batch_size]))
+
+        embeddings = np.concatenate(outputs) if outputs else np.zeros((0, 0), dtype=np.float32)
+        if normalize and len(embeddings):
+            embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+        return embeddings[0] if single else embeddings
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.zeros_like(input_ids)
+
+        hidden = self.session.run(None, feeds)[0]
+
+        if self.pooling == "cls":
+            return hidden[:, 0].astype(np.float32)
+
+        # mean pooling over real (non-padding) tokens
+        mask = attention_mask[..., None].astype(np.float32)
+        return ((hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)).astype(np.float32)
+
+    def token_lengths(self, texts: List[str]) -> List[int]:
+        return [len(e.ids) for e in self._length_tokenizer.encode_batch(texts)]
+
+
+def encode_length_bucketed(
+    encoder,
+    texts: List[str],
+    token_budget: Optional[int] = None,
+    max_batch_size: int = 256,
+    normalize: bool = False
+) -> Tuple[np.ndarray, dict]:
+    """
+    Encode texts longest-first in batches of similar token length.
+
+    A batch grows while (batch size x its longest text) stays within
+    token_budget (EMBEDDING_TOKEN_BUDGET), so long chunks get small batches and
+    short posts large ones at the same peak memory. Rows come back in the
+    original order, with (embeddings, stats) where stats reports padding
+    and tokens/s.
+    """
+    token_budget = token_budget or int(os.environ.get("EMBEDDING_TOKEN_BUDGET", TOKEN_BUDGET))
+    started = time.perf_counter()
+
+    lengths = np.asarray(encoder.token_lengths(texts) if texts else [], dtype=np.int64)
+    # Stable, longest first: the largest activations are hit on the first batch
+    order = np.argsort(-lengths, kind="stable")
+
+    batches = []
+    start = 0
+    while start < len(order):
+        longest = max(int(lengths[order[start]]), 1)
+        size = max(1, min(max_batch_size, token_budget // longest))
+        batches.append(order[start:start + size])
+        start += size
+
+    embeddings = None
+    padded_tokens = 0
+    for batch in batches:
+        vectors = encoder.encode([texts[i] for i in batch], batch_size=len(batch), normalize=normalize)
+        if embeddings is None:
+            embeddings = np.zeros((len(texts), vectors.shape[1]), dtype=np.float32)
+        embeddings[batch] = vectors
+        padded_tokens += len(batch) * int(lengths[batch[0]])
+
+    seconds = time.perf_counter() - started
+    tokens = int(lengths.sum())
+    stats = {
+        "texts": len(texts),
+        "batches": len(batches),
+        "tokens": tokens,
+        "padded_tokens": padded_tokens,
+        "padding_ratio": round(1 - tokens / padded_tokens, 4) if padded_tokens else 0.0,
+        "seconds": round(seconds, 3),
+        "tokens_per_second": round(tokens / seconds, 1) if seconds > 0 else 0.0
+    }
+    if embeddings is None:
+        embeddings = np.zeros((0, 0), dtype=np.float32)
+    return embeddings, stats
+
+
+class SharedMatrix:
+    """
+    float32 matrix that worker processes write into: POSIX shared memory, or a
+    memmap under /tmp where /dev/shm does not exist (AWS Lambda).
+    Pass .handle (JSON-serializable) to another process and open it there with
+    SharedMatrix.attach().
+    """
+
+    def __init__(self, shape: Tuple[int, int], handle: Optional[tuple] = None):
+        self.shape = tuple(shape)
+        self._shm = None
+        self._owner = handle is None
+        nbytes = max(int(np.prod(self.shape)) * 4, 1)
+
+        if handle is None:
+            try:
+                from multiprocessing import shared_memory
+                self._shm = shared_memory.SharedMemory(create=True, size=nbytes)
+                self.handle = ("shm", self._shm.name, self.shape)
+            except OSError:
+                fd, path = tempfile.mkstemp(suffix=".f32")
+                os.close(fd)
+                np.memmap(path, dtype=np.float32, mode="w+", shape=self.shape).flush()
+                self.handle = ("file", path, self.shape)
+        else:
+            self.handle = handle
+            if handle[0] == "shm":
+                from multiprocessing import resource_tracker, shared_memory
+                self._shm = shared_memory.SharedMemory(name=handle[1])
+                # Attaching registers the segment with this process's tracker, which
+                # would unlink it on exit; only the owner frees it
+                resource_tracker.unregister(self._shm._name, "shared_memory")
+
+        if self._shm is not None:
+            self.array = np.ndarray(self.shape, dtype=np.float32, buffer=self._shm.buf)
+        else:
+            self.array = np.memmap(self.handle[1], dtype=np.float32, mode="r+", shape=self.shape)
+
+    @classmethod
+    def attach(cls, handle: tuple) -> "SharedMatrix":
+        return cls(handle[2], handle=handle)
+
+    def close(self) -> None:
+        """Release this process's view, the owner also frees the memory / file"""
+        if isinstance(self.array, np.memmap):
+            self.array.flush()
+        self.array = None
+        if self._shm is not None:
+            self._shm.close()
+            if self._owner:
+                self._shm.unlink()
+        elif self._owner:
+            os.unlink(self.handle[1])
+
+
+def run_worker() -> None:
+    """
+    `python embedding_backend.py worker`: one encode_multiprocess() process.
+    JSON lines on stdin/stdout: job in -> {"dim"} out -> output handle in -> stats out.
+    """
+    protocol = os.fdopen(os.dup(1), "w")
+    os.dup2(2, 1)  # model loading chatter goes to stderr, stdout is the protocol
+
+    job = json.loads(sys.stdin.readline())
+    if job["cores"] and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, job["cores"])
+
+    encoder = load_encoder(job["backend"], model_path=job["model_path"], onnx_path=job["onnx_path"])
+    if encoder.name == "torch":
+        import torch
+        torch.set_num_threads(job["threads"])
+
+    protocol.write(json.dumps({"dim": int(encoder.encode(["dim"]).shape[1])}) + "\n")
+    protocol.flush()
+
+    output = SharedMatrix.attach(tuple(json.loads(sys.stdin.readline())))
+    embeddings, stats = encode_length_bucketed(encoder, job["texts"])
+    output.array[job["indices"]] = embeddings
+    output.close()
+
+    protocol.write(json.dumps(stats) + "\n")
+    protocol.flush()
+
+
+def encode_multiprocess(
+    texts: List[str],
+    workers: Optional[int] = None,
+    threads_per_worker: Optional[int] = None,
+    backend: Optional[str] = None,
+    model_path: str = MODEL_PATH,
+    onnx_path: str = ONNX_MODEL_PATH,
+    worker_command: Optional[List[str]] = None
+) -> Tuple[np.ndarray, dict]:
+    """
+    Encode texts with `workers` processes (EMBEDDING_WORKERS) of
+    `threads_per_worker` threads each (EMBEDDING_THREADS_PER_WORKER, defaults
+    to an even split of the available cores). Each worker is pinned to its own
+    cores when there are enough of them.
+
+    Texts are dealt round-robin in length order so every worker gets the same
+    mix of short and long chunks, and each worker length-buckets its share.
+    Workers are plain subprocesses (not multiprocessing spawn), so the calling
+    script or the Lambda bootstrap is never re-imported. worker_command
+    replaces `python embedding_backend.py worker` with any process that speaks
+    the run_worker() protocol (tests start one with a stand-in encoder).
+    """
+    cores = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+    workers = max(1, min(workers or int(os.environ.get("EMBEDDING_WORKERS", len(cores))), len(texts) or 1))
+    threads = threads_per_worker or int(os.environ.get("EMBEDDING_THREADS_PER_WORKER", 0)) or max(1, len(cores) // workers)
+
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32), {"texts": 0, "workers": workers, "threads_per_worker": threads}
+
+    started = time.perf_counter()
+    backend = backend or os.environ.get("EMBEDDING_BACKEND", "torch")
+    env = dict(os.environ, OMP_NUM_THREADS=str(threads), MKL_NUM_THREADS=str(threads), ORT_NUM_THREADS=str(threads))
+
+    # Character length is a good enough proxy to balance the shares
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+
+    processes = []
+    for worker in range(workers):
+        indices = order[worker::workers]
+        process = subprocess.Popen(
+            worker_command or [sys.executable, os.path.abspath(__file__), "worker"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            env=env,
+            text=True
+        )
+        process.stdin.write(json.dumps({
+            "backend": backend,
+            "model_path": model_path,
+            "onnx_path": onnx_path,
+            "threads": threads,
+            "cores": cores[worker * threads:(worker + 1) * threads] if len(cores) >= workers * threads else None,
+            "texts": [texts[i] for i in indices],
+            "indices": indices
+        }) + "\n")
+        process.stdin.flush()
+        processes.append(process)
+
+    def receive(worker: int) -> dict:
+        line = processes[worker].stdout.readline()
+        if not line:
+            raise RuntimeError(f"Encoding worker {worker} exited with code {processes[worker].wait()}")
+        return json.loads(line)
+
+    output = None
+    try:
+        dims = [receive(w)["dim"] for w in range(workers)]
+        output = SharedMatrix((len(texts), dims[0]))
+        for process in processes:
+            process.stdin.write(json.dumps(output.handle) + "\n")
+            process.stdin.flush()
+
+        worker_stats = [receive(w) for w in range(workers)]
+        embeddings = np.array(output.array)
+    finally:
+        for process in processes:
+            process.stdin.close()
+            if process.poll() is None:
+                try:
+                    process.wait(timeout=5)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+        if output is not None:
+            output.close()
+
+    seconds = time.perf_counter() - started
+    tokens = sum(s["tokens"] for s in worker_stats)
+    padded_tokens = sum(s["padded_tokens"] for s in worker_stats)
+    return embeddings, {
+        "texts": len(texts),
+        "workers": workers,
+        "threads_per_worker": threads,
+        "batches": sum(s["batches"] for s in worker_stats),
+        "tokens": tokens,
+        "padded_tokens": padded_tokens,
+        "padding_ratio": round(1 - tokens / padded_tokens, 4) if padded_tokens else 0.0,
+        "seconds": round(seconds, 3),
+        # Wall clock incl. process start + model load, what a bulk run actually sees
+        "tokens_per_second": round(tokens / seconds, 1) if seconds > 0 else 0.0,
+        "encode_seconds": max(s["seconds"] for s in worker_stats)
+    }
+
+
+def optimized_path(model_file: str) -> str:
+    """model.onnx -> model.opt.onnx"""
+    return model_file[:-len(".onnx")] + ".opt.onnx"
+
+
+def load_encoder(
+    backend: Optional[str] = None,
+    model_path: str = MODEL_PATH,
+    onnx_path: str = ONNX_MODEL_PATH
+):
+    """
+    Build the encoder selected by `backend` or the EMBEDDING_BACKEND env var
+    (defaults to torch).
+    """
+    backend = (backend or os.environ.get("EMBEDDING_BACKEND", "torch")).lower()
+
+    if backend == "torch":
+        return TorchEncoder(model_path)
+    if backend == "onnx":
+        return OnnxEncoder(onnx_path, quantized=False)
+    if backend == "onnx-int8":
+        return OnnxEncoder(onnx_path, quantized=True)
+
+    raise ValueError(f"Unknown embedding backend '{backend}', expected one of {BACKENDS}")
+
+
+def export_onnx(model_path: str, onnx_path: str, quantize: bool = True) -> None:
+    """
+    Export a saved SentenceTransformer to ONNX (+ int8 dynamic quantization).
+
+    Writes into onnx_path:
+    - model.onnx / model_int8.onnx
+    - model.opt.onnx / model_int8.opt.onnx (pre-optimized, ready-to-run graphs)
+    - tokenizer.json
+    - encoder_config.json (pooling, max_length, padding token)
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    os.makedirs(onnx_path, exist_ok=True)
+
+    st_model = SentenceTransformer(model_path, device="cpu")
+    transformer = st_model[0].auto_model.eval()
+    tokenizer = st_model.tokenizer
+
+    pooling_module = st_model[1]
+    # sentence-transformers 2.x exposes pooling_mode_cls_token, newer versions pooling_mode
+    is_cls = (
+        getattr(pooling_module, "pooling_mode_cls_token", False) or
+        getattr(pooling_module, "pooling_mode", None) == "cls"
+    )
+    pooling = "cls" if is_cls else "mean"
+
+    dummy = tokenizer(["export"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in dummy]
+
+    class _Wrapper(torch.nn.Module):
+        """Pin the positional input order, it differs between transformers versions"""
+
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *inputs):
+            return self.model(**dict(zip(input_names, inputs))).last_hidden_state
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    # Newer torch defaults to the dynamo exporter, keep the TorchScript one
+    export_kwargs = {}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        export_kwargs["dynamo"] = False
+
+    fp32_file = os.path.join(onnx_path, ONNX_FP32_FILE)
+    print(f"Exporting ONNX graph to {fp32_file}")
+    with torch.no_grad():
+        torch.onnx.export(
+            _Wrapper(transformer),
+            tuple(dummy[name] for name in input_names),
+            fp32_file,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=14,
+            **export_kwargs
+        )
+
+    tokenizer.backend_tokenizer.save(os.path.join(onnx_path, "tokenizer.json"))
+    with open(os.path.join(onnx_path, "encoder_config.json"), "w") as f:
+        json.dump({
+            "pooling": pooling,
+            "max_length": st_model.max_seq_length,
+            "pad_token": tokenizer.pad_token,
+            "pad_token_id": tokenizer.pad_token_id
+        }, f, indent=2)
+
+    model_files = [fp32_file]
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        int8_file = os.path.join(onnx_path, ONNX_INT8_FILE)
+        print(f"Quantizing to int8: {int8_file}")
+        quantize_dynamic(fp32_file, int8_file, weight_type=QuantType.QInt8)
+        model_files.append(int8_file)
+
+    # Serialize the optimized graphs so the Lambda init phase only has to load them.
+    # EXTENDED (not ALL) keeps the saved graph portable across CPU types.
+    import onnxruntime as ort
+
+    for model_file in model_files:
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED
+        options.optimized_model_filepath = optimized_path(model_file)
+        ort.InferenceSession(model_file, sess_options=options, providers=["CPUExecutionProvider"])
+        print(f"Saved optimized graph: {optimized_path(model_file)}")
+
+
+def cosine_drift(reference: np.ndarray, candidate: np.ndarray) -> dict:
+    """Row-wise cosine similarity between two embedding matrices"""
+    ref = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    cand = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+    cos = (ref * cand).sum(axis=1)
+    return {
+        "mean_cosine": round(float(cos.mean()), 6),
+        "min_cosine": round(float(cos.min()), 6),
+        "max_drift": round(float(1.0 - cos.min()), 6)
+    }
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 3 and sys.argv[1] == "export":
+        export_onnx(sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else ONNX_MODEL_PATH)
+    elif len(sys.argv) == 2 and sys.argv[1] == "worker":
+        run_worker()
+    else:
+        print("Usage: python embedding_backend.py export <model_path> [onnx_path]")
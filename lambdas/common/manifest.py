@@ -0,0 +1,117 @@
+"""
+Stage Manifests
+
+One JSON object per pipeline stage recording what was already processed:
+
+    s3://<bucket>/data/manifests/<stage>.json
+    {
+        "stage": "clean_data",
+        "updated_at": 1718000000,
+        "entries": {
+            "<input id>": {"etag": "<content hash>", "outputs": ["<output key>", ...]}
+        }
+    }
+
+It is loaded once per run, so "was this input already processed?" is a dict
+lookup instead of a head_object round-trip per item.
+"""
+
+import hashlib
+import json
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+MANIFEST_PREFIX = "data/manifests/"
+
+
+def content_hash(*parts: Any) -> str:
+    """Stable sha256 over JSON-serialized parts"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(json.dumps(part, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class StageManifest:
+    """Processed-input record for a single stage, persisted as one S3 object"""
+
+    def __init__(self, s3, bucket: str, stage: str, entries: Optional[Dict[str, Dict]] = None):
+        self.s3 = s3
+        self.bucket = bucket
+        self.stage = stage
+        self.key = f"{MANIFEST_PREFIX}{stage}.json"
+        self.entries: Dict[str, Dict] = entries or {}
+        self.exists = entries is not None
+        self._dirty = False
+
+    @classmethod
+    def load(cls, s3, bucket: str, stage: str) -> "StageManifest":
+        """Read the stage manifest, or start an empty one if it doesn't exist yet"""
+        key = f"{MANIFEST_PREFIX}{stage}.json"
+        try:
+            response = s3.get_object(Bucket=bucket, Key=key)
+        except s3.exceptions.ClientError as e:
+            if e.response["Error"]["Code"] not in ("NoSuchKey", "404"):
+                raise
+            print(f"No manifest at s3://{bucket}/{key}, starting fresh")
+            return cls(s3, bucket, stage)
+
+        data = json.loads(response["Body"].read())
+        print(f"Loaded manifest s3://{bucket}/{key} ({len(data['entries'])} entries)")
+        return cls(s3, bucket, stage, data["entries"])
+
+    def is_current(self, input_id: str, etag: Optional[str] = None) -> bool:
+        """
+        True if input_id was processed and (when an etag is given) its
+        content has not changed since.
+        """
+        entry = self.entries.get(input_id)
+        if entry is None:
+            return False
+        return etag is None or entry.get("etag") == etag
+
+    def get(self, input_id: str) -> Optional[Dict]:
+        return self.entries.get(input_id)
+
+    def record(self, input_id: str, etag: Optional[str] = None, outputs: Optional[List[str]] = None) -> None:
+        self.entries[input_id] = {"etag": etag, "outputs": outputs or []}
+        self._dirty = True
+
+    def remove(self, input_id: str) -> None:
+        if self.entries.pop(input_id, None) is not None:
+            self._dirty = True
+
+    def seed(self, input_ids: Iterable[str], outputs_for=None, etag_for=None) -> int:
+        """
+        Bootstrap a brand-new manifest from outputs that already exist
+        (e.g. from one paginated listing), so the first run doesn't redo them.
+        Stages that compare content hashes pass etag_for(input_id), computed the
+        same way as on a normal run, otherwise every seeded input looks changed.
+        """
+        count = 0
+        for input_id in input_ids:
+            if input_id not in self.entries:
+                outputs = outputs_for(input_id) if outputs_for else []
+                etag = etag_for(input_id) if etag_for else None
+                self.entries[input_id] = {"etag": etag, "outputs": outputs}
+                count += 1
+        self._dirty = self._dirty or count > 0
+        return count
+
+    def save(self) -> None:
+        """Write the manifest back, only if something changed"""
+        if not self._dirty:
+            return
+        self.s3.put_object(
+            Bucket=self.bucket,
+            Key=self.key,
+            Body=json.dumps({
+                "stage": self.stage,
+                "updated_at": int(time.time()),
+                "entries": self.entries
+            }),
+            ContentType="application/json"
+        )
+        self.exists = True
+        self._dirty = False
+        print(f"Saved manifest s3://{self.bucket}/{self.key} ({len(self.entries)} entries)")
@@ -0,0 +1,288 @@
+"""
+Local Exact-Search Retriever
+
+In-memory cosine top-k over the corpus, shared by the offline tools and the
+agent's Qdrant-less local mode:
+1. Vectors are L2-normalized once at load and kept as one contiguous
+   float32 (or float16) matrix, a query is a single matmul
+2. Top-k with argpartition (O(n)) and a sort of only the k winners
+3. Batched search: many queries in one matmul
+4. query_points() / get_collection() mirror the QdrantClient calls the agent
+   makes, so a Retriever can stand in for the client
+5. rank_metrics(): MRR / HitRate / nDCG / Recall over a whole result matrix
+6. Optional HNSW index (hnswlib, pip install hnswlib) for corpora where the
+   exact O(N*d) scan gets too slow, persisted next to the artifact:
+       python retriever.py build-ann <artifact_dir>
+   hnswlib is an optional dependency (listed in the root requirements.txt,
+   not in the Lambda images): without it, from_artifact(use_ann=True) falls
+   back to exact search and building an index raises a clear ImportError.
+"""
+
+import os
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Rows upcast per matmul when vectors are stored as float16 (numpy has no fp16 BLAS)
+BLOCK_ROWS = 16384
+
+# Written into the artifact directory, next to embeddings.npy
+ANN_INDEX_FILE = "hnsw.bin"
+
+
+@dataclass
+class ScoredPoint:
+    """Same fields the agent reads from a Qdrant ScoredPoint"""
+    id: Any
+    score: float
+    payload: Optional[Dict[str, Any]] = None
+    version: int = 0
+
+
+@dataclass
+class QueryResponse:
+    points: List[ScoredPoint] = field(default_factory=list)
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """Row-wise L2 normalization in float32, zero rows stay zero"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def top_k(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """(scores, indices) of the k best columns per row, best first"""
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        empty = np.zeros((scores.shape[0], 0))
+        return empty.astype(scores.dtype), empty.astype(np.int64)
+
+    if k < scores.shape[1]:
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1, kind="stable")
+    return np.take_along_axis(candidate_scores, order, axis=1), np.take_along_axis(candidates, order, axis=1)
+
+
+def rank_metrics(indices: np.ndarray, relevant: Sequence[Sequence[int]], ks: Sequence[int] = (1, 5, 10)) -> Dict[str, float]:
+    """
+    MRR / HitRate / nDCG / Recall at each k over a whole (queries, k) result
+    matrix, relevant[q] holds the corpus indices that count as correct for query q.
+    """
+    indices = np.asarray(indices)
+    num_relevant = np.array([len(r) for r in relevant])
+    gold = np.full((len(relevant), max(num_relevant.max(initial=0), 1)), -1, dtype=np.int64)
+    for q, rel in enumerate(relevant):
+        gold[q, :len(rel)] = list(rel)
+
+    # (queries, k) True where the retrieved row is relevant
+    matches = (indices[:, :, None] == gold[:, None, :]).any(axis=2) & (indices >= 0)
+    discounts = 1.0 / np.log2(np.arange(indices.shape[1]) + 2)
+    first_hit = np.where(matches.any(axis=1), matches.argmax(axis=1), indices.shape[1])
+
+    metrics = {}
+    for k in ks:
+        top = matches[:, :k]
+        ideal = np.array([discounts[:min(n, k)].sum() for n in num_relevant])
+        metrics[f"MRR@{k}"] = float(np.where(first_hit < k, 1.0 / (first_hit + 1), 0.0).mean())
+        metrics[f"HitRate@{k}"] = float(top.any(axis=1).mean())
+        metrics[f"nDCG@{k}"] = float(((top * discounts[:k]).sum(axis=1) / np.maximum(ideal, 1e-12)).mean())
+        metrics[f"Recall@{k}"] = float((top.sum(axis=1) / np.maximum(num_relevant, 1)).mean())
+    return {name: round(value, 4) for name, value in metrics.items()}
+
+
+def _import_hnswlib():
+    """hnswlib, or an ImportError that says how to get it"""
+    try:
+        import hnswlib
+    except ImportError as e:
+        raise ImportError(
+            "The HNSW index needs hnswlib, which is an optional dependency: pip install hnswlib"
+        ) from e
+    return hnswlib
+
+
+class HnswIndex:
+    """
+    hnswlib graph over normalized vectors (inner product == cosine).
+    ef_search trades recall for latency at query time, m / ef_construction at build time.
+    """
+
+    def __init__(self, index, ef_search: int = 64):
+        self.index = index
+        self.ef_search = ef_search
+
+    @classmethod
+    def build(
+        cls,
+        vectors: np.ndarray,
+        m: int = 16,
+        ef_construction: int = 200,
+        ef_search: int = 64,
+        num_threads: int = -1
+    ) -> "HnswIndex":
+        hnswlib = _import_hnswlib()
+
+        vectors = normalize(vectors)
+        index = hnswlib.Index(space="ip", dim=vectors.shape[1])
+        index.init_index(max_elements=max(len(vectors), 1), M=m, ef_construction=ef_construction)
+        if len(vectors):
+            index.add_items(vectors, np.arange(len(vectors)), num_threads=num_threads)
+        return cls(index, ef_search)
+
+    @classmethod
+    def load(cls, path: str, dim: int, ef_search: int = 64) -> "HnswIndex":
+        hnswlib = _import_hnswlib()
+
+        index = hnswlib.Index(space="ip", dim=dim)
+        index.load_index(path)
+        return cls(index, ef_search)
+
+    def save(self, path: str) -> None:
+        self.index.save_index(path)
+
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(scores, indices) like Retriever.search, queries must be normalized"""
+        k = min(k, self.index.get_current_count())
+        self.index.set_ef(max(self.ef_search, k))
+        labels, distances = self.index.knn_query(queries, k=k)
+        return (1.0 - distances).astype(np.float32), labels.astype(np.int64)
+
+
+class Retriever:
+    """Cosine search over pre-normalized vectors (exact unless an HNSW index is attached), payloads are row-aligned"""
+
+    def __init__(
+        self,
+        embeddings: np.ndarray,
+        payloads: Sequence[Dict[str, Any]],
+        ids: Optional[Sequence[Any]] = None,
+        dtype: str = "float32",
+        version: Optional[str] = None
+    ):
+        if dtype not in ("float32", "float16"):
+            raise ValueError(f"Unknown dtype '{dtype}', expected float32 or float16")
+        if len(embeddings) != len(payloads):
+            raise ValueError("embeddings and payloads must have the same length")
+
+        self.vectors = np.ascontiguousarray(normalize(embeddings), dtype=dtype)
+        self.payloads = list(payloads)
+        self.ids = list(ids) if ids is not None else [
+            p.get("chunk_id", i) for i, p in enumerate(self.payloads)
+        ]
+        self.version = version
+        self.ann: Optional[HnswIndex] = None
+
+    @classmethod
+    def from_artifact(cls, path: str, dtype: Optional[str] = None, use_ann: bool = False) -> "Retriever":
+        """
+        Load a local embeddings artifact (see embedding_artifact.py). Payloads
+        carry content_hash like the Qdrant points store_qdrant writes.
+        use_ann loads the HNSW index saved next to it (build_ann_index + save_ann_index),
+        search stays exact if hnswlib is not installed.
+        """
+        from embedding_artifact import load_artifact
+
+        header, vectors, chunks, content_hashes = load_artifact(path)
+        payloads = [dict(chunk, content_hash=digest) for chunk, digest in zip(chunks, content_hashes)]
+        retriever = cls(
+            vectors,
+            payloads,
+            dtype=dtype or header["dtype"],
+            version=f"{header['model']}@{header['created_at']}"
+        )
+        if use_ann:
+            try:
+                retriever.ann = HnswIndex.load(os.path.join(path, ANN_INDEX_FILE), dim=retriever.dim)
+            except ImportError as e:
+                print(f"{e}, falling back to exact search")
+        return retriever
+
+    def build_ann_index(self, **params) -> HnswIndex:
+        """Build the HNSW index over the stored vectors, search() uses it from now on"""
+        self.ann = HnswIndex.build(self.vectors.astype(np.float32), **params)
+        return self.ann
+
+    def save_ann_index(self, path: str) -> str:
+        """Persist the HNSW index into an artifact directory"""
+        index_path = os.path.join(path, ANN_INDEX_FILE)
+        self.ann.save(index_path)
+        return index_path
+
+    def __len__(self) -> int:
+        return len(self.payloads)
+
+    @property
+    def dim(self) -> int:
+        return self.vectors.shape[1]
+
+    def scores(self, queries: np.ndarray) -> np.ndarray:
+        """Cosine similarity of every (normalized) query against every row: (queries, rows)"""
+        queries = normalize(np.atleast_2d(queries))
+        if self.vectors.dtype == np.float32:
+            return queries @ self.vectors.T
+
+        out = np.empty((len(queries), len(self.vectors)), dtype=np.float32)
+        for start in range(0, len(self.vectors), BLOCK_ROWS):
+            block = self.vectors[start:start + BLOCK_ROWS].astype(np.float32)
+            out[:, start:start + len(block)] = queries @ block.T
+        return out
+
+    def search(self, queries: np.ndarray, k: int = 10, exact: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Batched top-k: queries is (dim,) or (n, dim), returns (scores, indices)
+        of shape (n, k), best first. Goes through the HNSW index when one is
+        loaded, unless exact=True.
+        """
+        if self.ann is not None and not exact:
+            return self.ann.search(normalize(np.atleast_2d(queries)), k)
+        return top_k(self.scores(queries), k)
+
+    def query_points(
+        self,
+        collection_name: Optional[str] = None,
+        query: Any = None,
+        limit: int = 10,
+        score_threshold: Optional[float] = None,
+        with_payload: bool = True,
+        **kwargs
+    ) -> QueryResponse:
+        """QdrantClient.query_points for a single dense vector (collection_name / timeout are ignored)"""
+        scores, indices = self.search(np.asarray(query, dtype=np.float32), k=limit)
+        points = []
+        for score, index in zip(scores[0], indices[0]):
+            if score_threshold is not None and score < score_threshold:
+                break
+            points.append(ScoredPoint(
+                id=self.ids[index],
+                score=float(score),
+                payload=self.payloads[index] if with_payload else None
+            ))
+        return QueryResponse(points=points)
+
+    def get_collection(self, collection_name: Optional[str] = None):
+        """The parts of QdrantClient.get_collection the agent reads (points_count, config.metadata)"""
+        from types import SimpleNamespace
+
+        return SimpleNamespace(
+            points_count=len(self),
+            config=SimpleNamespace(metadata={"corpus_version": self.version})
+        )
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "build-ann":
+        started = time.perf_counter()
+        retriever = Retriever.from_artifact(sys.argv[2])
+        retriever.build_ann_index()
+        print(f"Built HNSW over {len(retriever)} vectors in {time.perf_counter() - started:.1f}s: "
+              f"{retriever.save_ann_index(sys.argv[2])}")
+    else:
+        print("Usage: python retriever.py build-ann <artifact_dir>")
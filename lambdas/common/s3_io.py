@@ -0,0 +1,77 @@
+"""
+S3 Helpers
+
+Shared by the ingestion Lambdas (deployed as the common layer):
+1. list_objects - Paginated listing, no silent stop at 1000 objects
+2. iter_json_objects - Concurrent get_object with a bounded number of in-flight requests
+"""
+
+import json
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+# Default number of concurrent GETs, also used to size the botocore connection pool
+S3_MAX_WORKERS = int(os.environ.get("S3_MAX_WORKERS", 16))
+
+
+def list_objects(
+    s3,
+    bucket: str,
+    prefix: str,
+    suffix: Optional[str] = None
+) -> Iterator[Dict[str, Any]]:
+    """
+    Yield every object under prefix, following continuation tokens.
+
+    Each item is the raw listing entry ({"Key", "ETag", "Size", ...}).
+    """
+    paginator = s3.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get("Contents", []):
+            if suffix and not obj["Key"].endswith(suffix):
+                continue
+            yield obj
+
+
+def iter_json_objects(
+    s3,
+    bucket: str,
+    objects: Iterable[Dict[str, Any]],
+    max_workers: int = S3_MAX_WORKERS
+) -> Iterator[Tuple[Dict[str, Any], Any]]:
+    """
+    Fetch and parse JSON objects concurrently, yielding (listing entry, data)
+    as soon as each download finishes (NOT in listing order).
+
+    At most max_workers requests are in flight, so memory stays bounded even
+    for very long listings. A failed GET raises in the caller.
+    """
+
+    def fetch(obj):
+        response = s3.get_object(Bucket=bucket, Key=obj["Key"])
+        return json.loads(response["Body"].read())
+
+    objects = iter(objects)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        in_flight = {}
+
+        def submit_next() -> bool:
+            obj = next(objects, None)
+            if obj is None:
+                return False
+            in_flight[pool.submit(fetch, obj)] = obj
+            return True
+
+        for _ in range(max_workers):
+            if not submit_next():
+                break
+
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                obj = in_flight.pop(future)
+                data = future.result()
+                submit_next()
+                yield obj, data
@@ -1,11 +1,15 @@
 import os
 import json
 import boto3
-import torch
 import io
-import botocore
+import shutil
 import numpy as np
-from sentence_transformers import SentenceTransformer
+from embedding_artifact import (
+    HEADER_FILE, PAYLOAD_FILE, VECTORS_FILE, S3ArtifactReader,
+    download_artifact, header_key, load_artifact, save_artifact
+)
+from embedding_backend import encode_length_bucketed, encode_multiprocess, load_encoder
+from manifest import StageManifest, content_hash
 
 s3 = boto3.client('s3')
 
@@ -13,78 +17,413 @@ s3 = boto3.client('s3')
 os.environ['TRANSFORMERS_CACHE'] = '/tmp'
 os.environ['HF_HOME'] = '/tmp'
 MODEL_PATH = "/var/task/mxbai_model"
+MODEL_NAME = os.environ.get("MODEL_NAME", "mixedbread-ai/mxbai-embed-large-v1")
+# float16 halves the artifact (and store_qdrant download) size
+ARTIFACT_DTYPE = os.environ.get("ARTIFACT_DTYPE", "float32")
+# Chunks per shard when the Step Function fans encoding out (action="plan")
+SHARD_SIZE = int(os.environ.get("EMBEDDING_SHARD_SIZE", 2000))
+
+# >1 encodes with a pool of worker processes (each loads its own model copy)
+EMBEDDING_WORKERS = int(os.environ.get("EMBEDDING_WORKERS", 1))
 
 # Load model globally for warm-start performance
-model = SentenceTransformer(MODEL_PATH, device="cpu")
+# EMBEDDING_BACKEND picks torch | onnx | onnx-int8 (see embedding_backend.py)
+model = load_encoder(model_path=MODEL_PATH) if EMBEDDING_WORKERS <= 1 else None
+BACKEND_NAME = model.name if model else f"{os.environ.get('EMBEDDING_BACKEND', 'torch')} x {EMBEDDING_WORKERS} processes"
 
 def lambda_handler(event, context):
     """
     AWS Lambda handler to generate sentence embeddings using NumPy for storage.
     
+    Only chunks whose content hash changed since the last run are encoded, the
+    rest reuse their vectors from the previous corpus artifact.
+    
     Input: {
         "bucket": "virtual-lenny-bucket",
         "input_key": "data/chunks/final_chunks.json",
-        "output_key": "data/embedded/mxbai_corpus.npz"
+        "output_key": "data/embedded/mxbai_corpus/",
+        "delta_key": "data/embedded/mxbai_corpus_delta/"   (optional)
     }
+    
+    Both keys are artifact prefixes (header.json + embeddings.npy + chunks.jsonl,
+    see common/embedding_artifact.py).
+    
+    For corpora that do not fit one 15 minute invocation, the Step Function fans
+    out with "action" (see ingestion_stack.py):
+        plan         -> writes the new/changed chunks as shards, returns their list
+        encode_shard -> encodes one shard into its own artifact (one Map iteration)
+        merge        -> stitches the shard artifacts + reused vectors into corpus + delta
+    Without "action" everything runs in this single invocation.
     """
+    action = event.get('action')
+    if action == 'plan':
+        return plan_shards(event)
+    if action == 'encode_shard':
+        return encode_shard(event)
+    if action == 'merge':
+        return merge_shards(event)
+    
     bucket = event['bucket']
     input_key = event['input_key']
     output_key = event['output_key'] 
+    delta_key = event.get('delta_key') or output_key.rstrip('/') + '_delta/'
 
-    try:
-        s3.head_object(Bucket=bucket, Key=output_key)
-        print(f" SKIPPING: File already exists at s3://{bucket}/{output_key}")
+    # 1. Skip if final_chunks.json is the same version that was last embedded
+    manifest, input_etag = load_manifest(bucket, input_key)
+
+    if is_embedded(manifest, input_key, input_etag, output_key):
+        print(f" SKIPPING: s3://{bucket}/{input_key} unchanged since the last run")
         return {
             "statusCode": 200,
             "body": json.dumps({
                 "status": "skipped", 
-                "message": "File already exists",
+                "message": "Input unchanged",
                 "output_key": output_key
             })
         }
-    except botocore.exceptions.ClientError as e:
-        if e.response['Error']['Code'] != "404":
-            raise e
 
     try:
         # 2. Download chunks from S3
-        print(f"Downloading chunks from s3://{bucket}/{input_key}")
-        obj = s3.get_object(Bucket=bucket, Key=input_key)
-        all_chunks = json.loads(obj['Body'].read().decode('utf-8'))
+        all_chunks, content_hashes, _ = load_chunks(bucket, input_key)
+        
+        # 3. chunk_id -> (content hash, vector) from the previous corpus artifact
+        previous, previous_path = load_previous_vectors(bucket, output_key)
+        to_encode, deleted_ids = diff_chunks(
+            all_chunks, content_hashes, {chunk_id: entry[0] for chunk_id, entry in previous.items()}
+        )
         
-        # Extract text for encoding
-        corpus_texts = [c.get('content') or c.get('text', '') for c in all_chunks]
+        # 4. Encode only the delta
+        print(f"Embedding backend: {BACKEND_NAME}")
+        print(f"Encoding {len(to_encode)} new/changed chunks, reusing {len(all_chunks) - len(to_encode)}, "
+              f"{len(deleted_ids)} removed")
         
-        # 3. Generate Embeddings
-        print(f"Generating embeddings for {len(corpus_texts)} chunks...")
-        corpus_embs = model.encode(corpus_texts, convert_to_tensor=True )
+        new_vectors = {}
+        if to_encode:
+            # Extract text for encoding
+            new_embeddings = encode_texts([chunk_text(all_chunks[i]) for i in to_encode])
+            new_vectors = {all_chunks[i]['chunk_id']: new_embeddings[j] for j, i in enumerate(to_encode)}
         
-        # 4. Convert Tensor to Numpy and Save as Compressed .npz
+        # 5. Save full corpus + delta as columnar artifacts (no pickling)
         # This is critical so the StoreQdrant Lambda doesn't need to install torch (800MB+)
-        embeddings_np = corpus_embs.cpu().numpy()
+        embeddings_np = write_corpus(
+            bucket, output_key, delta_key, all_chunks, content_hashes,
+            to_encode, deleted_ids, new_vectors, previous
+        )
         
-        buffer = io.BytesIO()
-        np.savez_compressed(buffer, embeddings=embeddings_np, chunks=all_chunks)
-        buffer.seek(0)
+        if previous_path:
+            shutil.rmtree(previous_path, ignore_errors=True)
         
-        # 5. Upload compressed file to S3
-        print(f"Uploading compressed NPZ to s3://{bucket}/{output_key}")
-        s3.put_object(
-            Bucket=bucket,
-            Key=output_key,
-            Body=buffer.getvalue(),
-            ContentType='application/octet-stream'
-        )
+        manifest.record(input_key, input_etag, [output_key, delta_key])
+        manifest.save()
         
         return {
             "statusCode": 200,
             "body": json.dumps({
                 "status": "success",
                 "embedding_shape": list(embeddings_np.shape),
-                "output_key": output_key
+                "encoded": len(to_encode),
+                "reused": len(all_chunks) - len(to_encode),
+                "deleted": len(deleted_ids),
+                "output_key": output_key,
+                "delta_key": delta_key
             })
         }
 
     except Exception as e:
         print(f"Error: {str(e)}")
-        return {"statusCode": 500, "body": json.dumps({"error": str(e)})}
\ No newline at end of file
+        return {"statusCode": 500, "body": json.dumps({"error": str(e)})}
+
+
+def plan_shards(event) -> dict:
+    """
+    Diff final_chunks.json against the previous corpus (payload hashes only, no
+    vectors) and write the chunks to encode as shards of SHARD_SIZE.
+    Errors are raised (not returned as 500) so the Step Function retries / catches them.
+    """
+    bucket = event['bucket']
+    input_key = event['input_key']
+    output_key = event['output_key']
+    shard_size = int(event.get('shard_size') or SHARD_SIZE)
+    
+    manifest, input_etag = load_manifest(bucket, input_key)
+    if is_embedded(manifest, input_key, input_etag, output_key):
+        print(f" SKIPPING: s3://{bucket}/{input_key} unchanged since the last run")
+        return {"statusCode": 200, "status": "skipped", "input_etag": input_etag, "shards": []}
+    
+    all_chunks, content_hashes, input_etag = load_chunks(bucket, input_key)
+    to_encode, deleted_ids = diff_chunks(all_chunks, content_hashes, load_previous_hashes(bucket, output_key))
+    
+    # One folder per input version, so a re-run of the same input reuses finished shards
+    shard_prefix = event.get('shard_prefix') or output_key.rstrip('/') + '_shards/'
+    run_id = input_etag.strip('"')
+    run_prefix = f"{shard_prefix.rstrip('/')}/{run_id}/"
+    
+    shards = []
+    for n, start in enumerate(range(0, len(to_encode), shard_size)):
+        shard_key = f"{run_prefix}shard-{n:05d}.json"
+        s3.put_object(
+            Bucket=bucket,
+            Key=shard_key,
+            Body=json.dumps([all_chunks[i] for i in to_encode[start:start + shard_size]]),
+            ContentType='application/json'
+        )
+        shards.append({
+            "action": "encode_shard",
+            "bucket": bucket,
+            "shard_key": shard_key,
+            "output_key": f"{run_prefix}shard-{n:05d}/"
+        })
+    
+    print(f"Planned {len(shards)} shards for {len(to_encode)} new/changed chunks "
+          f"({len(all_chunks) - len(to_encode)} reused, {len(deleted_ids)} removed)")
+    
+    return {
+        "statusCode": 200,
+        "status": "planned",
+        "input_etag": input_etag,
+        "encode": len(to_encode),
+        "reuse": len(all_chunks) - len(to_encode),
+        "delete": len(deleted_ids),
+        "shards": shards
+    }
+
+
+def encode_shard(event) -> dict:
+    """Encode one shard into its own artifact, a no-op if a previous attempt already wrote it"""
+    bucket = event['bucket']
+    shard_key = event['shard_key']
+    output_key = event['output_key']
+    
+    try:
+        s3.head_object(Bucket=bucket, Key=header_key(output_key))
+        print(f" SKIPPING: shard s3://{bucket}/{output_key} already encoded")
+        return {"statusCode": 200, "status": "skipped", "output_key": output_key}
+    except s3.exceptions.ClientError as e:
+        if e.response['Error']['Code'] not in ('NoSuchKey', '404'):
+            raise
+    
+    chunks, content_hashes, _ = load_chunks(bucket, shard_key)
+    print(f"Embedding backend: {BACKEND_NAME}, encoding {len(chunks)} chunks")
+    embeddings = encode_texts([chunk_text(c) for c in chunks])
+    
+    save_artifact(
+        s3, bucket, output_key, embeddings, chunks, content_hashes,
+        model=MODEL_NAME, normalized=False, dtype=ARTIFACT_DTYPE
+    )
+    return {"statusCode": 200, "status": "success", "encoded": len(chunks), "output_key": output_key}
+
+
+def merge_shards(event) -> dict:
+    """Corpus + delta artifacts from the shard artifacts and the previous corpus, then drop the shards"""
+    bucket = event['bucket']
+    input_key = event['input_key']
+    output_key = event['output_key']
+    delta_key = event.get('delta_key') or output_key.rstrip('/') + '_delta/'
+    shards = event.get('shards', [])
+    
+    manifest, _ = load_manifest(bucket, input_key)
+    all_chunks, content_hashes, input_etag = load_chunks(bucket, input_key)
+    if event.get('input_etag') and input_etag != event['input_etag']:
+        raise ValueError(f"s3://{bucket}/{input_key} changed since it was planned, re-run the pipeline")
+    
+    previous, previous_path = load_previous_vectors(bucket, output_key)
+    to_encode, deleted_ids = diff_chunks(
+        all_chunks, content_hashes, {chunk_id: entry[0] for chunk_id, entry in previous.items()}
+    )
+    
+    new_vectors = {}
+    shard_paths = []
+    try:
+        for shard in shards:
+            path = download_artifact(s3, bucket, shard['output_key'])
+            shard_paths.append(path)
+            _, embeddings, chunks, _ = load_artifact(path)
+            for i, chunk in enumerate(chunks):
+                new_vectors[chunk['chunk_id']] = embeddings[i]
+        
+        print(f"Merging {len(shards)} shards ({len(new_vectors)} encoded) with "
+              f"{len(all_chunks) - len(to_encode)} reused vectors")
+        embeddings_np = write_corpus(
+            bucket, output_key, delta_key, all_chunks, content_hashes,
+            to_encode, deleted_ids, new_vectors, previous
+        )
+    finally:
+        for path in shard_paths + [previous_path]:
+            if path:
+                shutil.rmtree(path, ignore_errors=True)
+    
+    manifest.record(input_key, input_etag, [output_key, delta_key])
+    manifest.save()
+    
+    for shard in shards:
+        for key in [shard['shard_key']] + [shard['output_key'] + name for name in (VECTORS_FILE, PAYLOAD_FILE, HEADER_FILE)]:
+            s3.delete_object(Bucket=bucket, Key=key)
+    
+    return {
+        "statusCode": 200,
+        "body": json.dumps({
+            "status": "success",
+            "embedding_shape": list(embeddings_np.shape),
+            "shards": len(shards),
+            "encoded": len(to_encode),
+            "reused": len(all_chunks) - len(to_encode),
+            "deleted": len(deleted_ids),
+            "output_key": output_key,
+            "delta_key": delta_key
+        })
+    }
+
+
+def load_manifest(bucket: str, input_key: str):
+    """(generate_embeddings manifest, current ETag of final_chunks.json)"""
+    manifest = StageManifest.load(s3, bucket, 'generate_embeddings')
+    return manifest, s3.head_object(Bucket=bucket, Key=input_key)['ETag']
+
+
+def is_embedded(manifest: StageManifest, input_key: str, input_etag: str, output_key: str) -> bool:
+    return manifest.is_current(input_key, input_etag) and output_key in manifest.get(input_key)['outputs']
+
+
+def load_chunks(bucket: str, key: str):
+    """(chunks, content_hashes, ETag) of a chunks JSON file"""
+    print(f"Downloading chunks from s3://{bucket}/{key}")
+    obj = s3.get_object(Bucket=bucket, Key=key)
+    chunks = json.loads(obj['Body'].read().decode('utf-8'))
+    return chunks, [content_hash(c) for c in chunks], obj.get('ETag')
+
+
+def encode_texts(texts) -> np.ndarray:
+    """Length-bucketed encode (short posts and long transcript chunks batched apart), logs tokens/s"""
+    if EMBEDDING_WORKERS > 1:
+        embeddings, stats = encode_multiprocess(texts, workers=EMBEDDING_WORKERS, model_path=MODEL_PATH)
+    else:
+        embeddings, stats = encode_length_bucketed(model, texts)
+    print(f"Encoded {stats['texts']} texts in {stats['batches']} batches: {stats['tokens_per_second']:.0f} tokens/s, "
+          f"{stats['padding_ratio'] * 100:.1f}% padding")
+    return embeddings
+
+
+def chunk_text(chunk: dict) -> str:
+    return chunk.get('content') or chunk.get('text', '')
+
+
+def diff_chunks(all_chunks, content_hashes, previous_hashes: dict):
+    """(indices of chunks to encode, chunk_ids that disappeared) against chunk_id -> content hash"""
+    to_encode = [
+        i for i, (chunk, digest) in enumerate(zip(all_chunks, content_hashes))
+        if previous_hashes.get(chunk['chunk_id']) != digest
+    ]
+    current_ids = {c['chunk_id'] for c in all_chunks}
+    deleted_ids = [chunk_id for chunk_id in previous_hashes if chunk_id not in current_ids]
+    return to_encode, deleted_ids
+
+
+def write_corpus(bucket, output_key, delta_key, all_chunks, content_hashes,
+                 to_encode, deleted_ids, new_vectors: dict, previous: dict) -> np.ndarray:
+    """Assemble the full matrix in chunk order (new vectors by chunk_id, the rest reused), upload corpus + delta"""
+    if new_vectors:
+        dim = len(next(iter(new_vectors.values())))
+    else:
+        dim = len(next(iter(previous.values()))[1]) if previous else 0
+    
+    embeddings_np = np.zeros((len(all_chunks), dim), dtype=np.float32)
+    encoded = set(to_encode)
+    for i, chunk in enumerate(all_chunks):
+        if i in encoded:
+            if chunk['chunk_id'] not in new_vectors:
+                raise ValueError(f"No vector for new/changed chunk {chunk['chunk_id']}")
+            embeddings_np[i] = new_vectors[chunk['chunk_id']]
+        else:
+            embeddings_np[i] = previous[chunk['chunk_id']][1]
+    
+    header_fields = {"model": MODEL_NAME, "normalized": False, "dtype": ARTIFACT_DTYPE}
+    
+    # The delta is only valid on top of the corpus it was diffed against
+    base_version = corpus_version(bucket, output_key)
+    
+    print(f"Uploading corpus artifact to s3://{bucket}/{output_key}")
+    save_artifact(s3, bucket, output_key, embeddings_np, all_chunks, content_hashes, **header_fields)
+    target_version = corpus_version(bucket, output_key)
+    
+    print(f"Uploading delta artifact to s3://{bucket}/{delta_key} ({base_version} -> {target_version})")
+    save_artifact(
+        s3, bucket, delta_key,
+        embeddings_np[to_encode] if to_encode else np.zeros((0, dim), dtype=np.float32),
+        [all_chunks[i] for i in to_encode],
+        [content_hashes[i] for i in to_encode],
+        deleted_ids=deleted_ids,
+        base_version=base_version,
+        target_version=target_version,
+        **header_fields
+    )
+    return embeddings_np
+
+
+def corpus_version(bucket: str, prefix: str):
+    """ETag of the corpus artifact's header.json (what store_qdrant tags the collection with), None if missing"""
+    try:
+        return s3.head_object(Bucket=bucket, Key=header_key(prefix))['ETag']
+    except s3.exceptions.ClientError as e:
+        if e.response['Error']['Code'] not in ('NoSuchKey', '404'):
+            raise
+        return None
+
+
+def load_previous_hashes(bucket: str, prefix: str) -> dict:
+    """chunk_id -> content hash of the last corpus artifact, streams chunks.jsonl only"""
+    try:
+        reader = S3ArtifactReader(s3, bucket, prefix)
+    except s3.exceptions.ClientError as e:
+        if e.response['Error']['Code'] not in ('NoSuchKey', '404'):
+            raise
+        legacy = load_legacy_npz(bucket, prefix.rstrip('/') + '.npz')
+        return {chunk_id: entry[0] for chunk_id, entry in legacy.items()}
+    
+    return {chunk['chunk_id']: digest for chunk, digest in reader.iter_payloads()}
+
+
+def load_previous_vectors(bucket: str, prefix: str):
+    """
+    chunk_id -> (content hash, vector) from the last corpus artifact, empty if none.
+    Vectors are rows of a memory-mapped matrix in a scratch dir (returned for cleanup).
+    """
+    try:
+        path = download_artifact(s3, bucket, prefix)
+    except s3.exceptions.ClientError as e:
+        if e.response['Error']['Code'] not in ('NoSuchKey', '404'):
+            raise
+        return load_legacy_npz(bucket, prefix.rstrip('/') + '.npz'), None
+    
+    _, embeddings, chunks, hashes = load_artifact(path)
+    previous = {
+        chunk['chunk_id']: (digest, embeddings[i])
+        for i, (chunk, digest) in enumerate(zip(chunks, hashes))
+    }
+    return previous, path
+
+
+def load_legacy_npz(bucket: str, key: str) -> dict:
+    """Pickled NPZ written before the artifact format, read once to seed the first incremental run"""
+    try:
+        response = s3.get_object(Bucket=bucket, Key=key)
+    except s3.exceptions.ClientError as e:
+        if e.response['Error']['Code'] not in ('NoSuchKey', '404'):
+            raise
+        print(f"No previous corpus at s3://{bucket}/{key}, encoding everything")
+        return {}
+    
+    with np.load(io.BytesIO(response['Body'].read()), allow_pickle=True) as data:
+        embeddings = data['embeddings']
+        chunks = data['chunks']
+        if chunks.dtype == object and chunks.ndim == 0:
+            chunks = chunks.item()
+        if 'content_hashes' in data:
+            hashes = [str(h) for h in data['content_hashes']]
+        else:
+            # Artifacts from before incremental runs carry no hashes
+            hashes = [content_hash(c) for c in chunks]
+    
+    return {
+        chunk['chunk_id']: (digest, embeddings[i])
+        for i, (chunk, digest) in enumerate(zip(chunks, hashes))
+    }
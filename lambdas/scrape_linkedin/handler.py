@@ -3,6 +3,8 @@ import boto3
 import os
 from apify_client import ApifyClient
 from typing import List, Dict
+from manifest import StageManifest, content_hash
+from s3_io import iter_json_objects, list_objects
 
 s3 = boto3.client('s3')
 
@@ -29,23 +31,41 @@ def lambda_handler(event, context):
         print(f"Scraping {count} posts from {profile_url}")
         items = scrape_linkedin_posts(profile_url, count)
         
-        # Save to S3
+        # post_id -> hash of the post content, loaded once instead of a HEAD per post
+        manifest = StageManifest.load(s3, bucket, 'scrape_linkedin')
+        if not manifest.exists:
+            # First run with a manifest: adopt posts saved before it existed, hashed
+            # like fresh ones so unchanged posts are not rewritten (with a new ETag)
+            existing = {
+                obj['Key'][len(prefix):-len('.json')]: post_hash(post)
+                for obj, post in iter_json_objects(s3, bucket, list_objects(s3, bucket, prefix, suffix='.json'))
+            }
+            seeded = manifest.seed(
+                existing,
+                outputs_for=lambda post_id: [f"{prefix}{post_id}.json"],
+                etag_for=existing.get
+            )
+            print(f"Seeded manifest with {seeded} existing posts")
+        
+        # Save new or edited posts to S3
         saved_count = 0
         for item in items:
             key = f"{prefix}{item['post_id']}.json"
-            try:
-                s3.head_object(Bucket=bucket, Key=key)
-                print(f" Post {item['post_id']} already exists in S3, skipping.")
-                continue 
-            except s3.exceptions.ClientError:
+            etag = post_hash(item)
+            if manifest.is_current(item['post_id'], etag):
+                print(f" Post {item['post_id']} unchanged, skipping.")
+                continue
 
-                s3.put_object(
-                    Bucket=bucket,
-                    Key=key,
-                    Body=json.dumps(item, indent=2),
-                    ContentType='application/json'
-                )
-                saved_count += 1
+            s3.put_object(
+                Bucket=bucket,
+                Key=key,
+                Body=json.dumps(item, indent=2),
+                ContentType='application/json'
+            )
+            manifest.record(item['post_id'], etag, [key])
+            saved_count += 1
+        
+        manifest.save()
         
         print(f"Successfully saved {saved_count} posts to S3")
         
@@ -65,6 +85,11 @@ def lambda_handler(event, context):
         }
 
 
+def post_hash(item: Dict) -> str:
+    """Content hash over the stable fields: posted_at ("2d ago") and likes change on every scrape"""
+    return content_hash(item['text'], item['url'], item['author'])
+
+
 def scrape_linkedin_posts(profile_url: str, count: int) -> List[Dict]:
     """
     Scrape LinkedIn posts using Apify.
@@ -3,18 +3,11 @@ import boto3
 import os
 from youtube_transcript_api import YouTubeTranscriptApi
 import re
+from manifest import StageManifest
+from s3_io import list_objects
 
 s3 = boto3.client('s3')
 
-def s3_object_exists(bucket: str, key: str) -> bool:
-    try:
-        s3.head_object(Bucket=bucket, Key=key)
-        return True
-    except s3.exceptions.ClientError as e:
-        if e.response["Error"]["Code"] == "404":
-            return False
-        raise
-
 
 def lambda_handler(event, context):
     """
@@ -37,6 +30,16 @@ def lambda_handler(event, context):
         
         print(f"Processing {len(video_ids)} videos")
         
+        # video_id -> transcript key, loaded once instead of a HEAD per video
+        manifest = StageManifest.load(s3, event['output_bucket'], 'scrape_youtube')
+        if not manifest.exists:
+            # First run with a manifest: adopt transcripts scraped before it existed
+            seeded = manifest.seed(
+                obj['Key'][len(event['output_prefix']):-len('.json')]
+                for obj in list_objects(s3, event['output_bucket'], event['output_prefix'], suffix='.json')
+            )
+            print(f"Seeded manifest with {seeded} existing transcripts")
+        
         # Process each video
         success_count = 0
         for video_id in video_ids:
@@ -44,7 +47,7 @@ def lambda_handler(event, context):
             
             key = f"{event['output_prefix']}{video_id}.json"
 
-            if s3_object_exists(event['output_bucket'], key):
+            if manifest.is_current(video_id):
                 print(f"Skipping {video_id}, already exists in S3")
                 continue
 
@@ -69,6 +72,7 @@ def lambda_handler(event, context):
                     ContentType='application/json'
                 )
 
+                manifest.record(video_id, outputs=[key])
                 success_count += 1
                 print(f"Saved {video_id} ({len(transcript)} chars)")
 
@@ -76,6 +80,8 @@ def lambda_handler(event, context):
                 print(f"Error processing {video_id}: {str(e)}")
                 continue
         
+        manifest.save()
+        
         return {
             'statusCode': 200,
             'body': json.dumps({
@@ -1,11 +1,17 @@
 import json
 import boto3
 import numpy as np
-import uuid
 import tempfile
 import os
+import time
 from qdrant_client import QdrantClient
-from qdrant_client.models import VectorParams, Distance, PointStruct
+from qdrant_client.models import (
+    VectorParams, Distance, PointIdsList,
+    CreateAlias, CreateAliasOperation, DeleteAlias, DeleteAliasOperation
+)
+from embedding_artifact import S3ArtifactReader
+from manifest import content_hash
+from uploader import PipelinedUploader, point_id
 
 s3 = boto3.client('s3')
 
@@ -16,13 +22,27 @@ def lambda_handler(event, context):
     Expected event:
     {
         "input_bucket": "virtual-lenny-bucket",
-        "embeddings_key": "data/embeddings/mxbai_corpus.pt",
+        "embeddings_key": "data/embedded/mxbai_corpus/",
         "collection_name": "virtual-lenny",
         "qdrant_url": "https://your-cluster.aws.cloud.qdrant.io",
         "qdrant_api_key": "your-api-key", 
         "recreate_collection": false,
-        "batch_size": 100
+        "batch_size": 100,
+        "mode": "full" | "delta" | "sync",
+        "delta_key": "data/embedded/mxbai_corpus_delta/"
     }
+    
+    embeddings_key / delta_key are artifact prefixes (common/embedding_artifact.py),
+    a legacy .npz key is still accepted.
+    
+    collection_name is an alias. Full builds go into a fresh versioned
+    collection (virtual-lenny_<timestamp>) and the alias is swapped once the
+    upload is complete, so the agent never queries a half-built collection.
+    
+    On a populated collection:
+    - mode=delta applies the delta artifact written by generate_embeddings
+    - mode=sync diffs chunk_ids / content hashes of the full artifact against
+      Qdrant, upserts changed points and deletes removed ones
     """
     try:
         input_bucket = event['input_bucket']
@@ -32,6 +52,7 @@ def lambda_handler(event, context):
         qdrant_api_key = event.get('qdrant_api_key') or os.environ.get('QDRANT_API_KEY')
         recreate = event.get('recreate_collection', False)
         batch_size = event.get('batch_size', 100)
+        mode = event.get('mode', 'full')
         
         if not qdrant_url:
             raise ValueError("qdrant_url must be provided in event or QDRANT_URL env var")
@@ -42,7 +63,9 @@ def lambda_handler(event, context):
         client = QdrantClient(
             url=qdrant_url,
             api_key=qdrant_api_key,
-            port=None # because : https://github.com/qdrant/qdrant-client/issues/394#issuecomment-2075283788
+            port=None, # because : https://github.com/qdrant/qdrant-client/issues/394#issuecomment-2075283788
+            # QDRANT_TRANSPORT=grpc -> binary protobuf writes (see uploader.py)
+            prefer_grpc=os.environ.get("QDRANT_TRANSPORT", "rest") == "grpc"
         )
         
         try:
@@ -51,15 +74,22 @@ def lambda_handler(event, context):
         except Exception as e:
             raise Exception(f"Failed to connect to Qdrant Cloud: {str(e)}")
 
-        existing_collections = [c.name for c in collections_list.collections]
+        live_collection = resolve_collection(client, collection_name, collections_list)
         
-        if collection_name in existing_collections:
-            collection_info = client.get_collection(collection_name=collection_name)
+        if live_collection:
+            collection_info = client.get_collection(collection_name=live_collection)
             points_count = collection_info.points_count
             
-            print(f" Collection '{collection_name}' exists with {points_count} points")
+            print(f" Collection '{collection_name}' -> '{live_collection}' exists with {points_count} points")
             
             if points_count > 0 and not recreate:
+                if mode == 'delta':
+                    return apply_delta(
+                        client, live_collection, input_bucket, event['delta_key'], embeddings_key, batch_size
+                    )
+                if mode == 'sync':
+                    return sync_collection(client, live_collection, input_bucket, embeddings_key, batch_size)
+                
                 print(f" SKIPPING: Collection already populated with {points_count} vectors")
                 return {
                     'statusCode': 200,
@@ -70,10 +100,6 @@ def lambda_handler(event, context):
                         'skipped': True
                     })
                 }
-            
-            if recreate:
-                print(f" Deleting existing collection for fresh upload...")
-                client.delete_collection(collection_name=collection_name)
         
         # print(f"⬇Downloading embeddings from s3://{input_bucket}/{embeddings_key}")
         # with tempfile.NamedTemporaryFile(suffix='.pt', delete=False) as tmp:
@@ -86,78 +112,43 @@ def lambda_handler(event, context):
             
         #     os.unlink(tmp.name)
         
-        print(f"⬇Downloading embeddings from s3://{input_bucket}/{embeddings_key}")
-        with tempfile.NamedTemporaryFile(suffix='.npz', delete=False) as tmp:
-            s3.download_file(input_bucket, embeddings_key, tmp.name)
-            
-            print(" Loading embeddings file...")
-            # Use np.load instead of torch.load
-            with np.load(tmp.name, allow_pickle=True) as data:
-                embeddings = data["embeddings"]
-                # If chunks was saved as a single object array, use .item()
-                chunks = data["chunks"]
-                if chunks.dtype == object and chunks.ndim == 0:
-                    chunks = chunks.item()
-            
-            os.unlink(tmp.name)
+        source = open_embeddings(input_bucket, embeddings_key)
 
-        print(f"Loaded {len(chunks)} chunks with embeddings of dimension {embeddings.shape[1]}")
+        print(f"Streaming {source.count} chunks with embeddings of dimension {source.dim}")
         
-        # Create collection if it doesn't exist
-        if collection_name not in existing_collections or recreate:
-            print(f"Creating collection: {collection_name}")
-            client.create_collection(
-                collection_name=collection_name,
-                vectors_config=VectorParams(
-                    size=embeddings.shape[1],
-                    distance=Distance.COSINE
-                )
+        # Blue/green: build the new version next to the live one
+        target_collection = f"{collection_name}_{int(time.time())}"
+        print(f"Creating collection: {target_collection}")
+        client.create_collection(
+            collection_name=target_collection,
+            vectors_config=VectorParams(
+                size=source.dim,
+                distance=Distance.COSINE
             )
+        )
         
-        print(f"⬆ Uploading vectors in batches of {batch_size}...")
-        total_uploaded = 0
-        
-        for start_idx in range(0, len(chunks), batch_size):
-            end_idx = min(start_idx + batch_size, len(chunks))
-            batch_chunks = chunks[start_idx:end_idx]
-            batch_embs = embeddings[start_idx:end_idx]
-            
-            points = []
-            # for i, chunk in enumerate(batch_chunks):
-            #     # Create deterministic UUID from chunk_id
-            #     point_id = str(uuid.uuid5(uuid.NAMESPACE_OID, chunk["chunk_id"]))
-                
-            #     points.append(
-            #         PointStruct(
-            #             id=point_id,
-            #             vector=batch_embs[i].tolist(),
-            #             payload=chunk
-            #         )
-            #     )
-
-            for i, chunk in enumerate(batch_chunks):
-                # Create deterministic UUID from chunk_id
-                point_id = str(uuid.uuid5(uuid.NAMESPACE_OID, chunk["chunk_id"]))
-
-                points.append(
-                    PointStruct(
-                        id=point_id,
-                        vector=batch_embs[i].tolist(), # Direct numpy to list conversion
-                        payload=chunk
-                    )
-                )
-
-            # Upsert batch to Qdrant Cloud
-            client.upsert(
-                collection_name=collection_name,
-                points=points
+        alias_swapped = False
+        try:
+            print(f"⬆ Uploading vectors, starting with batches of {batch_size}...")
+            upload_stats = PipelinedUploader.from_env(client, target_collection, batch_size=batch_size).upload_rows(
+                source.iter_rows(), total=source.count
             )
+            total_uploaded = upload_stats['vectors']
+            set_corpus_version(client, target_collection, source.etag)
             
-            total_uploaded += len(points)
-            print(f"✓ Uploaded {total_uploaded}/{len(chunks)} vectors ({(total_uploaded/len(chunks)*100):.1f}%)")
+            swap_alias(client, collection_name, target_collection, live_collection)
+            alias_swapped = True
+        except Exception:
+            # A failed or retried run must not leave a half-filled collection behind
+            if not alias_swapped:
+                discard_unfinished(client, collection_name, target_collection, live_collection)
+            raise
         
+        if live_collection and live_collection != collection_name:
+            client.delete_collection(collection_name=live_collection)
+            print(f" Deleted previous version '{live_collection}'")
         
-        collection_info = client.get_collection(collection_name=collection_name)
+        collection_info = client.get_collection(collection_name=target_collection)
         
         print(f" Successfully uploaded {total_uploaded} vectors to Qdrant Cloud")
         print(f" Collection now has {collection_info.points_count} total points")
@@ -166,8 +157,10 @@ def lambda_handler(event, context):
             'statusCode': 200,
             'body': json.dumps({
                 'collection_name': collection_name,
+                'target_collection': target_collection,
                 'vectors_uploaded': total_uploaded,
                 'collection_points_count': collection_info.points_count,
+                'vectors_per_second': upload_stats['vectors_per_second'],
                 'qdrant_url': qdrant_url,
                 'skipped': False
             })
@@ -181,3 +174,246 @@ def lambda_handler(event, context):
             'statusCode': 500,
             'body': json.dumps({'error': str(e)})
         }
+
+
+def resolve_collection(client, collection_name: str, collections_list=None):
+    """Real collection behind collection_name (alias or legacy plain collection), None if missing"""
+    aliases = {a.alias_name: a.collection_name for a in client.get_aliases().aliases}
+    if collection_name in aliases:
+        return aliases[collection_name]
+    
+    collections_list = collections_list or client.get_collections()
+    if collection_name in [c.name for c in collections_list.collections]:
+        return collection_name
+    return None
+
+
+def swap_alias(client, alias_name: str, target_collection: str, old_collection=None) -> None:
+    """Point alias_name at target_collection in one atomic call (the caller drops the old version)"""
+    operations = []
+    if old_collection == alias_name:
+        # Deployed before aliases existed: the plain collection must go before the alias can take its name
+        print(f" Replacing plain collection '{alias_name}' with an alias")
+        client.delete_collection(collection_name=alias_name)
+    elif old_collection:
+        operations.append(DeleteAliasOperation(delete_alias=DeleteAlias(alias_name=alias_name)))
+    
+    operations.append(CreateAliasOperation(
+        create_alias=CreateAlias(collection_name=target_collection, alias_name=alias_name)
+    ))
+    client.update_collection_aliases(change_aliases_operations=operations)
+    print(f" Alias '{alias_name}' -> '{target_collection}'")
+
+
+def discard_unfinished(client, alias_name: str, target_collection: str, live_collection=None) -> None:
+    """
+    Delete a versioned collection whose build failed before the alias swap.
+    Kept when the legacy plain collection was already deleted to free the alias
+    name: it is then the only copy. Errors are logged, the build error is what
+    gets raised.
+    """
+    try:
+        if live_collection == alias_name and not client.collection_exists(collection_name=alias_name):
+            print(f" Keeping '{target_collection}', plain collection '{alias_name}' is already gone")
+            return
+        client.delete_collection(collection_name=target_collection)
+        print(f" Deleted unfinished collection '{target_collection}'")
+    except Exception as e:
+        print(f" Could not delete unfinished collection '{target_collection}': {str(e)}")
+
+
+def set_corpus_version(client, collection_name: str, version: str) -> None:
+    """Tag the collection so the agent's answer cache notices corpus changes"""
+    try:
+        client.update_collection(collection_name=collection_name, metadata={"corpus_version": version})
+    except Exception as e:
+        print(f" Could not set corpus version: {str(e)}")
+
+
+def get_corpus_version(client, collection_name: str):
+    """corpus_version the collection was last tagged with, None if untagged"""
+    metadata = client.get_collection(collection_name=collection_name).config.metadata or {}
+    return metadata.get("corpus_version")
+
+
+def live_content_hashes(client, collection_name: str) -> dict:
+    """point id -> content_hash payload for every point in the collection (no vectors)"""
+    hashes = {}
+    offset = None
+    while True:
+        records, offset = client.scroll(
+            collection_name=collection_name,
+            limit=1000,
+            offset=offset,
+            with_payload=["content_hash"],
+            with_vectors=False
+        )
+        for record in records:
+            hashes[str(record.id)] = (record.payload or {}).get("content_hash")
+        if offset is None:
+            return hashes
+
+
+def sync_collection(client, collection_name: str, bucket: str, embeddings_key: str, batch_size: int) -> dict:
+    """Make the live collection match the full artifact, touching only what differs"""
+    source = open_embeddings(bucket, embeddings_key)
+    
+    # First pass over the payload lines only: point id -> (row, content hash)
+    wanted = {
+        point_id(chunk["chunk_id"]): (i, digest)
+        for i, (chunk, digest) in enumerate(source.iter_payloads())
+    }
+    live = live_content_hashes(client, collection_name)
+    
+    changed = {i for pid, (i, digest) in wanted.items() if live.get(pid) != digest}
+    removed = [pid for pid in live if pid not in wanted]
+    print(f" Sync: {len(changed)} upserts, {len(removed)} deletes, {len(wanted) - len(changed)} unchanged")
+    
+    # Second pass streams only the changed rows (ranges without any are not fetched)
+    if changed:
+        PipelinedUploader.from_env(client, collection_name, batch_size=batch_size).upload_rows(
+            source.iter_rows(only=changed), total=len(changed)
+        )
+    
+    if removed:
+        client.delete(collection_name=collection_name, points_selector=PointIdsList(points=removed))
+    
+    if changed or removed or get_corpus_version(client, collection_name) != source.etag:
+        set_corpus_version(client, collection_name, source.etag)
+    
+    collection_info = client.get_collection(collection_name=collection_name)
+    print(f" Collection now has {collection_info.points_count} total points")
+    
+    return {
+        'statusCode': 200,
+        'body': json.dumps({
+            'collection_name': collection_name,
+            'vectors_uploaded': len(changed),
+            'vectors_deleted': len(removed),
+            'collection_points_count': collection_info.points_count,
+            'skipped': False
+        })
+    }
+
+
+def open_embeddings(bucket: str, key: str):
+    """
+    Row source for an artifact prefix, streamed from S3 with ranged GETs so peak
+    memory does not grow with the corpus. A legacy .npz key is loaded in memory.
+    """
+    if key.endswith('.npz'):
+        return LegacyNpzSource(bucket, key)
+    
+    print(f"⬇Streaming embeddings from s3://{bucket}/{key}")
+    source = S3ArtifactReader(s3, bucket, key, range_bytes=int(os.environ.get("S3_RANGE_BYTES", 8 * 1024 * 1024)))
+    header = source.header
+    print(f" Artifact: {header['model']} ({header['dtype']}, dim {header['dim']}, {header['count']} rows)")
+    return source
+
+
+class LegacyNpzSource:
+    """Same interface as S3ArtifactReader over a pickled NPZ written before the artifact format"""
+    
+    def __init__(self, bucket: str, key: str):
+        print(f"⬇Downloading embeddings from s3://{bucket}/{key}")
+        self.embeddings, self.chunks, self.content_hashes, deleted_ids = load_legacy_npz(bucket, key)
+        self.count = len(self.chunks)
+        self.dim = self.embeddings.shape[1]
+        self.header = {"deleted_ids": deleted_ids}
+        self.etag = s3.head_object(Bucket=bucket, Key=key)['ETag']
+    
+    def iter_payloads(self):
+        return zip(self.chunks, self.content_hashes)
+    
+    def iter_rows(self, only=None):
+        for i, chunk in enumerate(self.chunks):
+            if only is None or i in only:
+                yield chunk, self.embeddings[i], self.content_hashes[i]
+
+
+def load_legacy_npz(bucket: str, key: str):
+    """Pickled NPZ written before the artifact format"""
+    with tempfile.NamedTemporaryFile(suffix='.npz', delete=False) as tmp:
+        s3.download_file(bucket, key, tmp.name)
+        
+        print(" Loading embeddings file...")
+        # Use np.load instead of torch.load
+        with np.load(tmp.name, allow_pickle=True) as data:
+            embeddings = data["embeddings"]
+            # If chunks was saved as a single object array, use .item()
+            chunks = data["chunks"]
+            if chunks.dtype == object and chunks.ndim == 0:
+                chunks = chunks.item()
+            if "content_hashes" in data:
+                content_hashes = [str(h) for h in data["content_hashes"]]
+            else:
+                # Artifacts from before incremental runs carry no hashes
+                content_hashes = [content_hash(c) for c in chunks]
+            deleted_ids = [str(i) for i in data["deleted_ids"]] if "deleted_ids" in data else []
+        
+        os.unlink(tmp.name)
+    
+    return embeddings, chunks, content_hashes, deleted_ids
+
+
+def apply_delta(client, collection_name: str, bucket: str, delta_key: str, embeddings_key: str, batch_size: int) -> dict:
+    """
+    Upsert the changed chunks and delete the removed ones from a live collection.
+    
+    The delta only holds on top of the corpus it was diffed against: its header
+    carries base_version / target_version (corpus header ETags). If the
+    collection is not at base_version (a delta was skipped, or overwritten by a
+    later run before it was applied) fall back to sync_collection against the
+    full corpus, which converges from any state.
+    """
+    source = open_embeddings(bucket, delta_key)
+    base_version = source.header.get('base_version')
+    target_version = source.header.get('target_version')
+    current_version = get_corpus_version(client, collection_name)
+    
+    if target_version and current_version == target_version:
+        print(f" SKIPPING: delta s3://{bucket}/{delta_key} already applied")
+        return {
+            'statusCode': 200,
+            'body': json.dumps({
+                'collection_name': collection_name,
+                'message': 'Delta already applied',
+                'skipped': True
+            })
+        }
+    
+    if not target_version or current_version != base_version:
+        print(f" Delta goes {base_version} -> {target_version}, collection is at {current_version}: "
+              f"syncing against s3://{bucket}/{embeddings_key}")
+        return sync_collection(client, collection_name, bucket, embeddings_key, batch_size)
+    
+    deleted_ids = source.header['deleted_ids']
+    print(f" Delta: {source.count} upserts, {len(deleted_ids)} deletes")
+    
+    if source.count:
+        PipelinedUploader.from_env(client, collection_name, batch_size=batch_size).upload_rows(
+            source.iter_rows(), total=source.count
+        )
+    
+    if deleted_ids:
+        client.delete(
+            collection_name=collection_name,
+            points_selector=PointIdsList(points=[point_id(chunk_id) for chunk_id in deleted_ids])
+        )
+    
+    # The collection now matches the corpus the delta leads to
+    set_corpus_version(client, collection_name, target_version)
+    
+    collection_info = client.get_collection(collection_name=collection_name)
+    print(f" Collection now has {collection_info.points_count} total points")
+    
+    return {
+        'statusCode': 200,
+        'body': json.dumps({
+            'collection_name': collection_name,
+            'vectors_uploaded': source.count,
+            'vectors_deleted': len(deleted_ids),
+            'collection_points_count': collection_info.points_count,
+            'skipped': False
+        })
+    }
@@ -0,0 +1,272 @@
+"""
+Pipelined Qdrant Uploader
+
+Keeps several upsert batches in flight while the next ones are being built:
+1. N concurrent batches - point construction overlaps with network I/O
+2. Adaptive batch size - grows while batches are fast and small, shrinks when
+   latency or payload bytes get too high
+3. Per-batch retry with exponential backoff (upserts use deterministic ids,
+   so retrying a batch is idempotent)
+4. Throughput reporting in vectors/s
+5. Two transports:
+   - rest - pydantic PointStruct + JSON (~12 bytes per float on the wire)
+   - grpc - protobuf points built straight from numpy blocks, no PointStruct
+            validation and packed 4-byte floats (needs prefer_grpc=True).
+            Each vector is parsed from the block's raw little-endian float32
+            bytes, so no Python float is created per component
+"""
+
+import itertools
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from qdrant_client.models import PointStruct
+
+TRANSPORTS = ("rest", "grpc")
+
+# Approximate wire size of one vector component
+BYTES_PER_FLOAT = {"rest": 12, "grpc": 4}
+
+
+def point_id(chunk_id: str) -> str:
+    # Create deterministic UUID from chunk_id
+    return str(uuid.uuid5(uuid.NAMESPACE_OID, chunk_id))
+
+
+def build_points(chunks, embeddings, content_hashes) -> list:
+    """REST points, embeddings is a 2-D block converted in one tolist() call"""
+    vectors = np.asarray(embeddings, dtype=np.float32).tolist()
+    points = []
+    for i, chunk in enumerate(chunks):
+        # content_hash lets sync mode diff against the live collection
+        payload = dict(chunk, content_hash=content_hashes[i])
+
+        points.append(
+            PointStruct(
+                id=point_id(chunk["chunk_id"]),
+                vector=vectors[i],
+                payload=payload
+            )
+        )
+    return points
+
+
+def _varint(value: int) -> bytes:
+    """Protobuf base-128 varint"""
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if not value:
+            out.append(byte)
+            return bytes(out)
+        out.append(byte | 0x80)
+
+
+# Wire tag of Vector.data (field 1, length-delimited: packed repeated float)
+_VECTOR_DATA_TAG = b"\x0a"
+
+
+def grpc_vectors(embeddings) -> list:
+    """
+    One grpc.Vector per row of a 2-D block, parsed from the packed wire format
+    (tag, byte length, raw float32 row) instead of a list of Python floats:
+    the block is converted with a single tobytes() and protobuf copies the
+    bytes in C.
+    """
+    from qdrant_client import grpc
+
+    block = np.ascontiguousarray(embeddings, dtype="<f4")
+    row_bytes = block.shape[1] * 4 if block.ndim == 2 else 0
+    prefix = _VECTOR_DATA_TAG + _varint(row_bytes)
+    raw = block.tobytes()
+    return [
+        grpc.Vector.FromString(prefix + raw[i * row_bytes:(i + 1) * row_bytes])
+        for i in range(len(block))
+    ]
+
+
+def build_grpc_points(chunks, embeddings, content_hashes) -> list:
+    """gRPC points built directly as protobuf messages (skips pydantic + JSON)"""
+    from qdrant_client import grpc
+    from qdrant_client.conversions.conversion import payload_to_grpc
+
+    vectors = grpc_vectors(embeddings)
+    return [
+        grpc.PointStruct(
+            id=grpc.PointId(uuid=point_id(chunk["chunk_id"])),
+            vectors=grpc.Vectors(vector=vectors[i]),
+            payload=payload_to_grpc(dict(chunk, content_hash=content_hashes[i]))
+        )
+        for i, chunk in enumerate(chunks)
+    ]
+
+
+def estimate_bytes(chunks, embeddings, transport: str = "rest") -> int:
+    """Rough request size: vector components + serialized payload"""
+    vector_bytes = int(np.asarray(embeddings).size) * BYTES_PER_FLOAT[transport]
+    return vector_bytes + sum(len(json.dumps(c, ensure_ascii=False)) for c in chunks)
+
+
+class PipelinedUploader:
+    """Upload (chunk, vector, content_hash) rows with N batches in flight"""
+
+    def __init__(
+        self,
+        client,
+        collection_name: str,
+        max_in_flight: int = 4,
+        batch_size: int = 128,
+        min_batch_size: int = 16,
+        max_batch_size: int = 1024,
+        target_latency: float = 1.0,
+        max_batch_bytes: int = 8 * 1024 * 1024,
+        max_retries: int = 5,
+        backoff_base: float = 0.5,
+        transport: str = "rest",
+        sleep=time.sleep
+    ):
+        if transport not in TRANSPORTS:
+            raise ValueError(f"Unknown transport '{transport}', expected one of {TRANSPORTS}")
+
+        self.client = client
+        self.collection_name = collection_name
+        self.max_in_flight = max_in_flight
+        self.batch_size = batch_size
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.target_latency = target_latency
+        self.max_batch_bytes = max_batch_bytes
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.transport = transport
+        self.build = build_grpc_points if transport == "grpc" else build_points
+        self.sleep = sleep
+
+        self.retries = 0
+        self.batches = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, client, collection_name: str, **kwargs) -> "PipelinedUploader":
+        """QDRANT_UPLOAD_CONCURRENCY / QDRANT_BATCH_SIZE / QDRANT_BATCH_LATENCY / QDRANT_MAX_RETRIES / QDRANT_TRANSPORT"""
+        options = {
+            "max_in_flight": int(os.environ.get("QDRANT_UPLOAD_CONCURRENCY", 4)),
+            "batch_size": int(os.environ.get("QDRANT_BATCH_SIZE", 128)),
+            "target_latency": float(os.environ.get("QDRANT_BATCH_LATENCY", 1.0)),
+            "max_retries": int(os.environ.get("QDRANT_MAX_RETRIES", 5)),
+            "transport": os.environ.get("QDRANT_TRANSPORT", "rest")
+        }
+        options.update(kwargs)
+        return cls(client, collection_name, **options)
+
+    def upload(self, chunks, embeddings, content_hashes) -> Dict[str, Any]:
+        """Upload parallel sequences, embeddings is sliced as contiguous numpy blocks"""
+        embeddings = np.asarray(embeddings)
+
+        def batches():
+            start = 0
+            while start < len(chunks):
+                # batch_size is read per batch, so adaptation applies immediately
+                end = start + self.batch_size
+                yield chunks[start:end], embeddings[start:end], content_hashes[start:end]
+                start = end
+
+        return self._run(batches(), total=len(chunks))
+
+    def upload_rows(self, rows: Iterable[Tuple[dict, Any, str]], total: Optional[int] = None) -> Dict[str, Any]:
+        """Upload an iterable of (chunk, vector, content_hash)"""
+        rows = iter(rows)
+
+        def batches():
+            while True:
+                batch = list(itertools.islice(rows, self.batch_size))
+                if not batch:
+                    return
+                chunks, vectors, hashes = zip(*batch)
+                yield list(chunks), np.stack(vectors), list(hashes)
+
+        return self._run(batches(), total=total)
+
+    def _run(self, batches: Iterator[Tuple[list, np.ndarray, list]], total: Optional[int]) -> Dict[str, Any]:
+        """Build and upsert batches with max_in_flight outstanding, returns throughput stats"""
+        uploaded = 0
+        start = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as pool:
+            in_flight = {}
+
+            def submit_next() -> bool:
+                batch = next(batches, None)
+                if batch is None:
+                    return False
+                chunks, embeddings, hashes = batch
+                points = self.build(chunks, embeddings, hashes)
+                in_flight[pool.submit(self._upsert_with_retry, points)] = estimate_bytes(chunks, embeddings, self.transport)
+                return True
+
+            for _ in range(self.max_in_flight):
+                if not submit_next():
+                    break
+
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    payload_bytes = in_flight.pop(future)
+                    count, latency = future.result()
+                    uploaded += count
+                    self.batches += 1
+                    self._adapt(count, latency, payload_bytes)
+
+                    elapsed = time.perf_counter() - start
+                    progress = f"{uploaded}/{total} vectors ({uploaded / total * 100:.1f}%)" if total else f"{uploaded} vectors"
+                    print(f"✓ Uploaded {progress} - {uploaded / elapsed:.0f} vectors/s, batch size {self.batch_size}")
+
+                    submit_next()
+
+        seconds = time.perf_counter() - start
+        return {
+            "vectors": uploaded,
+            "batches": self.batches,
+            "retries": self.retries,
+            "seconds": round(seconds, 3),
+            "vectors_per_second": round(uploaded / seconds, 1) if seconds > 0 else 0.0,
+            "final_batch_size": self.batch_size,
+            "transport": self.transport
+        }
+
+    def _upsert_with_retry(self, points: List[Any]) -> Tuple[int, float]:
+        for attempt in range(self.max_retries + 1):
+            started = time.perf_counter()
+            try:
+                self.client.upsert(collection_name=self.collection_name, points=points, wait=True)
+                return len(points), time.perf_counter() - started
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                with self._lock:
+                    self.retries += 1
+                delay = self.backoff_base * (2 ** attempt) * (0.5 + random.random())
+                print(f" Batch of {len(points)} failed ({str(e)}), retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+                self.sleep(delay)
+
+    def _adapt(self, count: int, latency: float, payload_bytes: int) -> None:
+        """Multiplicative increase / decrease on latency and request size"""
+        bytes_per_point = payload_bytes / max(count, 1)
+        byte_cap = max(self.min_batch_size, int(self.max_batch_bytes / max(bytes_per_point, 1)))
+
+        if latency > self.target_latency:
+            size = self.batch_size // 2
+        elif latency < self.target_latency / 2 and count >= self.batch_size:
+            size = self.batch_size * 2
+        else:
+            size = self.batch_size
+
+        self.batch_size = max(self.min_batch_size, min(size, self.max_batch_size, byte_cap))
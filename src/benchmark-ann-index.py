@@ -0,0 +1,86 @@
+import os
+import sys
+import json
+import time
+import statistics
+import numpy as np
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "lambdas", "common"))
+
+# Needs the optional hnswlib (root requirements.txt: pip install hnswlib)
+from retriever import Retriever
+
+# -------- config --------
+SIZES = [int(n) for n in os.environ.get("BENCH_SIZES", "10000,100000,1000000").split(",")]
+DIM = int(os.environ.get("BENCH_DIM", 1024))
+NUM_QUERIES = 200
+TOP_K = 10
+EF_SEARCH = [16, 64, 256]
+OUTPUT_PATH = "../results/ann-index-benchmark.json"
+# ------------------------
+
+
+def synthetic_corpus(n, dim, rng, num_topics=256):
+    """Clustered vectors (topics + noise), closer to real embeddings than uniform noise"""
+    centers = rng.standard_normal((num_topics, dim), dtype=np.float32)
+    vectors = np.empty((n, dim), dtype=np.float32)
+    for start in range(0, n, 100_000):
+        end = min(start + 100_000, n)
+        topics = rng.integers(0, num_topics, end - start)
+        vectors[start:end] = centers[topics] + 0.8 * rng.standard_normal((end - start, dim), dtype=np.float32)
+    return vectors
+
+
+def latency_ms(search, queries):
+    timings = []
+    for q in queries:
+        start = time.perf_counter()
+        search(q)
+        timings.append((time.perf_counter() - start) * 1000)
+    return round(statistics.median(timings), 3), round(float(np.percentile(timings, 95)), 3)
+
+
+def recall_at_k(found, expected):
+    return round(float(np.mean([len(set(f) & set(e)) / len(e) for f, e in zip(found, expected)])), 4)
+
+
+rng = np.random.default_rng(0)
+results = {"dim": DIM, "top_k": TOP_K, "num_queries": NUM_QUERIES, "sizes": {}}
+
+for n in SIZES:
+    print(f"\n {n} vectors x {DIM} dims")
+    vectors = synthetic_corpus(n, DIM, rng)
+    queries = vectors[rng.choice(n, NUM_QUERIES, replace=False)] + 0.3 * rng.standard_normal((NUM_QUERIES, DIM), dtype=np.float32)
+
+    retriever = Retriever(vectors, [{"chunk_id": f"c{i}"} for i in range(n)])
+    del vectors
+
+    _, exact_idx = retriever.search(queries, k=TOP_K, exact=True)
+    exact_p50, exact_p95 = latency_ms(lambda q: retriever.search(q, k=TOP_K, exact=True), queries)
+    entry = {"exact": {"p50_ms": exact_p50, "p95_ms": exact_p95, "memory_mb": round(retriever.vectors.nbytes / 1e6, 1)}}
+    print(f"   exact: {entry['exact']}")
+
+    start = time.perf_counter()
+    index = retriever.build_ann_index()
+    entry["hnsw_build_sec"] = round(time.perf_counter() - start, 2)
+
+    scratch = f"/tmp/ann-bench-{n}"
+    os.makedirs(scratch, exist_ok=True)
+    entry["hnsw_index_mb"] = round(os.path.getsize(retriever.save_ann_index(scratch)) / 1e6, 1)
+
+    for ef in EF_SEARCH:
+        index.ef_search = ef
+        _, ann_idx = retriever.search(queries, k=TOP_K)
+        p50, p95 = latency_ms(lambda q: retriever.search(q, k=TOP_K), queries)
+        entry[f"hnsw_ef{ef}"] = {"recall_at_k": recall_at_k(ann_idx, exact_idx), "p50_ms": p50, "p95_ms": p95}
+        print(f"   hnsw ef={ef}: {entry[f'hnsw_ef{ef}']}")
+
+    results["sizes"][str(n)] = entry
+    del retriever, index
+
+os.makedirs(os.path.dirname(OUTPUT_PATH), exist_ok=True)
+with open(OUTPUT_PATH, "w") as f:
+    json.dump(results, f, indent=2)
+
+print(f"\n Results saved to {OUTPUT_PATH}")
@@ -0,0 +1,96 @@
+import os
+import sys
+import json
+import time
+import statistics
+import numpy as np
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "lambdas", "common"))
+
+from embedding_backend import BACKENDS, cosine_drift, encode_length_bucketed, export_onnx, load_encoder
+
+# -------- config --------
+MODEL_PATH = "../data/models/mxbai_model"
+ONNX_PATH = "../data/models/mxbai_onnx"
+CHUNKS_PATH = "../data/chunks/final_chunks.json"
+OUTPUT_PATH = "../results/embedding-backends-benchmark.json"
+NUM_QUERIES = 50
+CORPUS_SAMPLE = 256
+BATCH_SIZE = 32
+# ------------------------
+
+if not os.path.exists(MODEL_PATH):
+    from sentence_transformers import SentenceTransformer
+    SentenceTransformer("mixedbread-ai/mxbai-embed-large-v1").save(MODEL_PATH)
+
+if not os.path.exists(os.path.join(ONNX_PATH, "model_int8.onnx")):
+    export_onnx(MODEL_PATH, ONNX_PATH)
+
+with open(CHUNKS_PATH) as f:
+    all_chunks = json.load(f)
+
+corpus_texts = [c["content"] for c in all_chunks[:CORPUS_SAMPLE]]
+# Short question-like inputs, the agent's hot path
+queries = [" ".join(text.split()[:12]) for text in corpus_texts[:NUM_QUERIES]]
+
+
+def dir_size_mb(path, files=None):
+    names = files or os.listdir(path)
+    return round(sum(os.path.getsize(os.path.join(path, n)) for n in names) / 1e6, 1)
+
+
+results = {}
+reference = None
+
+for backend in BACKENDS:
+    print(f"\n Benchmarking {backend}...")
+
+    start = time.perf_counter()
+    encoder = load_encoder(backend, model_path=MODEL_PATH, onnx_path=ONNX_PATH)
+    load_sec = time.perf_counter() - start
+
+    encoder.encode(queries[0])  # warm-up
+
+    latencies = []
+    for q in queries:
+        start = time.perf_counter()
+        encoder.encode(q)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    corpus_embs = encoder.encode(corpus_texts, batch_size=BATCH_SIZE)
+    corpus_sec = time.perf_counter() - start
+
+    # Same texts, sorted by token length and batched under the token budget
+    # (SentenceTransformer already length-sorts inside encode(), ONNX pads in corpus order)
+    _, bucketed = encode_length_bucketed(encoder, corpus_texts)
+
+    if reference is None:
+        reference = corpus_embs
+
+    if backend == "torch":
+        size_mb = dir_size_mb(MODEL_PATH, [n for n in os.listdir(MODEL_PATH) if n.endswith((".safetensors", ".bin"))])
+    else:
+        size_mb = dir_size_mb(ONNX_PATH, ["model_int8.onnx" if backend == "onnx-int8" else "model.onnx"])
+
+    results[backend] = {
+        "load_sec": round(load_sec, 2),
+        "query_p50_ms": round(statistics.median(latencies), 2),
+        "query_p95_ms": round(float(np.percentile(latencies, 95)), 2),
+        "corpus_texts_per_sec": round(len(corpus_texts) / corpus_sec, 2),
+        "corpus_bucketed_texts_per_sec": round(len(corpus_texts) / bucketed["seconds"], 2),
+        "corpus_bucketed_tokens_per_sec": bucketed["tokens_per_second"],
+        "corpus_bucketed_padding_ratio": bucketed["padding_ratio"],
+        "model_size_mb": size_mb,
+        "parity_vs_torch": cosine_drift(reference, corpus_embs)
+    }
+
+    for k, v in results[backend].items():
+        print(f"  {k}: {v}")
+
+os.makedirs(os.path.dirname(OUTPUT_PATH), exist_ok=True)
+with open(OUTPUT_PATH, "w") as f:
+    json.dump(results, f, indent=4)
+
+print(f"\nResults saved to {OUTPUT_PATH}")
@@ -0,0 +1,77 @@
+import os
+import sys
+import json
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "lambdas", "common"))
+
+from embedding_backend import cosine_drift, encode_multiprocess, export_onnx
+
+# -------- config --------
+MODEL_PATH = "../data/models/mxbai_model"
+ONNX_PATH = "../data/models/mxbai_onnx"
+CHUNKS_PATH = "../data/chunks/final_chunks.json"
+OUTPUT_PATH = "../results/encoding-pool-benchmark.json"
+BACKEND = os.environ.get("EMBEDDING_BACKEND", "onnx")
+CORPUS_SAMPLE = int(os.environ.get("BENCH_CORPUS_SAMPLE", 1024))
+# ------------------------
+
+if not os.path.exists(MODEL_PATH):
+    from sentence_transformers import SentenceTransformer
+    SentenceTransformer("mixedbread-ai/mxbai-embed-large-v1").save(MODEL_PATH)
+
+if BACKEND != "torch" and not os.path.exists(os.path.join(ONNX_PATH, "model_int8.onnx")):
+    export_onnx(MODEL_PATH, ONNX_PATH)
+
+with open(CHUNKS_PATH) as f:
+    corpus_texts = [c["content"] for c in json.load(f)[:CORPUS_SAMPLE]]
+
+num_cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+
+# 1, 2, 4, ... single-threaded workers up to every core, plus one process using all cores
+configs = []
+workers = 1
+while workers <= num_cores:
+    configs.append((workers, 1))
+    workers *= 2
+if configs[-1][0] != num_cores:
+    configs.append((num_cores, 1))
+configs.append((1, num_cores))
+
+results = {"backend": BACKEND, "num_cores": num_cores, "num_texts": len(corpus_texts), "runs": []}
+reference = None
+
+for workers, threads in configs:
+    print(f"\n Encoding {len(corpus_texts)} chunks with {workers} workers x {threads} threads...")
+    embeddings, stats = encode_multiprocess(
+        corpus_texts, workers=workers, threads_per_worker=threads,
+        backend=BACKEND, model_path=MODEL_PATH, onnx_path=ONNX_PATH
+    )
+    if reference is None:
+        reference = embeddings
+
+    run = {
+        "workers": workers,
+        "threads_per_worker": threads,
+        "wall_sec": stats["seconds"],
+        "encode_sec": stats["encode_seconds"],
+        "encode_texts_per_sec": round(len(corpus_texts) / stats["encode_seconds"], 2),
+        "encode_tokens_per_sec": round(stats["tokens"] / stats["encode_seconds"], 1),
+        "parity_vs_first_run": cosine_drift(reference, embeddings)
+    }
+    results["runs"].append(run)
+    print(f"   {run}")
+
+baseline = results["runs"][0]["encode_sec"]
+for run in results["runs"]:
+    cores_used = run["workers"] * run["threads_per_worker"]
+    run["speedup"] = round(baseline / run["encode_sec"], 2)
+    run["efficiency"] = round(run["speedup"] / cores_used, 2)
+
+print(json.dumps(results, indent=2))
+
+os.makedirs(os.path.dirname(OUTPUT_PATH), exist_ok=True)
+with open(OUTPUT_PATH, "w") as f:
+    json.dump(results, f, indent=2)
+
+print(f"\n Results saved to {OUTPUT_PATH}")
@@ -0,0 +1,153 @@
+import os
+import re
+import sys
+import json
+import time
+import random
+import statistics
+from types import SimpleNamespace
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "agent", "message_handler"))
+
+from evaluator import RAGEvaluator, TokenIndex
+
+# -------- config --------
+CHUNKS_PATH = "../data/chunks/final_chunks.json"
+OUTPUT_PATH = "../results/evaluator-benchmark.json"
+NUM_ANSWERS = 200
+ANSWER_WORDS = 350  # ~512 output tokens
+SEED = 0
+# ------------------------
+
+
+class StringScorer(RAGEvaluator):
+    """Groundedness / attribution as computed before the token index, for the baseline"""
+
+    def _get_ngrams(self, text, n):
+        words = re.findall(r'\b\w+\b', text)
+        ngrams = set()
+        for i in range(len(words) - n + 1):
+            ngram = " ".join(words[i:i + n])
+            if len(ngram.replace(" ", "")) >= n * 3:
+                ngrams.add(ngram)
+        return ngrams
+
+    def calculate_groundedness_score(self, response, context_chunks):
+        response_lower = response.lower()
+        context_lower = " ".join(context_chunks).lower()
+        response_words = set(w for w in re.findall(r'\b\w+\b', response_lower) if len(w) >= 4)
+        context_words = set(w for w in re.findall(r'\b\w+\b', context_lower) if len(w) >= 4)
+        if not response_words:
+            return 0.0
+        unigram_overlap = len(response_words & context_words) / len(response_words)
+        response_bigrams = self._get_ngrams(response_lower, n=2)
+        context_bigrams = self._get_ngrams(context_lower, n=2)
+        bigram_overlap = len(response_bigrams & context_bigrams) / len(response_bigrams) if response_bigrams else 0.0
+        return round(0.6 * unigram_overlap + 0.4 * bigram_overlap, 3)
+
+    def calculate_source_attribution_score(self, response, search_results):
+        response_lower = response.lower()
+        sources_used = 0
+        for result in search_results[:3]:
+            for phrase in self._get_ngrams(result.payload.get('content', '').lower(), n=3):
+                if phrase in response_lower:
+                    sources_used += 1
+                    break
+        return round(sources_used / min(3, len(search_results)), 3)
+
+
+with open(CHUNKS_PATH) as f:
+    all_chunks = json.load(f)
+
+rng = random.Random(SEED)
+
+
+def make_answer(chunks):
+    """Spans copied from the retrieved chunks mixed with words from elsewhere in the corpus"""
+    words = []
+    while len(words) < ANSWER_WORDS:
+        source = rng.choice(chunks) if rng.random() < 0.6 else rng.choice(all_chunks)
+        tokens = source["content"].split()
+        start = rng.randrange(max(len(tokens) - 8, 1))
+        words.extend(tokens[start:start + rng.randint(3, 12)])
+    return " ".join(words[:ANSWER_WORDS])
+
+
+cases = []
+for _ in range(NUM_ANSWERS):
+    chunks = rng.sample(all_chunks, 3)
+    results = [SimpleNamespace(score=0.5, payload=c) for c in chunks]
+    cases.append((make_answer(chunks), results))
+
+
+def evaluate(evaluator, response, results):
+    context_chunks = [r.payload["content"] for r in results]
+    return (
+        evaluator.calculate_groundedness_score(response, context_chunks),
+        evaluator.calculate_coherence_score(response),
+        evaluator.calculate_source_attribution_score(response, results)
+    )
+
+
+def time_per_answer(evaluator):
+    latencies, scores = [], []
+    for response, results in cases:
+        start = time.perf_counter()
+        scores.append(evaluate(evaluator, response, results))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies, scores
+
+
+results = {}
+baseline_latencies, baseline_scores = time_per_answer(StringScorer())
+indexed_latencies, indexed_scores = time_per_answer(RAGEvaluator())
+# Same answers again with every text already tokenized (chunks the container has seen before)
+evaluator = RAGEvaluator(TokenIndex(max_cached_texts=4 * NUM_ANSWERS))
+time_per_answer(evaluator)
+warm_latencies, _ = time_per_answer(evaluator)
+
+# Token by token during generation: feed() per delta, only finalize() after the last one
+stream_feed_latencies, stream_finalize_latencies = [], []
+evaluator = RAGEvaluator()
+for response, search_results in cases:
+    context_chunks = [r.payload["content"] for r in search_results]
+    retrieval_metrics = evaluator.calculate_retrieval_score(search_results)
+    stream = evaluator.stream(context_chunks, search_results, retrieval_metrics)
+    deltas = re.findall(r"\S+\s*|\s+", response)
+
+    start = time.perf_counter()
+    for delta in deltas:
+        stream.feed(delta)
+    stream_feed_latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    stream.finalize()
+    stream_finalize_latencies.append((time.perf_counter() - start) * 1000)
+
+for name, latencies in (
+    ("string_ngrams", baseline_latencies),
+    ("token_index", indexed_latencies),
+    ("token_index_warm", warm_latencies),
+    ("stream_feed_total", stream_feed_latencies),
+    ("stream_finalize", stream_finalize_latencies)
+):
+    results[name] = {
+        "per_answer_p50_ms": round(statistics.median(latencies), 3),
+        "per_answer_mean_ms": round(statistics.mean(latencies), 3),
+        "per_answer_max_ms": round(max(latencies), 3)
+    }
+
+results["speedup_p50"] = round(results["string_ngrams"]["per_answer_p50_ms"] / results["token_index"]["per_answer_p50_ms"], 1)
+results["groundedness_equal"] = all(a[0] == b[0] for a, b in zip(baseline_scores, indexed_scores))
+# Substring scan also matched phrases inside longer words, the token sets only whole words
+results["attribution_changed"] = sum(a[2] != b[2] for a, b in zip(baseline_scores, indexed_scores))
+
+for k, v in results.items():
+    print(f"  {k}: {v}")
+
+os.makedirs(os.path.dirname(OUTPUT_PATH), exist_ok=True)
+with open(OUTPUT_PATH, "w") as f:
+    json.dump(results, f, indent=4)
+
+print(f"\nResults saved to {OUTPUT_PATH}")
@@ -0,0 +1,117 @@
+import os
+import sys
+import json
+import time
+import numpy as np
+from dotenv import load_dotenv
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "lambdas", "store_qdrant"))
+
+from uploader import PipelinedUploader, build_grpc_points, build_points
+
+load_dotenv()
+
+# -------- config --------
+NUM_VECTORS = int(os.environ.get("BENCH_NUM_VECTORS", 100_000))
+DIM = 1024
+BATCH_SIZE = 256
+OUTPUT_PATH = "../results/qdrant-upload-benchmark.json"
+# Set to run the end-to-end part against a real cluster (scratch collections are deleted afterwards)
+QDRANT_URL = os.environ.get("QDRANT_URL")
+QDRANT_API_KEY = os.environ.get("QDRANT_API_KEY")
+# ------------------------
+
+rng = np.random.default_rng(0)
+embeddings = rng.standard_normal((NUM_VECTORS, DIM), dtype=np.float32)
+# ~ the size of a real LinkedIn / transcript chunk payload
+chunks = [
+    {
+        "chunk_id": f"bench_{i}",
+        "source": "youtube",
+        "content": "lorem ipsum " * 80,
+        "metadata": {"url": "https://youtu.be/bench", "author": "Lenny Rachitsky", "chunk_index": i}
+    }
+    for i in range(NUM_VECTORS)
+]
+content_hashes = [f"{i:064x}" for i in range(NUM_VECTORS)]
+
+
+def serialize_rest(points):
+    from qdrant_client.models import PointsList
+    return PointsList(points=points).model_dump_json().encode()
+
+
+def build_grpc_lists(chunks, embeddings, content_hashes):
+    """gRPC points with vectors from tolist() (one Python float per component), the baseline for raw bytes"""
+    from qdrant_client import grpc
+
+    points = build_grpc_points(chunks, embeddings, content_hashes)
+    for point, row in zip(points, np.asarray(embeddings, dtype=np.float32).tolist()):
+        point.vectors.vector.CopyFrom(grpc.Vector(data=row))
+    return points
+
+
+def serialize_grpc(points):
+    from qdrant_client import grpc
+    return grpc.UpsertPoints(collection_name="bench", points=points).SerializeToString()
+
+
+# 1. Client-side cost: point construction + request serialization (no network)
+results = {"num_vectors": NUM_VECTORS, "dim": DIM, "batch_size": BATCH_SIZE}
+
+for name, build, serialize in [
+    ("rest+list", build_points, serialize_rest),
+    ("grpc+list", build_grpc_lists, serialize_grpc),
+    ("grpc+raw_bytes", build_grpc_points, serialize_grpc),
+]:
+    print(f"\n Serializing {NUM_VECTORS} vectors with {name}...")
+    build_sec = serialize_sec = 0.0
+    total_bytes = 0
+
+    for start in range(0, NUM_VECTORS, BATCH_SIZE):
+        end = start + BATCH_SIZE
+
+        t0 = time.perf_counter()
+        points = build(chunks[start:end], embeddings[start:end], content_hashes[start:end])
+        t1 = time.perf_counter()
+        body = serialize(points)
+        t2 = time.perf_counter()
+
+        build_sec += t1 - t0
+        serialize_sec += t2 - t1
+        total_bytes += len(body)
+
+    results[name] = {
+        "build_sec": round(build_sec, 2),
+        "serialize_sec": round(serialize_sec, 2),
+        "cpu_vectors_per_sec": round(NUM_VECTORS / (build_sec + serialize_sec), 1),
+        "request_mb": round(total_bytes / 1e6, 1)
+    }
+    print(f"   {results[name]}")
+
+# 2. End-to-end upload through the pipelined uploader
+if QDRANT_URL:
+    from qdrant_client import QdrantClient
+    from qdrant_client.models import Distance, VectorParams
+
+    for transport in ("rest", "grpc"):
+        client = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY, port=None, prefer_grpc=transport == "grpc")
+        collection = f"benchmark_upload_{transport}"
+        client.create_collection(collection, vectors_config=VectorParams(size=DIM, distance=Distance.COSINE))
+        try:
+            print(f"\n Uploading to {collection}...")
+            stats = PipelinedUploader(client, collection, batch_size=BATCH_SIZE, transport=transport).upload(
+                chunks, embeddings, content_hashes
+            )
+            results[f"upload_{transport}"] = stats
+        finally:
+            client.delete_collection(collection)
+
+print(json.dumps(results, indent=2))
+
+os.makedirs(os.path.dirname(OUTPUT_PATH), exist_ok=True)
+with open(OUTPUT_PATH, "w") as f:
+    json.dump(results, f, indent=2)
+
+print(f"\n Results saved to {OUTPUT_PATH}")
@@ -0,0 +1,126 @@
+import os
+import sys
+import json
+import time
+import random
+import statistics
+import tracemalloc
+from types import SimpleNamespace
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "agent", "message_handler"))
+
+from evaluator import RAGEvaluator
+from streaming import FlushPolicy, ResponseBuilder, TokenCoalescer
+
+# -------- config --------
+OUTPUT_PATH = "../results/response-builder-benchmark.json"
+TOKEN_COUNTS = [512, 4096, 16384]  # maxTokens today, long-form answers
+REPEATS = 5
+SEED = 0
+# ------------------------
+
+rng = random.Random(SEED)
+WORDS = (
+    "retention growth product market fit founders users pricing onboarding "
+    "the a of to and in is it we you team roadmap metrics churn experiment"
+).split()
+
+
+def make_tokens(n):
+    """Bedrock-like deltas: mostly one word with its space, a sentence end every ~15"""
+    return [
+        rng.choice(WORDS) + (". " if rng.random() < 0.07 else " ")
+        for _ in range(n)
+    ]
+
+
+def concat(tokens):
+    """The previous loop: `full_response += token`"""
+    full_response = ""
+    for token in tokens:
+        full_response += token
+    return full_response
+
+
+def concat_shared(tokens):
+    """
+    Same loop while another reference to the string is alive (e.g. a debugger,
+    a log call or a closure). CPython can then no longer grow it in place and
+    every += copies the whole answer: the quadratic case.
+    """
+    full_response, previous = "", None
+    for token in tokens:
+        previous = full_response
+        full_response += token
+    return full_response
+
+
+def builder_only(tokens):
+    builder = ResponseBuilder()
+    for token in tokens:
+        builder.add(token)
+    return builder.text()
+
+
+context = [" ".join(rng.choice(WORDS) for _ in range(300)) for _ in range(3)]
+search_results = [SimpleNamespace(score=0.6, payload={"content": c, "source": "linkedin"}) for c in context]
+evaluator = RAGEvaluator()
+retrieval_metrics = evaluator.calculate_retrieval_score(search_results)
+
+
+def builder_full(tokens):
+    """What the handler runs per delta: buffer + chunk frames + streaming evaluation"""
+    builder = ResponseBuilder(
+        TokenCoalescer(lambda frame: None, FlushPolicy()),
+        evaluation=evaluator.stream(context, search_results, retrieval_metrics)
+    )
+    for token in tokens:
+        builder.add(token)
+    builder.flush()
+    builder.evaluation.finalize()
+    return builder.text()
+
+
+def measure(fn, tokens):
+    seconds = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        fn(tokens)
+        seconds.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    fn(tokens)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "ms": round(statistics.median(seconds) * 1000, 3),
+        "us_per_token": round(statistics.median(seconds) / len(tokens) * 1e6, 3),
+        "peak_kb": round(peak / 1024, 1)
+    }
+
+
+results = {}
+for n in TOKEN_COUNTS:
+    tokens = make_tokens(n)
+    assert concat(tokens) == builder_only(tokens) == builder_full(tokens)
+
+    results[n] = {
+        name: measure(fn, tokens)
+        for name, fn in (
+            ("concat", concat),
+            ("concat_shared_ref", concat_shared),
+            ("builder", builder_only),
+            ("builder_coalescer_evaluation", builder_full)
+        )
+    }
+
+    print(f"\n {n} tokens:")
+    for k, v in results[n].items():
+        print(f"  {k}: {v}")
+
+os.makedirs(os.path.dirname(OUTPUT_PATH), exist_ok=True)
+with open(OUTPUT_PATH, "w") as f:
+    json.dump(results, f, indent=4)
+
+print(f"\nResults saved to {OUTPUT_PATH}")
@@ -1,9 +1,9 @@
 import os
+import sys
 import json
 import numpy as np
-from sentence_transformers import SentenceTransformer, util
+from sentence_transformers import SentenceTransformer
 from openai import OpenAI
-from tqdm import tqdm
 from dotenv import load_dotenv
 import torch
 import time
@@ -11,13 +11,31 @@ import time
 
 load_dotenv()
 
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "lambdas", "common"))
+
+from retriever import Retriever, rank_metrics
+
 with open("../data/chunks/final_chunks.json", "r") as f:
     all_chunks = json.load(f)
 
-with open("../data/chunks/youtube_50_questions.json", "r") as f:
-    gold_set = json.load(f)
+# gold set name -> questions ({"question", "correct_id"}), see generate-synthetic-questions.py
+GOLD_SETS = {
+    "linkedin": "../data/chunks/linkedin_50_questions.json",
+    "youtube": "../data/chunks/youtube_50_questions.json",
+    "mixed": "../data/chunks/mixed_25_25_questions.json",
+}
+gold_sets = {}
+for gold_name, gold_path in GOLD_SETS.items():
+    if os.path.exists(gold_path):
+        with open(gold_path, "r") as f:
+            gold_sets[gold_name] = json.load(f)
+
+TOP_K = 10
+KS = (1, 5, 10)
 
 corpus_texts = [c['content'] for c in all_chunks]
+row_of = {c["chunk_id"]: i for i, c in enumerate(all_chunks)}
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 def get_openai_embeddings(texts):
@@ -25,75 +43,65 @@ def get_openai_embeddings(texts):
     return np.array([res.embedding for res in response.data])
 
 def evaluate_model(name, model_type="local", path=None):
+    """
+    Corpus encoded once per model, then per gold set: every question in one
+    encode call, one (questions x corpus) top-k, metrics over the whole
+    result matrix.
+    """
     print(f"\n Evaluating {name}...")
 
     device = "cuda" if torch.cuda.is_available() else "cpu"
     print(f"Using device: {device}")
 
+    start = time.perf_counter()
     if model_type == "local":
         model = SentenceTransformer(path, device=device)
-
         corpus_embs = model.encode(
             corpus_texts,
-            convert_to_tensor=True,
+            convert_to_numpy=True,
             show_progress_bar=True
         )
-
+        encode = lambda texts: model.encode(texts, convert_to_numpy=True, batch_size=64)
     else:
         # OpenAI runs on remote GPUs (cannot change)
         corpus_embs = get_openai_embeddings(corpus_texts)
-        corpus_embs = util.normalize_embeddings(corpus_embs)
-
-    metrics = {
-        "MRR": 0.0,
-        "HitRate@5": 0.0,
-        "AvgQueryTimeSec": 0.0,
-    }
+        encode = get_openai_embeddings
+    corpus_encode_sec = time.perf_counter() - start
 
-    total_query_time = 0.0
+    # Normalized once, all questions of a gold set are one matmul + argpartition
+    retriever = Retriever(corpus_embs, all_chunks)
 
-    for item in tqdm(gold_set, desc=f"{name} Queries"):
-        query = item["question"]
-        correct_id = item["correct_id"]
+    per_gold_set = {}
+    for gold_name, gold_set in gold_sets.items():
+        questions = [item["question"] for item in gold_set]
+        relevant = [[row_of[item["correct_id"]]] if item["correct_id"] in row_of else [] for item in gold_set]
 
         start = time.perf_counter()
+        query_embs = encode(questions)
+        encode_sec = time.perf_counter() - start
 
-        if model_type == "local":
-            query_emb = model.encode(query, convert_to_tensor=True)
-
-            search_results = util.semantic_search(
-                query_emb, corpus_embs, top_k=10
-            )[0]
-
-        else:
-            query_emb = get_openai_embeddings([query])[0]
-            scores = np.dot(corpus_embs, query_emb)
-            top_indices = np.argsort(scores)[::-1][:10]
-            search_results = [{"corpus_id": idx} for idx in top_indices]
-
-        total_query_time += (time.perf_counter() - start)
-
-        retrieved_ids = [
-            all_chunks[res["corpus_id"]]["chunk_id"]
-            for res in search_results
-        ]
-
-        if correct_id in retrieved_ids[:5]:
-            metrics["HitRate@5"] += 1
-            rank = retrieved_ids.index(correct_id) + 1
-            metrics["MRR"] += 1.0 / rank
-
-    num_queries = len(gold_set)
-
-    metrics["MRR"] = round(metrics["MRR"] / num_queries, 4)
-    metrics["HitRate@5"] = round(metrics["HitRate@5"] / num_queries, 4)
-    metrics["AvgQueryTimeSec"] = round(total_query_time / num_queries, 4)
-
-    print(f"\n Results for {name}:")
-    for k, v in metrics.items():
-        print(f"  {k}: {v}")
-
-    return metrics
+        start = time.perf_counter()
+        _, top_indices = retriever.search(query_embs, k=TOP_K)
+        search_sec = time.perf_counter() - start
+
+        metrics = rank_metrics(top_indices, relevant, ks=KS)
+        num_queries = len(questions)
+        per_gold_set[gold_name] = {
+            # MRR was cut off at rank 5 in the per-query loop, kept for comparable results
+            "MRR": metrics["MRR@5"],
+            "HitRate@5": metrics["HitRate@5"],
+            "AvgQueryTimeSec": round((encode_sec + search_sec) / num_queries, 4),
+            **metrics,
+            "QueryEncodeMsPerQuery": round(encode_sec / num_queries * 1000, 3),
+            "SearchMsPerQuery": round(search_sec / num_queries * 1000, 3),
+            "CorpusEncodeSec": round(corpus_encode_sec, 2)
+        }
+
+        print(f"\n Results for {name} on {gold_name}:")
+        for k, v in per_gold_set[gold_name].items():
+            print(f"  {k}: {v}")
+
+    return per_gold_set
 
 """
 These embeddings were chosen based on their performance in : https://arxiv.org/pdf/2407.08275v1
@@ -114,12 +122,12 @@ results = {
 
 print("\n" + "="*40 + "\n FINAL LEADERBOARD\n" + "="*40)
 
-OUTPUT_PATH = "../results/youtube-testing-embeddings.json"
-os.makedirs(os.path.dirname(OUTPUT_PATH), exist_ok=True)
-
-with open(OUTPUT_PATH, "w") as f:
-    json.dump(results, f, indent=4)
-
-print(f"\nResults saved to {OUTPUT_PATH}")
+# One file per gold set, same layout the plotter reads (model -> metrics)
+for gold_name in gold_sets:
+    OUTPUT_PATH = f"../results/{gold_name}-testing-embeddings.json"
+    os.makedirs(os.path.dirname(OUTPUT_PATH), exist_ok=True)
 
+    with open(OUTPUT_PATH, "w") as f:
+        json.dump({model: per_gold_set[gold_name] for model, per_gold_set in results.items()}, f, indent=4)
 
+    print(f"\nResults saved to {OUTPUT_PATH}")
@@ -1,39 +1,48 @@
-from sentence_transformers import SentenceTransformer
 import json
-import numpy as np
 import boto3
 import os
+import sys
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "lambdas", "common"))
+
+from embedding_artifact import upload_artifact, write_artifact
+from embedding_backend import TorchEncoder, encode_length_bucketed, encode_multiprocess
+from manifest import content_hash
 
 # -------- config --------
-LOCAL_PATH = "../data/embedded/mxbai_corpus.npz"
+LOCAL_PATH = "../data/embedded/mxbai_corpus"
 S3_BUCKET = "virtual-lenny-bucket"
-S3_KEY = "data/embedded/mxbai_corpus.npz"  # exact same path
+S3_KEY = "data/embedded/mxbai_corpus/"  # exact same path
+MODEL_NAME = "mixedbread-ai/mxbai-embed-large-v1"
+# >0 encodes on CPU with that many worker processes instead of the GPU
+CPU_WORKERS = int(os.environ.get("EMBEDDING_WORKERS", 0))
+THREADS_PER_WORKER = int(os.environ.get("EMBEDDING_THREADS_PER_WORKER", 0)) or None
 # ------------------------
 
-model = SentenceTransformer(
-    "mixedbread-ai/mxbai-embed-large-v1",
-    device="cuda"
-)
-
 with open("../data/chunks/final_chunks.json") as f:
     all_chunks = json.load(f)
 
 corpus_texts = [c["content"] for c in all_chunks]
 
-corpus_embs = model.encode(
-    corpus_texts,
-    convert_to_tensor=True,
-    show_progress_bar=True
-)
-
-# move to cpu + numpy
-embeddings_np = corpus_embs.detach().cpu().numpy()
-
-# save as npz
-np.savez(
+# short LinkedIn posts and long transcript chunks are batched apart, rows come back in corpus order
+if CPU_WORKERS:
+    embeddings_np, stats = encode_multiprocess(
+        corpus_texts, workers=CPU_WORKERS, threads_per_worker=THREADS_PER_WORKER, backend="torch", model_path=MODEL_NAME
+    )
+else:
+    model = TorchEncoder(MODEL_NAME, device="cuda")
+    embeddings_np, stats = encode_length_bucketed(model, corpus_texts)
+print(f"Encoded {stats['texts']} chunks in {stats['batches']} batches: "
+      f"{stats['tokens_per_second']:.0f} tokens/s, {stats['padding_ratio'] * 100:.1f}% padding")
+
+# save as artifact (header.json + embeddings.npy + chunks.jsonl)
+write_artifact(
     LOCAL_PATH,
-    embeddings=embeddings_np,
-    chunks=np.array(all_chunks, dtype=object)
+    embeddings_np,
+    all_chunks,
+    [content_hash(c) for c in all_chunks],
+    model=MODEL_NAME
 )
 
 print(f"Saved embeddings locally to {LOCAL_PATH}")
@@ -41,10 +50,6 @@ print(f"Saved embeddings locally to {LOCAL_PATH}")
 # -------- upload to S3 --------
 s3 = boto3.client("s3")
 
-s3.upload_file(
-    Filename=LOCAL_PATH,
-    Bucket=S3_BUCKET,
-    Key=S3_KEY
-)
+upload_artifact(s3, S3_BUCKET, S3_KEY, LOCAL_PATH)
 
 print(f"Uploaded to s3://{S3_BUCKET}/{S3_KEY}")
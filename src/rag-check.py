@@ -1,4 +1,5 @@
 import os
+import sys
 import torch
 import time
 import json
@@ -11,6 +12,11 @@ from google import genai
 
 load_dotenv()  
 
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "lambdas", "common"))
+
+from retriever import Retriever
+
 
 # --- CONFIG ---
 DATA_PATH = "../data/embedded/mxbai_corpus.pt"
@@ -23,8 +29,8 @@ MAX_RPD = 20
 
 print("Loading embeddings and chunks...")
 data = torch.load(DATA_PATH)
-corpus_embs = data["embeddings"]
-chunks = data["chunks"]
+# Normalized once into a contiguous matrix, every question is one matmul + argpartition
+retriever = Retriever(data["embeddings"].cpu().numpy(), data["chunks"])
 
 print("Loading embedding model for queries...")
 embed_model = SentenceTransformer(EMBED_MODEL, device="cuda" if torch.cuda.is_available() else "cpu")
@@ -37,12 +43,8 @@ class LennyAgent:
         self.last_request_time = 0
 
     def retrieve_topk(self, question, k=TOP_K):
-        q_emb = embed_model.encode(question, convert_to_tensor=True)
-        q_emb = q_emb / q_emb.norm()
-        corpus_norm = corpus_embs / corpus_embs.norm(dim=1, keepdim=True)
-        sims = torch.matmul(corpus_norm, q_emb)
-        topk_idx = torch.topk(sims, k).indices.tolist()
-        return [chunks[i] for i in topk_idx]
+        q_emb = embed_model.encode(question, convert_to_numpy=True)
+        return [point.payload for point in retriever.query_points(query=q_emb, limit=k).points]
 
     def ask_lenny(self, question):
 
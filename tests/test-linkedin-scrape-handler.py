@@ -4,6 +4,8 @@ import sys
 from dotenv import load_dotenv
 PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 sys.path.insert(0, PROJECT_ROOT)
+# Shared modules ship as a Lambda layer, make them importable locally
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "lambdas", "common"))
 
 from lambdas.scrape_linkedin.handler import lambda_handler
 
@@ -0,0 +1,92 @@
+import os
+import sys
+
+import numpy as np
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "agent", "message_handler"))
+
+from cache import InMemoryAnswerStore, SemanticAnswerCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        self.now += 1
+        return self.now
+
+
+def unit(*values):
+    v = np.array(values, dtype=np.float32)
+    return v / np.linalg.norm(v)
+
+
+def test_replays_close_questions_only():
+    cache = SemanticAnswerCache(max_entries=4, max_distance=0.05)
+    cache.set_version("100")
+    cache.add("q", unit(1, 0, 0), "answer", {"overall": 80.0},
+              generation_seconds=2.5, input_tokens=1000, output_tokens=500)
+
+    hit = cache.lookup(unit(1, 0.05, 0))
+    assert hit is not None and hit["answer"] == "answer"
+    assert cache.lookup(unit(0, 1, 0)) is None
+
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1
+    assert stats["saved_bedrock_seconds"] == 2.5
+    assert stats["saved_bedrock_cost_usd"] > 0
+
+
+def test_lru_eviction():
+    cache = SemanticAnswerCache(max_entries=2, clock=FakeClock())
+    cache.add("a", unit(1, 0, 0), "A", {})
+    cache.add("b", unit(0, 1, 0), "B", {})
+    cache.lookup(unit(1, 0, 0))  # "a" is now most recently used
+    cache.add("c", unit(0, 0, 1), "C", {})  # evicts "b"
+
+    assert cache.lookup(unit(0, 1, 0)) is None
+    assert cache.lookup(unit(1, 0, 0))["answer"] == "A"
+    assert cache.lookup(unit(0, 0, 1))["answer"] == "C"
+
+
+def test_collection_version_invalidates():
+    store = InMemoryAnswerStore()
+    cache = SemanticAnswerCache(store=store)
+    cache.set_version("100")
+    cache.add("a", unit(1, 0, 0), "A", {})
+
+    # A new container sharing the store keeps answers for the same version...
+    warm = SemanticAnswerCache(store=store)
+    warm.set_version("100")
+    assert warm.lookup(unit(1, 0, 0)) is not None
+
+    # ...and drops them once the collection changes
+    warm.set_version("120")
+    assert warm.lookup(unit(1, 0, 0)) is None
+    assert store.load() == []
+
+
+def test_expired_best_match_falls_back_to_runner_up():
+    clock = FakeClock()
+    store = InMemoryAnswerStore()
+    cache = SemanticAnswerCache(max_distance=0.05, ttl_seconds=100, store=store, clock=clock)
+    cache.add("old", unit(1, 0, 0), "OLD", {})
+    clock.now += 60
+    cache.add("new", unit(1, 0.2, 0), "NEW", {})
+    clock.now += 50  # "old" has expired, "new" has not
+
+    # The query is closest to "old", "new" is also within max_distance
+    hit = cache.lookup(unit(1, 0.05, 0))
+    assert hit is not None and hit["answer"] == "NEW"
+    # The expired entry is dropped from the store on the way
+    assert [e["query"] for e in store.load()] == ["new"]
+
+
+if __name__ == "__main__":
+    test_replays_close_questions_only()
+    test_lru_eviction()
+    test_collection_version_invalidates()
+    test_expired_best_match_falls_back_to_runner_up()
+    print("SUCCESS!")
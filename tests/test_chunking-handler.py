@@ -5,6 +5,8 @@ import sys
 
 PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 sys.path.insert(0, PROJECT_ROOT)
+# Shared modules ship as a Lambda layer, make them importable locally
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "lambdas", "common"))
 
 from lambdas.chunk_data.handler import lambda_handler 
 
@@ -6,6 +6,8 @@ from dotenv import load_dotenv
 # Make sure your project root is in path
 PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 sys.path.insert(0, PROJECT_ROOT)
+# Shared modules ship as a Lambda layer, make them importable locally
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "lambdas", "common"))
 
 # Import your Lambda handler
 from lambdas.clean_data.handler import lambda_handler
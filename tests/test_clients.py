@@ -0,0 +1,58 @@
+import os
+import sys
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "agent", "message_handler"))
+
+os.environ.setdefault("AWS_REGION", "us-east-1")
+
+import clients
+
+
+def test_apigw_clients_cached_per_stage():
+    clients.timings.take()
+
+    first = clients.get_apigw("abc.execute-api.us-east-1.amazonaws.com", "prod")
+    assert first.meta.endpoint_url == "https://abc.execute-api.us-east-1.amazonaws.com/prod"
+    assert clients.timings.take()["apigatewaymanagementapi.setup"]["count"] == 1
+
+    # Warm path: same object, nothing to set up
+    assert clients.get_apigw("abc.execute-api.us-east-1.amazonaws.com", "prod") is first
+    assert clients.timings.take() == {}
+
+    other = clients.get_apigw("abc.execute-api.us-east-1.amazonaws.com", "dev")
+    assert other is not first
+
+    # Every boto3 client shares one config
+    for client in (first, other):
+        config = client.meta.config
+        assert config.max_pool_connections == 10 and config.tcp_keepalive
+        assert config.retries["mode"] == "standard"
+
+
+def test_timings_split_setup_and_use():
+    clients.timings.take()
+    clients.timings.record("qdrant.setup", 12.0)
+    for _ in range(3):
+        with clients.timings.track("qdrant.query"):
+            pass
+
+    taken = clients.timings.take()
+    assert taken["qdrant.setup"] == {"count": 1, "ms": 12.0}
+    assert taken["qdrant.query"]["count"] == 3
+    assert clients.timings.take() == {}
+
+
+def test_qdrant_client_accepts_pool_args():
+    from qdrant_client import QdrantClient
+
+    # check_compatibility is off, so nothing is sent at construction
+    client = QdrantClient(url="https://qdrant.invalid", api_key="key", port=None, **clients.qdrant_args())
+    client.close()
+
+
+if __name__ == "__main__":
+    test_apigw_clients_cached_per_stage()
+    test_timings_split_setup_and_use()
+    test_qdrant_client_accepts_pool_args()
+    print("SUCCESS!")
@@ -0,0 +1,91 @@
+import os
+import sys
+import json
+import tempfile
+
+import numpy as np
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "lambdas", "common"))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from embedding_artifact import (
+    HEADER_FILE, PAYLOAD_FILE, VECTORS_FILE, S3ArtifactReader,
+    iter_batches, load_artifact, read_header, save_artifact, write_artifact
+)
+from test_manifest import FakeS3
+
+
+def make_corpus(n, dim=16):
+    chunks = [{"chunk_id": f"c{i}", "content": f"text é {i}", "metadata": {"chunk_index": i}} for i in range(n)]
+    return chunks, np.random.rand(n, dim).astype(np.float32), [f"h{i}" for i in range(n)]
+
+
+def test_roundtrip_is_memory_mapped_and_pickle_free():
+    chunks, embeddings, hashes = make_corpus(100)
+    path = tempfile.mkdtemp()
+    header = write_artifact(path, embeddings, chunks, hashes, model="mxbai-embed-large-v1")
+
+    assert header["count"] == 100 and header["dim"] == 16 and header["dtype"] == "float32"
+    assert read_header(path) == header
+    assert sorted(os.listdir(path)) == sorted([HEADER_FILE, PAYLOAD_FILE, VECTORS_FILE])
+
+    _, vectors, loaded_chunks, loaded_hashes = load_artifact(path)
+    assert isinstance(vectors, np.memmap)
+    assert np.array_equal(vectors, embeddings)
+    assert loaded_chunks == chunks and loaded_hashes == hashes
+
+    # The .npy loads without allow_pickle, the payload is plain JSON lines
+    np.load(os.path.join(path, VECTORS_FILE), allow_pickle=False)
+    with open(os.path.join(path, PAYLOAD_FILE), encoding="utf-8") as f:
+        assert json.loads(f.readline())["content_hash"] == "h0"
+
+
+def test_float16_and_streamed_batches():
+    chunks, embeddings, hashes = make_corpus(250)
+    path = tempfile.mkdtemp()
+    write_artifact(path, embeddings, chunks, hashes, model="m", dtype="float16")
+
+    assert os.path.getsize(os.path.join(path, VECTORS_FILE)) < embeddings.nbytes * 0.6
+
+    batches = list(iter_batches(path, batch_size=100))
+    assert [len(b[0]) for b in batches] == [100, 100, 50]
+    streamed = np.concatenate([b[1] for b in batches])
+    assert streamed.dtype == np.float32
+    assert np.allclose(streamed, embeddings, atol=1e-3)
+    assert [h for b in batches for h in b[2]] == hashes
+
+
+def test_s3_reader_streams_rows_with_ranged_gets():
+    chunks, embeddings, hashes = make_corpus(1000, dim=32)
+    s3 = FakeS3()
+    save_artifact(s3, "bucket", "data/embedded/corpus/", embeddings, chunks, hashes, model="m", dtype="float16")
+
+    # 1000 rows * 32 dims * 2 bytes = 64 KB, read in 4 KB ranges of 64 rows
+    s3.calls["get_object"] = 0
+    reader = S3ArtifactReader(s3, "bucket", "data/embedded/corpus", range_bytes=4096)
+    assert reader.count == 1000 and reader.rows_per_range == 64
+    assert reader.etag == s3.objects["data/embedded/corpus/" + HEADER_FILE][1]
+
+    rows = list(reader.iter_rows())
+    assert [r[0] for r in rows] == chunks and [r[2] for r in rows] == hashes
+    streamed = np.stack([r[1] for r in rows])
+    assert streamed.dtype == np.float32
+    assert np.allclose(streamed, embeddings, atol=1e-3)
+    # header + npy header + 16 ranges + payload stream
+    assert s3.calls["get_object"] == 1 + 1 + 16 + 1
+
+    # Only ranges holding a wanted row are fetched
+    s3.calls["get_object"] = 0
+    only = {5, 700}
+    picked = list(reader.iter_rows(only=only))
+    assert [r[0]["chunk_id"] for r in picked] == ["c5", "c700"]
+    assert np.allclose(picked[1][1], embeddings[700], atol=1e-3)
+    assert s3.calls["get_object"] == 2 + 1
+
+
+if __name__ == "__main__":
+    test_roundtrip_is_memory_mapped_and_pickle_free()
+    test_float16_and_streamed_batches()
+    test_s3_reader_streams_rows_with_ranged_gets()
+    print("SUCCESS!")
@@ -0,0 +1,169 @@
+import os
+import sys
+import json
+import tempfile
+
+import numpy as np
+import pytest
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "lambdas", "common"))
+
+import embedding_backend
+from embedding_backend import OnnxEncoder, TorchEncoder, cosine_drift, encode_length_bucketed, encode_multiprocess, export_onnx
+
+# Local copy of the baked model, or the HF hub id
+MODEL_PATH = os.getenv("MXBAI_MODEL_PATH", "mixedbread-ai/mxbai-embed-large-v1")
+CHUNKS_PATH = os.path.join(PROJECT_ROOT, "data", "chunks", "final_chunks.json")
+
+SAMPLE_TEXTS = [
+    "How do you find product-market fit?",
+    "What does a great PM onboarding plan look like?",
+    "Growth loops beat funnels because each cohort of users brings in the next one.",
+    "Jen Abel attributes enterprise deal success to founder-led sales and tight ICP focus.",
+    "Pricing is the most underrated growth lever for early-stage startups.",
+]
+
+
+class FakeEncoder:
+    """
+    Offline stand-in: one token per word, the vector is (row id, word count)
+    so the output order can be checked. Records every batch it is given.
+    """
+
+    name = "fake"
+
+    def __init__(self):
+        self.batches = []
+
+    def encode(self, texts, batch_size=32, normalize=False):
+        self.batches.append(self.token_lengths(texts))
+        # The workers probe the dim with a text that has no row id
+        return np.array([[float(t.split()[0]) if t[0].isdigit() else -1, len(t.split())] for t in texts], dtype=np.float32)
+
+    def token_lengths(self, texts):
+        return [len(t.split()) for t in texts]
+
+
+def fake_texts(n=50):
+    """Row id first, lengths mixed like posts and transcript chunks"""
+    return [f"{i} " + "word " * ((i * 7) % 40) for i in range(n)]
+
+
+_reference = None
+
+
+def reference_encoder():
+    """
+    TorchEncoder for MODEL_PATH, loaded once. Skips the test when the model is
+    neither at MXBAI_MODEL_PATH nor downloadable (offline runs).
+    """
+    global _reference
+    if _reference is None:
+        try:
+            _reference = TorchEncoder(MODEL_PATH)
+        except OSError as e:
+            pytest.skip(f"{MODEL_PATH} could not be loaded, set MXBAI_MODEL_PATH to a local copy ({str(e).splitlines()[0]})")
+    return _reference
+
+
+def load_texts(limit=64):
+    if os.path.exists(CHUNKS_PATH):
+        with open(CHUNKS_PATH) as f:
+            return [c["content"] for c in json.load(f)[:limit]]
+    return SAMPLE_TEXTS
+
+
+def test_onnx_parity():
+    texts = load_texts()
+
+    reference = reference_encoder()
+    ref_embs = reference.encode(texts)
+
+    with tempfile.TemporaryDirectory() as onnx_path:
+        export_onnx(MODEL_PATH, onnx_path)
+
+        fp32 = cosine_drift(ref_embs, OnnxEncoder(onnx_path).encode(texts))
+        int8 = cosine_drift(ref_embs, OnnxEncoder(onnx_path, quantized=True).encode(texts))
+
+    print(f"Parity on {len(texts)} texts vs fp32 PyTorch:")
+    print(f"  onnx      : {fp32}")
+    print(f"  onnx-int8 : {int8}")
+
+    assert fp32["min_cosine"] > 0.9999
+    assert int8["min_cosine"] > 0.98
+
+
+def test_length_bucketed_matches_corpus_order():
+    # Mixed lengths, interleaved like LinkedIn posts and transcript chunks
+    texts = [t if i % 2 else " ".join([t] * 12) for i, t in enumerate(load_texts() * 4)]
+    # The export below loads the same weights
+    reference_encoder()
+    with tempfile.TemporaryDirectory() as onnx_path:
+        export_onnx(MODEL_PATH, onnx_path, quantize=False)
+        encoder = OnnxEncoder(onnx_path)
+
+        reference = encoder.encode(texts)
+        embeddings, stats = encode_length_bucketed(encoder, texts, token_budget=1024)
+
+    print(f"Length-bucketed: {stats}")
+    assert cosine_drift(reference, embeddings)["min_cosine"] > 0.9999
+    assert stats["texts"] == len(texts) and stats["batches"] > 1
+    assert stats["tokens"] <= stats["padded_tokens"] <= 1024 * stats["batches"]
+
+
+def test_multiprocess_pool_matches_single_process():
+    texts = [t if i % 3 else " ".join([t] * 8) for i, t in enumerate(load_texts() * 3)]
+    reference = reference_encoder().encode(texts)
+
+    embeddings, stats = encode_multiprocess(texts, workers=2, threads_per_worker=1, backend="torch", model_path=MODEL_PATH)
+
+    print(f"Process pool: {stats}")
+    assert embeddings.shape == reference.shape
+    assert cosine_drift(reference, embeddings)["min_cosine"] > 0.9999
+    assert stats["workers"] == 2 and stats["texts"] == len(texts)
+
+
+def test_length_bucketed_order_and_budget_offline():
+    texts = fake_texts()
+    encoder = FakeEncoder()
+    embeddings, stats = encode_length_bucketed(encoder, texts, token_budget=64)
+
+    # Rows back in corpus order
+    assert embeddings[:, 0].tolist() == list(range(len(texts)))
+    assert embeddings[:, 1].tolist() == encoder.token_lengths(texts)
+
+    # Longest first, every batch (size x its longest text) within the budget
+    assert encoder.batches[0][0] == max(encoder.token_lengths(texts))
+    assert all(len(b) * max(b) <= 64 for b in encoder.batches)
+    assert stats["batches"] == len(encoder.batches) and stats["texts"] == len(texts)
+    assert sum(len(b) for b in encoder.batches) == len(texts)
+    assert stats["tokens"] <= stats["padded_tokens"] <= 64 * stats["batches"]
+
+
+def test_multiprocess_reassembles_shards_offline():
+    texts = fake_texts(31)
+    # Workers are subprocesses: this file started as `fake-worker` runs them with FakeEncoder
+    embeddings, stats = encode_multiprocess(
+        texts, workers=3, threads_per_worker=1,
+        worker_command=[sys.executable, os.path.abspath(__file__), "fake-worker"]
+    )
+
+    # Round-robin shares of uneven size land back on their original rows
+    assert embeddings[:, 0].tolist() == list(range(len(texts)))
+    assert np.array_equal(embeddings, FakeEncoder().encode(texts))
+    assert stats["workers"] == 3 and stats["texts"] == len(texts)
+    assert stats["tokens"] == sum(FakeEncoder().token_lengths(texts))
+
+
+def run_fake_worker():
+    """An encode_multiprocess() worker with FakeEncoder in place of load_encoder()"""
+    embedding_backend.load_encoder = lambda *args, **kwargs: FakeEncoder()
+    embedding_backend.run_worker()
+
+
+if __name__ == "__main__" and sys.argv[1:] == ["fake-worker"]:
+    run_fake_worker()
+elif __name__ == "__main__":
+    # pytest reports the model tests as skipped when the model can't be loaded
+    sys.exit(pytest.main([__file__, "-q", "-s"]))
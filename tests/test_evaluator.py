@@ -0,0 +1,150 @@
+import os
+import random
+import re
+import sys
+from types import SimpleNamespace
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "agent", "message_handler"))
+
+from evaluator import RAGEvaluator, TokenIndex
+
+WORDS = (
+    "product market fit growth retention onboarding pricing founders hire the a of "
+    "to and in is it we you team users feedback roadmap metrics churn 2024 plg b2b"
+).split()
+
+
+def string_ngrams(text, n):
+    """The string n-grams the evaluator used before the token index"""
+    words = re.findall(r'\b\w+\b', text)
+    return {
+        " ".join(words[i:i + n]) for i in range(len(words) - n + 1)
+        if len(" ".join(words[i:i + n]).replace(" ", "")) >= n * 3
+    }
+
+
+def string_groundedness(response, context_chunks):
+    response_lower, context_lower = response.lower(), " ".join(context_chunks).lower()
+    response_words = {w for w in re.findall(r'\b\w+\b', response_lower) if len(w) >= 4}
+    context_words = {w for w in re.findall(r'\b\w+\b', context_lower) if len(w) >= 4}
+    if not response_words:
+        return 0.0
+    unigram = len(response_words & context_words) / len(response_words)
+    response_bigrams = string_ngrams(response_lower, 2)
+    bigram = len(response_bigrams & string_ngrams(context_lower, 2)) / len(response_bigrams) if response_bigrams else 0.0
+    return round(0.6 * unigram + 0.4 * bigram, 3)
+
+
+def sentence(rng, n):
+    return " ".join(rng.choice(WORDS) for _ in range(n)).capitalize() + rng.choice([".", "!", "?", ","])
+
+
+def make_case(rng):
+    chunks = [" ".join(sentence(rng, rng.randint(4, 15)) for _ in range(rng.randint(1, 8))) for _ in range(3)]
+    # Answers reuse spans of the chunks plus new text, like a grounded model would
+    parts = []
+    for _ in range(rng.randint(1, 6)):
+        words = rng.choice(chunks).split()
+        start = rng.randrange(len(words))
+        parts.append(" ".join(words[start:start + rng.randint(1, 6)]))
+        parts.append(sentence(rng, rng.randint(2, 10)))
+    return " ".join(parts).upper() if rng.random() < 0.1 else " ".join(parts), chunks
+
+
+def test_groundedness_matches_string_ngrams():
+    rng = random.Random(0)
+    evaluator = RAGEvaluator()
+    for _ in range(300):
+        response, chunks = make_case(rng)
+        assert evaluator.calculate_groundedness_score(response, chunks) == string_groundedness(response, chunks)
+
+    assert evaluator.calculate_groundedness_score("", ["context"]) == 0.0
+    assert evaluator.calculate_groundedness_score("a an", ["a an"]) == 0.0
+
+
+def test_attribution_by_trigram_intersection():
+    rng = random.Random(1)
+    evaluator = RAGEvaluator()
+    for _ in range(300):
+        response, chunks = make_case(rng)
+        results = [SimpleNamespace(payload={"content": c}) for c in chunks]
+        # Word-level phrase containment, what the substring scan was checking for
+        padded = " " + " ".join(re.findall(r'\b\w+\b', response.lower())) + " "
+        expected = sum(
+            any(f" {phrase} " in padded for phrase in string_ngrams(c.lower(), 3)) for c in chunks
+        ) / 3
+        assert evaluator.calculate_source_attribution_score(response, results) == round(expected, 3)
+
+    results = [SimpleNamespace(payload={"content": "Retention is the best growth lever"})]
+    assert evaluator.calculate_source_attribution_score("Honestly, retention is the best way.", results) == 1.0
+    assert evaluator.calculate_source_attribution_score("Retention matters.", results) == 0.0
+
+
+def test_texts_are_tokenized_once():
+    tokens = TokenIndex(max_cached_texts=2)
+    evaluator = RAGEvaluator(tokens)
+    response = "Growth comes after product market fit"
+    chunk = "Product market fit comes before growth"
+    evaluator.calculate_groundedness_score(response, [chunk])
+    evaluator.calculate_source_attribution_score(response, [SimpleNamespace(payload={"content": chunk})])
+    assert tokens.tokenize(chunk) is tokens.tokenize(chunk)
+    assert len(tokens.vocab) == 7
+
+    # Least recently used text is evicted past max_cached_texts
+    tokens.tokenize("another text")
+    assert response not in tokens._texts and chunk in tokens._texts
+
+
+def split_into_tokens(rng, text):
+    """Bedrock-like deltas: word pieces, punctuation and whitespace cut anywhere"""
+    tokens, start = [], 0
+    while start < len(text):
+        end = start + rng.randint(1, 6)
+        tokens.append(text[start:end])
+        start = end
+    return tokens
+
+
+def test_incremental_matches_full_text_scoring():
+    rng = random.Random(2)
+    evaluator = RAGEvaluator()
+    for case in range(300):
+        response, chunks = make_case(rng)
+        if case % 7 == 0:
+            response += "   Another line without an end"
+        results = [SimpleNamespace(score=rng.random(), payload={"content": c, "source": "linkedin"}) for c in chunks]
+        retrieval_metrics = evaluator.calculate_retrieval_score(results)
+
+        stream = evaluator.stream(chunks, results, retrieval_metrics)
+        for token in split_into_tokens(rng, response):
+            stream.feed(token)
+        assert stream.finalize() == evaluator.score_answer(response, chunks, results, retrieval_metrics)
+
+    # Nothing streamed scores like an empty answer
+    stream = evaluator.stream(chunks, results, retrieval_metrics)
+    assert stream.finalize() == evaluator.score_answer("", chunks, results, retrieval_metrics)
+
+
+def test_incremental_score_is_live():
+    evaluator = RAGEvaluator()
+    chunk = "Retention is the best growth lever for early startups."
+    results = [SimpleNamespace(score=0.8, payload={"content": chunk, "source": "linkedin"})]
+    stream = evaluator.stream([chunk], results, evaluator.calculate_retrieval_score(results))
+
+    stream.feed("Retention is the best gro")
+    # "gro" is still open, not counted until the word ends
+    assert stream.score()["breakdown"]["attribution"] == 100.0
+    assert len(stream.words) == 2
+    stream.feed("wth lever.")
+    assert stream.sentences == 1 and "growth" in stream.tokens.vocab
+    assert stream.finalize()["breakdown"]["groundedness"] == 100.0
+
+
+if __name__ == "__main__":
+    test_groundedness_matches_string_ngrams()
+    test_attribution_by_trigram_intersection()
+    test_texts_are_tokenized_once()
+    test_incremental_matches_full_text_scoring()
+    test_incremental_score_is_live()
+    print("SUCCESS!")
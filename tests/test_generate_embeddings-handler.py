@@ -5,6 +5,8 @@ from dotenv import load_dotenv
 import sys
 PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 sys.path.insert(0, PROJECT_ROOT)
+# Shared modules ship as a Lambda layer, make them importable locally
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "lambdas", "common"))
 
 from lambdas.generate_embeddings.handler import lambda_handler
 
@@ -18,7 +20,7 @@ def test_embedding_lambda():
     test_event = {
         "bucket": os.getenv("DATA_BUCKET_NAME"),
         "input_key": "data/chunks/final_chunks.json",
-        "output_key": "data/embedded/mxbai_corpus.npz"
+        "output_key": "data/embedded/mxbai_corpus/"
     }
 
     print("Starting Embedding Test (this may take a minute)...")
@@ -0,0 +1,208 @@
+import os
+import sys
+import json
+import types
+
+import numpy as np
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, PROJECT_ROOT)
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "lambdas", "common"))
+# store_qdrant/handler.py imports its sibling uploader.py as a top-level module (Lambda layout)
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "lambdas", "store_qdrant"))
+sys.path.insert(0, os.path.dirname(__file__))
+
+import embedding_backend
+from embedding_artifact import download_artifact, header_key, load_artifact
+from test_manifest import FakeS3
+
+
+class CountingEncoder:
+    """Deterministic stand-in for the mxbai encoder that counts encoded texts"""
+
+    name = "counting"
+
+    def __init__(self):
+        self.encoded = 0
+
+    def encode(self, texts, batch_size=32, normalize=False):
+        self.encoded += len(texts)
+        return np.array([[len(t), t.count("a"), 1.0] for t in texts], dtype=np.float32)
+
+    def token_lengths(self, texts):
+        return [len(t.split()) for t in texts]
+
+
+# The handler loads the model at import time, swap in the counting encoder for the import
+sys.modules["embedding_backend"] = types.SimpleNamespace(
+    load_encoder=lambda **kwargs: CountingEncoder(),
+    encode_length_bucketed=embedding_backend.encode_length_bucketed,
+    encode_multiprocess=embedding_backend.encode_multiprocess
+)
+import lambdas.generate_embeddings.handler as generate_embeddings
+sys.modules["embedding_backend"] = embedding_backend
+import lambdas.store_qdrant.handler as store_qdrant
+
+EVENT = {
+    "bucket": "bucket",
+    "input_key": "data/chunks/final_chunks.json",
+    "output_key": "data/embedded/mxbai_corpus/"
+}
+
+
+def chunk(chunk_id, content):
+    return {"chunk_id": chunk_id, "source": "linkedin", "content": content, "metadata": {}}
+
+
+def load(s3, prefix):
+    return load_artifact(download_artifact(s3, "bucket", prefix))
+
+
+def test_only_delta_is_encoded():
+    s3 = FakeS3()
+    generate_embeddings.s3 = s3
+    model = generate_embeddings.model = CountingEncoder()
+
+    chunks = [chunk(f"li_{i}", f"post {i} " + "a" * i) for i in range(50)]
+    s3.put_object(Bucket="bucket", Key=EVENT["input_key"], Body=json.dumps(chunks))
+    body = json.loads(generate_embeddings.lambda_handler(EVENT, None)["body"])
+    assert body["encoded"] == 50 and model.encoded == 50
+
+    # A week later: 2 new posts, 1 edited, 1 removed
+    chunks[10] = chunk("li_10", "edited")
+    del chunks[20]
+    chunks += [chunk("li_new_1", "new one"), chunk("li_new_2", "new two")]
+    s3.put_object(Bucket="bucket", Key=EVENT["input_key"], Body=json.dumps(chunks))
+
+    body = json.loads(generate_embeddings.lambda_handler(EVENT, None)["body"])
+    assert (body["encoded"], body["reused"], body["deleted"]) == (3, 48, 1)
+    assert model.encoded == 53
+
+    # Full artifact matches a from-scratch encode, in chunk order
+    header, embeddings, stored_chunks, _ = load(s3, EVENT["output_key"])
+    expected = CountingEncoder().encode([c["content"] for c in chunks])
+    assert np.array_equal(embeddings, expected)
+    assert stored_chunks == chunks
+    assert header["count"] == 51 and header["dim"] == 3
+
+    header, _, delta_chunks, _ = load(s3, body["delta_key"])
+    assert sorted(c["chunk_id"] for c in delta_chunks) == ["li_10", "li_new_1", "li_new_2"]
+    assert header["deleted_ids"] == ["li_20"]
+
+    # Unchanged input -> skipped without encoding
+    body = json.loads(generate_embeddings.lambda_handler(EVENT, None)["body"])
+    assert body["status"] == "skipped" and model.encoded == 53
+
+
+def test_sharded_run_matches_single_run():
+    s3 = FakeS3()
+    generate_embeddings.s3 = s3
+    model = generate_embeddings.model = CountingEncoder()
+
+    chunks = [chunk(f"li_{i}", f"post {i} " + "a" * i) for i in range(25)]
+    s3.put_object(Bucket="bucket", Key=EVENT["input_key"], Body=json.dumps(chunks))
+    generate_embeddings.lambda_handler(EVENT, None)
+
+    chunks[3] = chunk("li_3", "edited")
+    del chunks[7]
+    chunks += [chunk(f"li_new_{i}", f"new {i}") for i in range(9)]
+    s3.put_object(Bucket="bucket", Key=EVENT["input_key"], Body=json.dumps(chunks))
+
+    # What the Step Function does: plan -> Map(encode_shard) -> merge
+    plan = generate_embeddings.lambda_handler(dict(EVENT, action="plan", shard_size=4), None)
+    assert (plan["encode"], plan["reuse"], plan["delete"]) == (10, 23, 1)
+    assert len(plan["shards"]) == 3
+
+    for shard in plan["shards"]:
+        assert generate_embeddings.lambda_handler(shard, None)["status"] == "success"
+    # A retried iteration does not encode again
+    assert generate_embeddings.lambda_handler(plan["shards"][0], None)["status"] == "skipped"
+    assert model.encoded == 25 + 10
+
+    merge = dict(EVENT, action="merge", shards=plan["shards"], input_etag=plan["input_etag"])
+    body = json.loads(generate_embeddings.lambda_handler(merge, None)["body"])
+    assert (body["shards"], body["encoded"], body["reused"], body["deleted"]) == (3, 10, 23, 1)
+
+    _, embeddings, stored_chunks, _ = load(s3, EVENT["output_key"])
+    assert np.array_equal(embeddings, CountingEncoder().encode([c["content"] for c in chunks]))
+    assert stored_chunks == chunks
+    header, _, delta_chunks, _ = load(s3, body["delta_key"])
+    assert len(delta_chunks) == 10 and header["deleted_ids"] == ["li_7"]
+
+    # Shards are cleaned up, the next plan is a no-op
+    assert not [key for key in s3.objects if "_shards/" in key]
+    plan = generate_embeddings.lambda_handler(dict(EVENT, action="plan"), None)
+    assert plan["status"] == "skipped" and plan["shards"] == []
+
+
+def test_missed_delta_converges():
+    from qdrant_client import QdrantClient
+
+    s3 = FakeS3()
+    generate_embeddings.s3 = store_qdrant.s3 = s3
+    generate_embeddings.model = CountingEncoder()
+    client = QdrantClient(":memory:")
+    store_qdrant.QdrantClient = lambda **kwargs: client
+    store_event = {
+        "input_bucket": "bucket",
+        "embeddings_key": EVENT["output_key"],
+        "delta_key": EVENT["output_key"].rstrip("/") + "_delta/",
+        "collection_name": "virtual-lenny",
+        "qdrant_url": "memory",
+        "qdrant_api_key": "test",
+        "mode": "delta"
+    }
+
+    def run(chunks):
+        s3.put_object(Bucket="bucket", Key=EVENT["input_key"], Body=json.dumps(chunks))
+        return json.loads(generate_embeddings.lambda_handler(EVENT, None)["body"])
+
+    def store():
+        return json.loads(store_qdrant.lambda_handler(store_event, None)["body"])
+
+    def stored():
+        records, _ = client.scroll("virtual-lenny", limit=100, with_payload=True)
+        return {r.payload["chunk_id"]: r.payload["content"] for r in records}
+
+    def corpus_version():
+        collection = store_qdrant.resolve_collection(client, "virtual-lenny")
+        return store_qdrant.get_corpus_version(client, collection)
+
+    chunks = [chunk(f"li_{i}", f"post {i}") for i in range(10)]
+    run(chunks)
+    store()
+    assert corpus_version() == s3.head_object(Bucket="bucket", Key=header_key(EVENT["output_key"]))["ETag"]
+
+    # Week 1: the delta is written but the store step never runs...
+    chunks[1] = chunk("li_1", "edited in week 1")
+    del chunks[5]
+    run(chunks)
+    # ...week 2 overwrites it with a delta against week 1's corpus
+    chunks.append(chunk("li_new", "added in week 2"))
+    body = run(chunks)
+    header, _, delta_chunks, _ = load(s3, body["delta_key"])
+    assert [c["chunk_id"] for c in delta_chunks] == ["li_new"] and header["deleted_ids"] == []
+    assert header["base_version"] != corpus_version()
+
+    # Applying only week 2 would leave li_1 stale and li_5 behind: falls back to sync
+    result = store()
+    assert (result["vectors_uploaded"], result["vectors_deleted"]) == (2, 1)
+    assert stored() == {c["chunk_id"]: c["content"] for c in chunks}
+    assert corpus_version() == header["target_version"]
+    assert corpus_version() == s3.head_object(Bucket="bucket", Key=header_key(EVENT["output_key"]))["ETag"]
+
+    # In-order deltas apply directly, a repeated invocation is a no-op
+    chunks[0] = chunk("li_0", "edited in week 3")
+    body = run(chunks)
+    result = store()
+    assert (result["vectors_uploaded"], result["vectors_deleted"]) == (1, 0)
+    assert stored()["li_0"] == "edited in week 3"
+    assert store()["skipped"] is True
+    assert corpus_version() == load(s3, body["delta_key"])[0]["target_version"]
+
+
+if __name__ == "__main__":
+    test_only_delta_is_encoded()
+    test_sharded_run_matches_single_run()
+    test_missed_delta_converges()
+    print("SUCCESS!")
@@ -0,0 +1,161 @@
+import io
+import os
+import sys
+import json
+import hashlib
+
+from botocore.exceptions import ClientError
+from botocore.response import StreamingBody
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, PROJECT_ROOT)
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "lambdas", "common"))
+
+from manifest import StageManifest, content_hash
+from s3_io import iter_json_objects, list_objects
+import lambdas.clean_data.handler as clean_data
+
+
+class FakeS3:
+    """In-memory bucket: listing with ETags, get/put, counts every call"""
+
+    class exceptions:
+        ClientError = ClientError
+
+    def __init__(self, objects=None):
+        self.objects = {}
+        self.calls = {"get_object": 0, "put_object": 0, "head_object": 0}
+        for key, data in (objects or {}).items():
+            self.put_object(Bucket="bucket", Key=key, Body=json.dumps(data))
+        self.calls["put_object"] = 0
+
+    def get_paginator(self, name):
+        s3 = self
+
+        class Paginator:
+            def paginate(self, Bucket, Prefix):
+                yield {"Contents": [
+                    {"Key": key, "ETag": etag}
+                    for key, (_, etag) in sorted(s3.objects.items()) if key.startswith(Prefix)
+                ]}
+
+        return Paginator()
+
+    def get_object(self, Bucket, Key, Range=None):
+        self.calls["get_object"] += 1
+        if Key not in self.objects:
+            raise ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+        body, etag = self.objects[Key]
+        if Range:
+            start, end = Range[len("bytes="):].split("-")
+            body = body[int(start):int(end) + 1]
+        return {"Body": StreamingBody(io.BytesIO(body), len(body)), "ETag": etag}
+
+    def put_object(self, Bucket, Key, Body, ContentType=None):
+        self.calls["put_object"] += 1
+        body = Body.encode() if isinstance(Body, str) else Body
+        self.objects[Key] = (body, f'"{hashlib.md5(body).hexdigest()}"')
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop(Key, None)
+
+    def upload_file(self, Filename, Bucket, Key):
+        with open(Filename, "rb") as f:
+            self.put_object(Bucket=Bucket, Key=Key, Body=f.read())
+
+    def download_file(self, Bucket, Key, Filename):
+        if Key not in self.objects:
+            raise ClientError({"Error": {"Code": "404"}}, "HeadObject")
+        with open(Filename, "wb") as f:
+            f.write(self.objects[Key][0])
+
+    def head_object(self, Bucket, Key):
+        self.calls["head_object"] += 1
+        if Key not in self.objects:
+            raise ClientError({"Error": {"Code": "404"}}, "HeadObject")
+        return {"ETag": self.objects[Key][1]}
+
+
+EVENT = {
+    "input_bucket": "bucket",
+    "input_prefixes": ["data/raw/linkedin/"],
+    "output_bucket": "bucket",
+    "output_prefixes": ["data/processed/linkedin/"]
+}
+
+
+def raw_post(post_id, text):
+    return {"post_id": post_id, "url": "https://linkedin.com/x", "text": text}
+
+
+def test_manifest_roundtrip():
+    s3 = FakeS3()
+    manifest = StageManifest.load(s3, "bucket", "clean_data")
+    assert not manifest.exists and not manifest.is_current("a.json", '"1"')
+
+    manifest.record("a.json", '"1"', ["out/a.json"])
+    manifest.save()
+
+    reloaded = StageManifest.load(s3, "bucket", "clean_data")
+    assert reloaded.exists
+    assert reloaded.is_current("a.json", '"1"')
+    assert not reloaded.is_current("a.json", '"2"')
+
+    # Nothing changed -> no write
+    puts = s3.calls["put_object"]
+    reloaded.save()
+    assert s3.calls["put_object"] == puts
+
+
+def test_clean_data_only_processes_new_or_changed():
+    s3 = FakeS3({
+        f"data/raw/linkedin/{i}.json": raw_post(i, f"post number {i}") for i in range(20)
+    })
+    clean_data.s3 = s3
+
+    body = json.loads(clean_data.lambda_handler(EVENT, None)["body"])
+    assert body["files_cleaned"] == 20
+
+    # Re-run: one manifest GET, no object GETs, no HEADs
+    s3.calls = {k: 0 for k in s3.calls}
+    body = json.loads(clean_data.lambda_handler(EVENT, None)["body"])
+    assert body["files_cleaned"] == 0
+    assert s3.calls == {"get_object": 1, "put_object": 0, "head_object": 0}
+
+    # One edited + one new post -> exactly those two are cleaned
+    s3.put_object(Bucket="bucket", Key="data/raw/linkedin/3.json", Body=json.dumps(raw_post(3, "edited")))
+    s3.put_object(Bucket="bucket", Key="data/raw/linkedin/new.json", Body=json.dumps(raw_post("new", "hello")))
+    body = json.loads(clean_data.lambda_handler(EVENT, None)["body"])
+    assert body["files_cleaned"] == 2
+
+    cleaned = json.loads(s3.objects["data/processed/linkedin/3.json"][0])
+    assert cleaned["text"] == "edited"
+
+
+def test_seed_with_content_hashes():
+    # Posts saved by scrape_linkedin before it kept a manifest
+    prefix = "data/raw/linkedin/"
+    s3 = FakeS3({f"{prefix}{i}.json": raw_post(i, f"post number {i}") for i in range(5)})
+
+    def post_hash(post):
+        return content_hash(post["text"], post["url"])
+
+    manifest = StageManifest.load(s3, "bucket", "scrape_linkedin")
+    assert not manifest.exists
+    existing = {
+        obj["Key"][len(prefix):-len(".json")]: post_hash(post)
+        for obj, post in iter_json_objects(s3, "bucket", list_objects(s3, "bucket", prefix, suffix=".json"))
+    }
+    assert manifest.seed(existing, outputs_for=lambda i: [f"{prefix}{i}.json"], etag_for=existing.get) == 5
+
+    # Unchanged posts are current on the first run, an edited one is not
+    assert manifest.is_current("3", post_hash(raw_post(3, "post number 3")))
+    assert not manifest.is_current("3", post_hash(raw_post(3, "edited")))
+    assert manifest.get("3")["outputs"] == [f"{prefix}3.json"]
+
+
+if __name__ == "__main__":
+    test_manifest_roundtrip()
+    test_clean_data_only_processes_new_or_changed()
+    test_seed_with_content_hashes()
+    print("SUCCESS!")
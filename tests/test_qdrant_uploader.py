@@ -0,0 +1,142 @@
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.models import Distance, VectorParams
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "lambdas", "store_qdrant"))
+
+from uploader import PipelinedUploader, build_grpc_points, build_points, grpc_vectors
+
+
+class SlowFlakyClient:
+    """Wraps the in-memory Qdrant: adds latency per upsert and fails every Nth call"""
+
+    def __init__(self, client, latency=0.0, fail_every=0):
+        self.client = client
+        self.latency = latency
+        self.fail_every = fail_every
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def upsert(self, collection_name, points, wait=True):
+        with self._lock:
+            self.calls += 1
+            call = self.calls
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.latency)
+            if self.fail_every and call % self.fail_every == 0:
+                raise ConnectionError("simulated timeout")
+            with self._lock:
+                self.client.upsert(collection_name=collection_name, points=points, wait=wait)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+
+def make_corpus(n, dim=8):
+    chunks = [{"chunk_id": f"c{i}", "content": f"text {i}"} for i in range(n)]
+    return chunks, np.random.rand(n, dim).astype(np.float32), [f"h{i}" for i in range(n)]
+
+
+def memory_collection(dim=8):
+    client = QdrantClient(":memory:")
+    client.create_collection("test", vectors_config=VectorParams(size=dim, distance=Distance.COSINE))
+    return client
+
+
+def test_uploads_everything_with_retries():
+    qdrant = memory_collection()
+    client = SlowFlakyClient(qdrant, latency=0.005, fail_every=4)
+    chunks, embeddings, hashes = make_corpus(1000)
+
+    uploader = PipelinedUploader(client, "test", max_in_flight=4, batch_size=50, backoff_base=0.0)
+    stats = uploader.upload(chunks, embeddings, hashes)
+
+    assert stats["vectors"] == 1000
+    assert stats["retries"] > 0
+    assert qdrant.count("test").count == 1000
+    assert 1 < client.max_in_flight <= 4
+    print(f"Uploaded 1000 vectors at {stats['vectors_per_second']} vectors/s")
+
+
+def test_batch_size_adapts_to_latency():
+    chunks, embeddings, hashes = make_corpus(2000)
+
+    fast = PipelinedUploader(SlowFlakyClient(memory_collection()), "test", batch_size=32, target_latency=1.0)
+    assert fast.upload(chunks, embeddings, hashes)["final_batch_size"] > 32
+
+    slow = PipelinedUploader(
+        SlowFlakyClient(memory_collection(), latency=0.05), "test",
+        batch_size=256, target_latency=0.01, max_in_flight=2
+    )
+    assert slow.upload(chunks[:600], embeddings[:600], hashes[:600])["final_batch_size"] < 256
+
+
+def test_batch_size_capped_by_payload_bytes():
+    chunks, embeddings, hashes = make_corpus(500, dim=1024)
+    uploader = PipelinedUploader(
+        SlowFlakyClient(memory_collection(dim=1024)), "test",
+        batch_size=256, max_batch_bytes=200_000
+    )
+    # ~12KB per 1024-d point -> at most ~16 points per request
+    assert uploader.upload(chunks, embeddings, hashes)["final_batch_size"] <= 16
+
+
+def test_gives_up_after_max_retries():
+    client = SlowFlakyClient(memory_collection(), fail_every=1)
+    chunks, embeddings, hashes = make_corpus(10)
+    uploader = PipelinedUploader(client, "test", max_retries=2, backoff_base=0.0)
+    try:
+        uploader.upload(chunks, embeddings, hashes)
+    except ConnectionError:
+        assert client.calls == 3
+    else:
+        raise AssertionError("expected the upload to fail")
+
+
+def test_grpc_points_match_rest_points():
+    from qdrant_client.conversions.conversion import GrpcToRest
+
+    chunks, embeddings, hashes = make_corpus(5)
+    rest = build_points(chunks, embeddings, hashes)
+    grpc_points = build_grpc_points(chunks, embeddings, hashes)
+
+    for rest_point, grpc_point in zip(rest, grpc_points):
+        converted = GrpcToRest.convert_point_struct(grpc_point)
+        assert str(converted.id) == rest_point.id
+        assert converted.payload == rest_point.payload
+        assert np.allclose(converted.vector, rest_point.vector)
+
+
+def test_grpc_vectors_from_raw_bytes_match_float_lists():
+    from qdrant_client import grpc
+
+    rng = np.random.default_rng(0)
+    # 1024 dims -> 4096 bytes, a two-byte length varint
+    for block in (
+        rng.standard_normal((4, 3), dtype=np.float32),
+        rng.standard_normal((4, 1024), dtype=np.float32),
+        rng.standard_normal((8, 16)).astype(np.float16)[::2],  # float16, not contiguous
+        np.zeros((0, 8), dtype=np.float32)
+    ):
+        expected = [grpc.Vector(data=row) for row in np.asarray(block, dtype=np.float32).tolist()]
+        assert grpc_vectors(block) == expected
+
+
+if __name__ == "__main__":
+    test_uploads_everything_with_retries()
+    test_batch_size_adapts_to_latency()
+    test_batch_size_capped_by_payload_bytes()
+    test_gives_up_after_max_retries()
+    test_grpc_points_match_rest_points()
+    test_grpc_vectors_from_raw_bytes_match_float_lists()
+    print("SUCCESS!")
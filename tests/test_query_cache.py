@@ -0,0 +1,76 @@
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "agent", "message_handler"))
+
+from cache import QueryEmbeddingCache, SQLiteEmbeddingStore, normalize_query
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class CountingEncoder:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, query):
+        self.calls += 1
+        return np.full(4, len(query), dtype=np.float32)
+
+
+def test_normalize_query():
+    assert normalize_query("  What is  PMF? ") == "what is pmf"
+    assert normalize_query("what is pmf") == "what is pmf"
+
+
+def test_lru_and_ttl():
+    clock = FakeClock()
+    encode = CountingEncoder()
+    cache = QueryEmbeddingCache(max_entries=2, ttl_seconds=60, clock=clock)
+
+    cache.get_or_compute("How to hire a PM?", encode)
+    cache.get_or_compute("how to hire a pm", encode)
+    assert encode.calls == 1
+    assert cache.hits == 1 and cache.misses == 1
+
+    cache.get_or_compute("b", encode)
+    cache.get_or_compute("c", encode)  # evicts "how to hire a pm"
+    cache.get_or_compute("how to hire a pm", encode)
+    assert encode.calls == 4
+
+    clock.now += 61
+    cache.get_or_compute("c", encode)  # expired
+    assert encode.calls == 5
+
+
+def test_sqlite_tier_survives_restart():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "cache.db")
+        encode = CountingEncoder()
+
+        first = QueryEmbeddingCache(store=SQLiteEmbeddingStore(path), namespace="m")
+        vector = first.get_or_compute("growth loops", encode)
+
+        # New container: empty LRU, same persistent store
+        second = QueryEmbeddingCache(store=SQLiteEmbeddingStore(path), namespace="m")
+        cached = second.get_or_compute("Growth loops?", encode)
+
+        assert encode.calls == 1
+        assert second.store_hits == 1
+        assert np.array_equal(vector, cached)
+
+
+if __name__ == "__main__":
+    test_normalize_query()
+    test_lru_and_ttl()
+    test_sqlite_tier_survives_restart()
+    print("SUCCESS!")
@@ -0,0 +1,153 @@
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pytest
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "lambdas", "common"))
+
+from embedding_artifact import write_artifact
+from retriever import ANN_INDEX_FILE, Retriever, rank_metrics, top_k
+
+
+def make_corpus(n=500, dim=32, seed=0):
+    rng = np.random.default_rng(seed)
+    embeddings = rng.standard_normal((n, dim)).astype(np.float32) * rng.uniform(0.5, 3, (n, 1)).astype(np.float32)
+    chunks = [{"chunk_id": f"c{i}", "content": f"text {i}", "source": "linkedin"} for i in range(n)]
+    return embeddings, chunks
+
+
+def brute_force(embeddings, query, k):
+    corpus = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    sims = corpus @ (query / np.linalg.norm(query))
+    return np.argsort(-sims)[:k], np.sort(sims)[::-1][:k]
+
+
+def test_matches_brute_force_and_batches():
+    embeddings, chunks = make_corpus()
+    retriever = Retriever(embeddings, chunks)
+    assert retriever.vectors.flags["C_CONTIGUOUS"]
+    assert np.allclose(np.linalg.norm(retriever.vectors, axis=1), 1.0, atol=1e-5)
+
+    queries = np.random.default_rng(1).standard_normal((8, 32)).astype(np.float32)
+    scores, indices = retriever.search(queries, k=5)
+    assert scores.shape == indices.shape == (8, 5)
+
+    for q, query in enumerate(queries):
+        expected_idx, expected_scores = brute_force(embeddings, query, 5)
+        assert list(indices[q]) == list(expected_idx)
+        assert np.allclose(scores[q], expected_scores, atol=1e-5)
+
+    # k larger than the corpus returns everything, sorted
+    scores, indices = top_k(np.array([[0.1, 0.9, 0.5]]), 10)
+    assert list(indices[0]) == [1, 2, 0]
+
+
+def test_float16_storage_keeps_ranking():
+    embeddings, chunks = make_corpus(n=2000)
+    exact = Retriever(embeddings, chunks)
+    half = Retriever(embeddings, chunks, dtype="float16")
+    assert half.vectors.dtype == np.float16 and half.vectors.nbytes * 2 == exact.vectors.nbytes
+
+    queries = embeddings[:20] + 0.01
+    _, exact_idx = exact.search(queries, k=1)
+    _, half_idx = half.search(queries, k=1)
+    assert np.array_equal(exact_idx, half_idx)
+
+
+def test_query_points_mirrors_qdrant():
+    from qdrant_client import QdrantClient
+    from qdrant_client.models import Distance, PointStruct, VectorParams
+
+    embeddings, chunks = make_corpus(n=200)
+    path = tempfile.mkdtemp()
+    write_artifact(path, embeddings, chunks, [f"h{i}" for i in range(200)], model="m")
+    retriever = Retriever.from_artifact(path)
+
+    client = QdrantClient(":memory:")
+    client.create_collection("virtual-lenny", vectors_config=VectorParams(size=32, distance=Distance.COSINE))
+    client.upsert("virtual-lenny", points=[
+        PointStruct(id=i, vector=embeddings[i].tolist(), payload=dict(chunk, content_hash=f"h{i}"))
+        for i, chunk in enumerate(chunks)
+    ])
+
+    query = embeddings[7] + 0.3
+    kwargs = dict(collection_name="virtual-lenny", query=query.tolist(), limit=3, with_payload=True, score_threshold=0.3)
+    local = retriever.query_points(timeout=10, **kwargs).points
+    remote = client.query_points(**kwargs).points
+
+    assert [p.payload for p in local] == [p.payload for p in remote]
+    assert np.allclose([p.score for p in local], [p.score for p in remote], atol=1e-4)
+    assert local[0].id == "c7"
+
+    # score_threshold cuts the list like Qdrant does
+    assert retriever.query_points(query=query, limit=3, score_threshold=1.01).points == []
+    assert retriever.get_collection("virtual-lenny").points_count == 200
+
+
+def test_rank_metrics_match_per_query_loop():
+    rng = np.random.default_rng(3)
+    indices = np.stack([rng.permutation(50)[:10] for _ in range(40)])
+    relevant = [[int(indices[q, q % 12])] if q % 12 < 10 else [49] for q in range(40)]
+    relevant[0] = [int(indices[0, 2]), int(indices[0, 7])]
+
+    metrics = rank_metrics(indices, relevant, ks=(5, 10))
+
+    mrr = hits = ndcg = recall = 0.0
+    for q, rel in enumerate(relevant):
+        retrieved = list(indices[q][:5])
+        ranks = [retrieved.index(r) + 1 for r in rel if r in retrieved]
+        hits += bool(ranks)
+        mrr += 1.0 / min(ranks) if ranks else 0.0
+        recall += len(ranks) / len(rel)
+        ideal = sum(1 / np.log2(i + 2) for i in range(min(len(rel), 5)))
+        ndcg += sum(1 / np.log2(r + 1) for r in ranks) / ideal
+    assert metrics["HitRate@5"] == round(hits / 40, 4)
+    assert metrics["MRR@5"] == round(mrr / 40, 4)
+    assert metrics["Recall@5"] == round(recall / 40, 4)
+    assert metrics["nDCG@5"] == round(ndcg / 40, 4)
+    assert metrics["HitRate@10"] >= metrics["HitRate@5"]
+
+
+def test_missing_hnswlib_falls_back_to_exact(monkeypatch):
+    # None in sys.modules makes `import hnswlib` raise ImportError
+    monkeypatch.setitem(sys.modules, "hnswlib", None)
+    embeddings, chunks = make_corpus(n=50)
+    path = tempfile.mkdtemp()
+    write_artifact(path, embeddings, chunks, [f"h{i}" for i in range(50)], model="m")
+
+    retriever = Retriever.from_artifact(path, use_ann=True)
+    assert retriever.ann is None
+    _, indices = retriever.search(embeddings[:3], k=1)
+    assert indices[:, 0].tolist() == [0, 1, 2]
+
+    with pytest.raises(ImportError, match="pip install hnswlib"):
+        retriever.build_ann_index()
+
+
+def test_hnsw_index_persisted_next_to_artifact():
+    pytest.importorskip("hnswlib")
+
+    embeddings, chunks = make_corpus(n=2000)
+    path = tempfile.mkdtemp()
+    write_artifact(path, embeddings, chunks, [f"h{i}" for i in range(2000)], model="m")
+
+    built = Retriever.from_artifact(path)
+    built.build_ann_index(ef_search=128)
+    assert built.save_ann_index(path) == os.path.join(path, ANN_INDEX_FILE)
+
+    retriever = Retriever.from_artifact(path, use_ann=True)
+    queries = embeddings[:50] + 0.05
+    _, ann_idx = retriever.search(queries, k=10)
+    _, exact_idx = retriever.search(queries, k=10, exact=True)
+
+    recall = np.mean([len(set(a) & set(e)) / 10 for a, e in zip(ann_idx, exact_idx)])
+    assert recall > 0.9
+    assert retriever.query_points(query=queries[0], limit=1).points[0].id == "c0"
+
+
+if __name__ == "__main__":
+    # pytest reports the ANN test as skipped when hnswlib is not installed
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,77 @@
+import io
+import os
+import sys
+import json
+import threading
+import time
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "lambdas", "common"))
+
+from s3_io import iter_json_objects, list_objects
+
+
+class FakePaginator:
+    def __init__(self, keys, page_size):
+        self.keys = keys
+        self.page_size = page_size
+
+    def paginate(self, Bucket, Prefix):
+        keys = [k for k in self.keys if k.startswith(Prefix)]
+        for start in range(0, len(keys), self.page_size):
+            yield {"Contents": [{"Key": k, "ETag": f'"{k}"'} for k in keys[start:start + self.page_size]]}
+
+
+class FakeS3:
+    """Just enough of the S3 client: paginated listing + slow get_object"""
+
+    def __init__(self, objects, page_size=1000, latency=0.0):
+        self.objects = objects
+        self.page_size = page_size
+        self.latency = latency
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def get_paginator(self, name):
+        assert name == "list_objects_v2"
+        return FakePaginator(sorted(self.objects), self.page_size)
+
+    def get_object(self, Bucket, Key):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.latency)
+        with self._lock:
+            self.in_flight -= 1
+        return {"Body": io.BytesIO(json.dumps(self.objects[Key]).encode())}
+
+
+def test_listing_follows_pages():
+    objects = {f"data/raw/linkedin/{i:05d}.json": {"i": i} for i in range(2500)}
+    objects["data/raw/linkedin/notes.txt"] = {}
+    s3 = FakeS3(objects, page_size=1000)
+
+    keys = [o["Key"] for o in list_objects(s3, "bucket", "data/raw/linkedin/", suffix=".json")]
+    assert len(keys) == 2500  # not capped at the first 1000
+
+
+def test_concurrent_fetch_is_bounded():
+    objects = {f"data/raw/youtube/{i}.json": {"i": i} for i in range(64)}
+    s3 = FakeS3(objects, latency=0.01)
+
+    start = time.perf_counter()
+    results = list(iter_json_objects(s3, "bucket", list_objects(s3, "bucket", "data/raw/"), max_workers=8))
+    elapsed = time.perf_counter() - start
+
+    assert sorted(data["i"] for _, data in results) == list(range(64))
+    assert all(objects[obj["Key"]] == data for obj, data in results)
+    assert s3.max_in_flight <= 8
+    print(f"Fetched 64 objects in {elapsed:.3f}s (sequential would be ~0.64s)")
+    assert elapsed < 0.64
+
+
+if __name__ == "__main__":
+    test_listing_follows_pages()
+    test_concurrent_fetch_is_bounded()
+    print("SUCCESS!")
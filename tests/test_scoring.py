@@ -0,0 +1,68 @@
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "agent", "message_handler"))
+
+from evaluator import RAGEvaluator
+from scoring import BackgroundScorer, LocalQueue, make_job, process_records, score_job
+
+RESPONSE = (
+    "Retention is the best growth lever for early teams. Talk to users every week. "
+    "Product market fit shows up in the retention curve flattening."
+)
+RESULTS = [
+    SimpleNamespace(score=0.71, payload={"content": "Retention is the best growth lever we found.", "source": "linkedin"}),
+    SimpleNamespace(score=0.64, payload={"content": "When the retention curve flattening happens, you have fit.", "source": "youtube"}),
+]
+
+
+def expected_score():
+    evaluator = RAGEvaluator()
+    retrieval_metrics = evaluator.calculate_retrieval_score(RESULTS)
+    return retrieval_metrics, evaluator.calculate_rag_score(
+        retrieval_metrics,
+        evaluator.calculate_groundedness_score(RESPONSE, [r.payload["content"] for r in RESULTS]),
+        evaluator.calculate_coherence_score(RESPONSE),
+        evaluator.calculate_source_attribution_score(RESPONSE, RESULTS)
+    )
+
+
+def test_background_scorer_waits_for_release():
+    retrieval_metrics, expected = expected_score()
+    job = make_job("conn", "example.com", "prod", RESPONSE, RESULTS, retrieval_metrics)
+    assert score_job(RAGEvaluator(), job) == expected
+
+    frames = []
+    scorer = BackgroundScorer(RAGEvaluator(), job, frames.append).start()
+    time.sleep(0.2)
+    # Score is ready, but the frame must not go out before done
+    assert scorer.result == expected and frames == []
+
+    frames.append("done")
+    assert scorer.join(timeout=5) == expected
+    assert frames == ["done", expected]
+
+
+def test_queue_worker_posts_evaluation_frames():
+    retrieval_metrics, expected = expected_score()
+    queue = LocalQueue()
+    queue.send(make_job("conn-1", "example.com", "prod", RESPONSE, RESULTS, retrieval_metrics, message_id="m-1"))
+    queue.send({"connection_id": "conn-2"})  # malformed job
+
+    posted = []
+    records = queue.records()
+    failed = process_records(records, RAGEvaluator(), lambda job, frame: posted.append((job["connection_id"], frame)))
+
+    # Tagged with the answer it scores, it can arrive after the next answer started
+    assert posted == [("conn-1", {"type": "evaluation", "message_id": "m-1", "score": expected})]
+    assert failed == [records[1]["messageId"]]
+    assert queue.records() == []
+
+
+if __name__ == "__main__":
+    test_background_scorer_waits_for_release()
+    test_queue_worker_posts_evaluation_frames()
+    print("SUCCESS!")
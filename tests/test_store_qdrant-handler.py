@@ -5,6 +5,10 @@ from dotenv import load_dotenv
 
 PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 sys.path.insert(0, PROJECT_ROOT)
+# Shared modules ship as a Lambda layer, make them importable locally
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "lambdas", "common"))
+# handler.py imports its sibling uploader.py as a top-level module (Lambda layout)
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "lambdas", "store_qdrant"))
 
 from lambdas.store_qdrant.handler import lambda_handler
 
@@ -48,7 +52,7 @@ def test_store_qdrant_cloud():
     
     test_event = {
         "input_bucket": os.getenv("DATA_BUCKET_NAME"),
-        "embeddings_key": "data/embedded/mxbai_corpus.npz",
+        "embeddings_key": "data/embedded/mxbai_corpus/",
         "collection_name": "virtual-lenny",
         "qdrant_url": os.getenv("QDRANT_URL"),
         "qdrant_api_key": os.getenv("QDRANT_API_KEY"),
@@ -137,7 +141,7 @@ def verify_s3_file_exists():
     import boto3
     
     bucket = os.getenv("DATA_BUCKET_NAME")
-    key = "data/embeddings/mxbai_corpus.npz"
+    key = "data/embedded/mxbai_corpus/header.json"
     
     if not bucket:
         print("  Cannot verify - DATA_BUCKET_NAME not set")
@@ -0,0 +1,121 @@
+import os
+import sys
+
+import numpy as np
+from qdrant_client import QdrantClient
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, PROJECT_ROOT)
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "lambdas", "common"))
+# handler.py imports its sibling uploader.py as a top-level module (Lambda layout)
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "lambdas", "store_qdrant"))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from embedding_artifact import save_artifact
+from manifest import content_hash
+from test_manifest import FakeS3
+import lambdas.store_qdrant.handler as store_qdrant
+
+EVENT = {
+    "input_bucket": "bucket",
+    "embeddings_key": "data/embedded/mxbai_corpus/",
+    "collection_name": "virtual-lenny",
+    "qdrant_url": "memory",
+    "qdrant_api_key": "test",
+    "mode": "sync"
+}
+
+
+def put_corpus(s3, chunks, embeddings):
+    hashes = [content_hash(c) for c in chunks]
+    save_artifact(s3, "bucket", EVENT["embeddings_key"], embeddings, chunks, hashes, model="test")
+
+
+def setup(monkeypatch):
+    s3 = FakeS3()
+    client = QdrantClient(":memory:")
+    monkeypatch.setattr(store_qdrant, "s3", s3)
+    monkeypatch.setattr(store_qdrant, "QdrantClient", lambda **kwargs: client)
+    return s3, client
+
+
+def payloads(client):
+    records, _ = client.scroll("virtual-lenny", limit=100, with_payload=True)
+    return {r.payload["chunk_id"]: r.payload["content"] for r in records}
+
+
+def test_full_build_then_sync(monkeypatch):
+    s3, client = setup(monkeypatch)
+    chunks = [{"chunk_id": f"c{i}", "content": f"text {i}"} for i in range(10)]
+    put_corpus(s3, chunks, np.random.rand(10, 4).astype(np.float32))
+
+    # First run: built into a versioned collection behind the alias
+    assert store_qdrant.lambda_handler(EVENT, None)["statusCode"] == 200
+    first = store_qdrant.resolve_collection(client, "virtual-lenny")
+    assert first.startswith("virtual-lenny_")
+    assert len(payloads(client)) == 10
+
+    # Edit one chunk, remove one, add one -> only those are touched
+    chunks[3] = {"chunk_id": "c3", "content": "edited"}
+    del chunks[7]
+    chunks.append({"chunk_id": "c_new", "content": "new"})
+    put_corpus(s3, chunks, np.random.rand(10, 4).astype(np.float32))
+
+    calls = []
+    original_upsert = client.upsert
+    monkeypatch.setattr(client, "upsert", lambda **kw: calls.append(len(kw["points"])) or original_upsert(**kw))
+
+    response = store_qdrant.lambda_handler(EVENT, None)
+    assert '"vectors_uploaded": 2' in response["body"] and '"vectors_deleted": 1' in response["body"]
+    assert sum(calls) == 2
+    assert payloads(client) == {c["chunk_id"]: c["content"] for c in chunks}
+    assert store_qdrant.resolve_collection(client, "virtual-lenny") == first
+
+
+def test_rebuild_swaps_alias(monkeypatch):
+    s3, client = setup(monkeypatch)
+    chunks = [{"chunk_id": f"c{i}", "content": f"text {i}"} for i in range(5)]
+    put_corpus(s3, chunks, np.random.rand(5, 4).astype(np.float32))
+    store_qdrant.lambda_handler(EVENT, None)
+    old = store_qdrant.resolve_collection(client, "virtual-lenny")
+
+    monkeypatch.setattr(store_qdrant.time, "time", lambda: 4102444800)
+    response = store_qdrant.lambda_handler(dict(EVENT, recreate_collection=True), None)
+    assert response["statusCode"] == 200
+
+    new = store_qdrant.resolve_collection(client, "virtual-lenny")
+    assert new == "virtual-lenny_4102444800" and new != old
+    # Old version dropped once the alias points at the new one
+    assert [c.name for c in client.get_collections().collections] == [new]
+    assert len(payloads(client)) == 5
+
+
+def test_failed_build_drops_unfinished_collection(monkeypatch):
+    s3, client = setup(monkeypatch)
+    monkeypatch.setenv("QDRANT_MAX_RETRIES", "0")
+    chunks = [{"chunk_id": f"c{i}", "content": f"text {i}"} for i in range(5)]
+    put_corpus(s3, chunks, np.random.rand(5, 4).astype(np.float32))
+    store_qdrant.lambda_handler(EVENT, None)
+    live = store_qdrant.resolve_collection(client, "virtual-lenny")
+
+    def unavailable(**kwargs):
+        raise ConnectionError("qdrant unavailable")
+
+    # Upload fails half-way, then (on the retry) the alias swap fails
+    now = iter([4102444800, 4102444801])
+    monkeypatch.setattr(store_qdrant.time, "time", lambda: next(now))
+    for method in ("upsert", "update_collection_aliases"):
+        with monkeypatch.context() as m:
+            m.setattr(client, method, unavailable)
+            response = store_qdrant.lambda_handler(dict(EVENT, recreate_collection=True), None)
+        assert response["statusCode"] == 500
+
+        # No timestamped leftovers, the live version is untouched
+        assert [c.name for c in client.get_collections().collections] == [live]
+        assert store_qdrant.resolve_collection(client, "virtual-lenny") == live
+        assert len(payloads(client)) == 5
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,121 @@
+import os
+import sys
+import threading
+import time
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "agent", "message_handler"))
+
+from streaming import FlushPolicy, FrameSender, ResponseBuilder, TokenCoalescer
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_coalescer_groups_tokens():
+    frames = []
+    policy = FlushPolicy(max_bytes=0, max_tokens=4, max_interval_ms=0)
+    coalescer = TokenCoalescer(frames.append, policy)
+
+    tokens = [f"t{i} " for i in range(10)]
+    for token in tokens:
+        coalescer.add(token)
+    coalescer.flush()
+
+    # First token alone, then groups of 4, then the remainder
+    assert [len(f["content"].split()) for f in frames] == [1, 4, 4, 1]
+    assert all(f["type"] == "chunk" for f in frames)
+    assert "".join(f["content"] for f in frames) == "".join(tokens)
+    assert coalescer.tokens_seen == 10
+    assert coalescer.frames_sent == 4
+
+
+def test_coalescer_flushes_on_bytes_and_time():
+    frames = []
+    clock = FakeClock()
+    policy = FlushPolicy(max_bytes=10, max_tokens=0, max_interval_ms=50, flush_first_token=False)
+    coalescer = TokenCoalescer(frames.append, policy, clock=clock)
+
+    coalescer.add("abc")
+    coalescer.add("defghijk")  # 11 bytes -> byte limit
+    assert [f["content"] for f in frames] == ["abcdefghijk"]
+
+    coalescer.add("x")
+    clock.now += 0.06  # 60 ms later -> time window
+    coalescer.add("y")
+    assert [f["content"] for f in frames] == ["abcdefghijk", "xy"]
+
+    coalescer.flush()
+    assert len(frames) == 2  # nothing buffered, nothing sent
+
+
+def test_sender_keeps_order_and_drains():
+    posted = []
+
+    def slow_send(payload):
+        time.sleep(0.001)
+        posted.append(payload["content"])
+
+    sender = FrameSender(slow_send, max_pending=4).start()
+    for i in range(50):
+        sender.put({"type": "chunk", "content": str(i)})
+    sender.close()
+
+    # close() returns only after every frame went out, in order
+    assert posted == [str(i) for i in range(50)]
+    assert sender.frames_sent == 50
+
+
+def test_sender_applies_backpressure():
+    release = threading.Event()
+    sender = FrameSender(lambda payload: release.wait(), max_pending=2).start()
+
+    sender.put({"n": 0})  # picked up by the (blocked) worker
+    time.sleep(0.05)
+    sender.put({"n": 1})
+    sender.put({"n": 2})  # queue now full
+
+    blocked = threading.Thread(target=sender.put, args=({"n": 3},))
+    blocked.start()
+    blocked.join(0.1)
+    assert blocked.is_alive()
+
+    release.set()
+    blocked.join(1)
+    assert not blocked.is_alive()
+    sender.close()
+    assert sender.frames_sent == 4
+
+
+def test_response_builder_feeds_coalescer_and_evaluation():
+    frames, fed = [], []
+    policy = FlushPolicy(max_bytes=0, max_tokens=100, max_interval_ms=0, flush_first_token=False)
+    evaluation = type("Evaluation", (), {"feed": lambda self, token: fed.append(token)})()
+    builder = ResponseBuilder(TokenCoalescer(frames.append, policy), evaluation=evaluation, flush_on_sentence=True)
+
+    tokens = ["Hello", " world", ".", ".", " How", " are", " you?", " Fine", ""]
+    for token in tokens:
+        builder.add(token)
+    builder.flush()
+
+    text = "".join(tokens)
+    assert builder.text() == text and len(builder) == len(text)
+    assert fed == [t for t in tokens if t] and builder.tokens_seen == 8
+    # "Hello world.." and " How are you?" end sentences, " Fine" is still open
+    assert builder.sentences == 2 and builder.last_sentence_end == text.index("?") + 1
+    assert [f["content"] for f in frames] == ["Hello world.", ". How are you?", " Fine"]
+    assert builder.frames_sent == 3
+
+
+if __name__ == "__main__":
+    test_coalescer_groups_tokens()
+    test_coalescer_flushes_on_bytes_and_time()
+    test_sender_keeps_order_and_drains()
+    test_sender_applies_backpressure()
+    test_response_builder_feeds_coalescer_and_evaluation()
+    print("SUCCESS!")